@@ -13,9 +13,20 @@ from .models import (
     StatusResponse,
     BalanceResponse,
     StatsResponse,
+    ConnectionsResponse,
+    LatencyResponse,
+    LoopResponse,
+    ShadowsResponse,
+    ShadowRequest,
 )
 from vh_float import (
     Trader as ByBitSpotTrader,
+    FrameRecorder,
+    LoopMonitor,
+    LOOP_MONITOR,
+    LOOP_SLOW_THRESHOLD,
+    SHADOWS,
+    WS_CAPTURE,
     API_KEY as BYBIT_API_KEY,
     SECRET_KEY as BYBIT_SECRET_KEY,
 )
@@ -26,6 +37,57 @@ router = APIRouter(prefix="/bybit", tags=["ByBit"])
 # ==================== Internal Functions ====================
 
 
+async def launch_bybit_trader(main_loop):
+    """Create ByBit trader, start its background tasks and main trading loop"""
+    # Create ByBit trader instance with data directory
+    data_dir = str(EXCHANGE_DATA_DIRS["bybit"])
+    trader_instance = ByBitSpotTrader(
+        loop=main_loop,
+        key=BYBIT_API_KEY,
+        secret=BYBIT_SECRET_KEY,
+        data_dir=data_dir,
+    )
+    if WS_CAPTURE:
+        trader_instance.recorder = FrameRecorder(WS_CAPTURE)
+    if SHADOWS:
+        trader_instance.shadows.load(SHADOWS)
+    if LOOP_MONITOR:
+        trader_instance.loop_monitor = LoopMonitor(slow_threshold=LOOP_SLOW_THRESHOLD / 1000.0)
+    traders["bybit"]["instance"] = trader_instance
+
+    # Initialize trader data
+    await trader_instance.init_data()
+
+    # Clear old tasks list
+    traders["bybit"]["tasks"] = []
+
+    # Start websocket connections and trading tasks - track all tasks
+    task1 = asyncio.create_task(trader_instance.tracked(trader_instance.ws_ticker()))
+    traders["bybit"]["tasks"].append(task1)
+    if trader_instance.loop_monitor is not None:
+        traders["bybit"]["tasks"].append(asyncio.create_task(trader_instance.loop_monitor.run()))
+
+    await asyncio.sleep(1.0)
+
+    background = [
+        trader_instance.ws_user_data(),
+        trader_instance.account_balance_loop(),
+        trader_instance.save_history_loop(),
+        trader_instance.metadata_refresh_loop(),
+        trader_instance.resample_clock_loop(),
+        trader_instance.alerts.run(),
+    ]
+    for coro in background:
+        traders["bybit"]["tasks"].append(asyncio.create_task(trader_instance.tracked(coro)))
+
+    # Start main trading loop
+    traders["bybit"]["task"] = asyncio.create_task(
+        trader_instance.tracked(trader_instance.trade_loop())
+    )
+
+    return trader_instance
+
+
 async def start_bybit_internal():
     """Internal function to start ByBit bot (used for auto-start)"""
     main_loop = get_main_loop()
@@ -43,39 +105,7 @@ async def start_bybit_internal():
         return False
 
     try:
-        # Create ByBit trader instance with data directory
-        data_dir = str(EXCHANGE_DATA_DIRS["bybit"])
-        trader_instance = ByBitSpotTrader(
-            loop=main_loop,
-            key=BYBIT_API_KEY,
-            secret=BYBIT_SECRET_KEY,
-            data_dir=data_dir,
-        )
-        traders["bybit"]["instance"] = trader_instance
-
-        # Initialize trader data
-        await trader_instance.init_data()
-
-        # Clear old tasks list
-        traders["bybit"]["tasks"] = []
-
-        # Start websocket connections and trading tasks - track all tasks
-        task1 = asyncio.create_task(trader_instance.ws_ticker())
-        traders["bybit"]["tasks"].append(task1)
-
-        await asyncio.sleep(1.0)
-
-        task2 = asyncio.create_task(trader_instance.ws_user_data())
-        traders["bybit"]["tasks"].append(task2)
-
-        task3 = asyncio.create_task(trader_instance.account_balance_loop())
-        traders["bybit"]["tasks"].append(task3)
-
-        task4 = asyncio.create_task(trader_instance.save_history_loop())
-        traders["bybit"]["tasks"].append(task4)
-
-        # Start main trading loop
-        traders["bybit"]["task"] = asyncio.create_task(trader_instance.trade_loop())
+        trader_instance = await launch_bybit_trader(main_loop)
 
         print(
             f"ByBit trading bot auto-started successfully (symbol: {trader_instance.symbol})"
@@ -130,39 +160,7 @@ async def start_bybit_trading(current_user: User = Depends(get_current_user)):
         raise HTTPException(status_code=500, detail="Event loop not initialized")
 
     try:
-        # Create ByBit trader instance with data directory
-        data_dir = str(EXCHANGE_DATA_DIRS["bybit"])
-        trader_instance = ByBitSpotTrader(
-            loop=main_loop,
-            key=BYBIT_API_KEY,
-            secret=BYBIT_SECRET_KEY,
-            data_dir=data_dir,
-        )
-        traders["bybit"]["instance"] = trader_instance
-
-        # Initialize trader data
-        await trader_instance.init_data()
-
-        # Clear old tasks list
-        traders["bybit"]["tasks"] = []
-
-        # Start websocket connections and trading tasks - track all tasks
-        task1 = asyncio.create_task(trader_instance.ws_ticker())
-        traders["bybit"]["tasks"].append(task1)
-
-        await asyncio.sleep(1.0)
-
-        task2 = asyncio.create_task(trader_instance.ws_user_data())
-        traders["bybit"]["tasks"].append(task2)
-
-        task3 = asyncio.create_task(trader_instance.account_balance_loop())
-        traders["bybit"]["tasks"].append(task3)
-
-        task4 = asyncio.create_task(trader_instance.save_history_loop())
-        traders["bybit"]["tasks"].append(task4)
-
-        # Start main trading loop
-        traders["bybit"]["task"] = asyncio.create_task(trader_instance.trade_loop())
+        await launch_bybit_trader(main_loop)
 
         # Update is_started flag and save config
         traders["bybit"]["is_started"] = True
@@ -235,6 +233,10 @@ async def stop_bybit_trading(current_user: User = Depends(get_current_user)):
         traders["bybit"]["tasks"] = []
         print("All ByBit background tasks stopped")
 
+    instance = traders["bybit"]["instance"]
+    if instance is not None and instance.recorder is not None:
+        instance.recorder.close()
+
     # Update is_started flag and save config
     traders["bybit"]["is_started"] = False
     save_api_config()
@@ -361,6 +363,9 @@ async def get_bybit_status(current_user: User = Depends(get_current_user)):
                             },
                         ],
                         "total_usd": 30469.12,
+                        "updated_at": 1760963696.123,
+                        "age": 0.42,
+                        "source": "stream",
                     }
                 }
             },
@@ -373,14 +378,16 @@ async def get_bybit_balance(current_user: User = Depends(get_current_user)):
     Get current ByBit account balance (requires authentication).
 
     Returns detailed balance information for all assets in the account,
-    including native balances and USD values.
+    including native balances and USD values. Balances come from the
+    wallet stream cache, `updated_at` and `age` tell how fresh they are.
     """
     trader_instance = traders["bybit"]["instance"]
 
     if not trader_instance:
         raise HTTPException(status_code=400, detail="ByBit trading bot not initialized")
 
-    await trader_instance.get_account_balance()
+    if trader_instance.balances.is_empty:
+        await trader_instance.get_account_balance()
 
     # Calculate USD values
     crypto_balance = trader_instance.ta.native_balance[0]
@@ -404,6 +411,9 @@ async def get_bybit_balance(current_user: User = Depends(get_current_user)):
             },
         ],
         "total_usd": crypto_usd + stable_balance,
+        "updated_at": trader_instance.balances.updated or None,
+        "age": trader_instance.balances.age,
+        "source": trader_instance.balances.source,
     }
 
 
@@ -491,3 +501,293 @@ async def get_bybit_stats(current_user: User = Depends(get_current_user)):
         "ma_trend": trader_instance.ta.ma_trend,
         "ma_fast": trader_instance.ta.ma_fast_m,
     }
+
+
+@router.get(
+    "/connections",
+    response_model=ConnectionsResponse,
+    responses={
+        200: {
+            "description": "WebSocket session health",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "exchange": "bybit",
+                        "connections": [
+                            {
+                                "stream": "ticker",
+                                "url": "wss://stream.bybit.com/v5/public/spot",
+                                "connected": True,
+                                "reconnects": 3,
+                                "stale_disconnects": 1,
+                                "downtime": 0.412,
+                                "last_downtime": 0.087,
+                                "last_message_age": 0.35,
+                            }
+                        ],
+                    }
+                }
+            },
+        },
+        400: {"description": "Bot not initialized"},
+    },
+)
+async def get_bybit_connections(current_user: User = Depends(get_current_user)):
+    """
+    Get ByBit WebSocket session health (requires authentication).
+
+    Returns reconnect counts, accumulated downtime in seconds and
+    the age of the last received frame for every stream connection.
+    """
+    trader_instance = traders["bybit"]["instance"]
+
+    if not trader_instance:
+        raise HTTPException(status_code=400, detail="ByBit trading bot not initialized")
+
+    return {
+        "exchange": "bybit",
+        "connections": trader_instance.connection_stats(),
+    }
+
+
+@router.get(
+    "/latency",
+    response_model=LatencyResponse,
+    responses={
+        200: {
+            "description": "Tick-to-order latency histograms",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "exchange": "bybit",
+                        "stages": {
+                            "monitor": {
+                                "count": 86400,
+                                "mean_ms": 0.041,
+                                "p50_ms": 0.032,
+                                "p90_ms": 0.064,
+                                "p99_ms": 0.128,
+                                "max_ms": 2.315,
+                            },
+                            "order_ack": {
+                                "count": 12,
+                                "mean_ms": 21.7,
+                                "p50_ms": 16.384,
+                                "p90_ms": 32.768,
+                                "p99_ms": 32.768,
+                                "max_ms": 30.112,
+                            },
+                        },
+                    }
+                }
+            },
+        },
+        400: {"description": "Bot not initialized"},
+    },
+)
+async def get_bybit_latency(current_user: User = Depends(get_current_user)):
+    """
+    Get ByBit tick-to-order latency per stage (requires authentication).
+
+    Stages: frame_to_handler, monitor, tick_to_decision, decision_to_send,
+    tick_to_order, order_ack and order_fill. Percentiles are upper bounds
+    of power-of-two microsecond buckets.
+    """
+    trader_instance = traders["bybit"]["instance"]
+
+    if not trader_instance:
+        raise HTTPException(status_code=400, detail="ByBit trading bot not initialized")
+
+    return {
+        "exchange": "bybit",
+        "stages": trader_instance.latency.snapshot(),
+    }
+
+
+@router.get(
+    "/loop",
+    response_model=LoopResponse,
+    responses={
+        200: {
+            "description": "Event loop lag, handler timing and slow callbacks",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "exchange": "bybit",
+                        "running": True,
+                        "interval_ms": 50.0,
+                        "threshold_ms": 100.0,
+                        "lag": {
+                            "count": 1728000,
+                            "mean_ms": 0.21,
+                            "p50_ms": 0.128,
+                            "p90_ms": 0.256,
+                            "p99_ms": 2.048,
+                            "max_ms": 143.2,
+                        },
+                        "handlers": {
+                            "ticker_handler": {
+                                "count": 86400,
+                                "mean_ms": 0.33,
+                                "p50_ms": 0.256,
+                                "p90_ms": 0.512,
+                                "p99_ms": 1.024,
+                                "max_ms": 9.8,
+                                "busy_s": 28.5,
+                            },
+                        },
+                        "stalls": 1,
+                        "slow": [
+                            {
+                                "time": 1767225600.5,
+                                "handler": "save_history_loop",
+                                "lag_ms": 143.2,
+                                "stack": [
+                                    "/app/vh_float.py:3290 save_history_loop",
+                                    "/app/vh_float.py:3284 save_history",
+                                ],
+                            }
+                        ],
+                    }
+                }
+            },
+        },
+        400: {"description": "Bot not initialized or loop monitor disabled"},
+    },
+)
+async def get_bybit_loop(current_user: User = Depends(get_current_user)):
+    """
+    Get ByBit event loop health (requires authentication).
+
+    Lag is how late a probe sleeping on the loop wakes up. Handlers are
+    ticker_handler, message_handler and the background loops, with the time
+    of each call or step. A loop blocked longer than LOOP_SLOW_THRESHOLD ms
+    is listed under slow with the handler and stack of the blocking code.
+    """
+    trader_instance = traders["bybit"]["instance"]
+
+    if not trader_instance:
+        raise HTTPException(status_code=400, detail="ByBit trading bot not initialized")
+
+    if trader_instance.loop_monitor is None:
+        raise HTTPException(status_code=400, detail="Loop monitor disabled (LOOP_MONITOR)")
+
+    return {"exchange": "bybit", **trader_instance.loop_monitor.snapshot()}
+
+
+@router.get(
+    "/shadows",
+    response_model=ShadowsResponse,
+    responses={
+        200: {
+            "description": "Paper-trading results of the shadow strategies",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "exchange": "bybit",
+                        "ticks": 86400,
+                        "mean_tick_us": 212.5,
+                        "shadows": [
+                            {
+                                "name": "wide-range",
+                                "config": {"ma_length": 24.0, "range": 70.0},
+                                "start_ts": 1767225600000,
+                                "start_price": 98765.43,
+                                "start_equity": 1000.0,
+                                "equity": 1012.34,
+                                "return_percent": 1.234,
+                                "buy_and_hold_percent": -0.85,
+                                "base_balance": 0.0041,
+                                "quote_balance": 607.1,
+                                "portfolio_ratio": 39.5,
+                                "traded_price": 97900.0,
+                                "buy_price_mean": 97900.0,
+                                "buys": 4,
+                                "sells": 3,
+                                "fees": 0.42,
+                                "last_fills": [],
+                            }
+                        ],
+                    }
+                }
+            },
+        },
+        400: {"description": "Bot not initialized"},
+    },
+)
+async def get_bybit_shadows(current_user: User = Depends(get_current_user)):
+    """
+    Get ByBit paper-trading shadows (requires authentication).
+
+    Every shadow runs the strategy with its own parameters and virtual
+    balance on the live ticks and indicators. Orders fill at the next
+    tick price minus the account taker fee. `mean_tick_us` is the time
+    all shadows together add to a tick.
+    """
+    trader_instance = traders["bybit"]["instance"]
+
+    if not trader_instance:
+        raise HTTPException(status_code=400, detail="ByBit trading bot not initialized")
+
+    return {"exchange": "bybit", **trader_instance.shadows.stats()}
+
+
+@router.post(
+    "/shadows",
+    response_model=ShadowsResponse,
+    responses={
+        200: {"description": "Shadow started, all shadows returned"},
+        400: {"description": "Bot not initialized, name taken or unknown parameter"},
+    },
+)
+async def add_bybit_shadow(
+    request: ShadowRequest, current_user: User = Depends(get_current_user)
+):
+    """
+    Start a ByBit paper-trading shadow (requires authentication).
+
+    `params` are StrategyConfig fields changed from the live config.
+    MA length, amplitude window and fee follow the live trader, changing
+    them is rejected with 400.
+    """
+    trader_instance = traders["bybit"]["instance"]
+
+    if not trader_instance:
+        raise HTTPException(status_code=400, detail="ByBit trading bot not initialized")
+
+    try:
+        trader_instance.shadows.add(
+            request.name,
+            quote_balance=request.quote_balance,
+            base_balance=request.base_balance,
+            **request.params,
+        )
+    except (TypeError, ValueError) as ex:
+        raise HTTPException(status_code=400, detail=str(ex))
+
+    return {"exchange": "bybit", **trader_instance.shadows.stats()}
+
+
+@router.delete(
+    "/shadows/{name}",
+    response_model=ShadowsResponse,
+    responses={
+        200: {"description": "Shadow removed, the remaining shadows returned"},
+        400: {"description": "Bot not initialized"},
+        404: {"description": "No shadow with this name"},
+    },
+)
+async def remove_bybit_shadow(name: str, current_user: User = Depends(get_current_user)):
+    """
+    Stop a ByBit paper-trading shadow (requires authentication).
+    """
+    trader_instance = traders["bybit"]["instance"]
+
+    if not trader_instance:
+        raise HTTPException(status_code=400, detail="ByBit trading bot not initialized")
+
+    if name not in trader_instance.shadows.shadows:
+        raise HTTPException(status_code=404, detail=f"Shadow {name} not found")
+    trader_instance.shadows.remove(name)
+
+    return {"exchange": "bybit", **trader_instance.shadows.stats()}
@@ -142,6 +142,9 @@ class BalanceResponse(BaseModel):
         ],
     )
     total_usd: float = Field(default=..., examples=[30469.12])
+    updated_at: Optional[float] = Field(default=None, examples=[1760963696.123])
+    age: Optional[float] = Field(default=None, examples=[0.42])
+    source: Optional[str] = Field(default=None, examples=["stream"])
 
 
 class TradeInfo(BaseModel):
@@ -186,3 +189,113 @@ class StatsResponse(BaseModel):
     )
     impuls: Optional[float] = Field(default=None, examples=[500.0])
     impuls_percent: Optional[float] = Field(default=None, examples=[0.5])
+
+
+class ConnectionInfo(BaseModel):
+    """WebSocket session health model"""
+
+    stream: str = Field(default=..., examples=["ticker"])
+    url: str = Field(default=..., examples=["wss://stream.bybit.com/v5/public/spot"])
+    connected: bool = Field(default=..., examples=[True])
+    reconnects: int = Field(default=..., examples=[3])
+    stale_disconnects: int = Field(default=..., examples=[1])
+    downtime: float = Field(default=..., examples=[0.412])
+    last_downtime: float = Field(default=..., examples=[0.087])
+    last_message_age: Optional[float] = Field(default=None, examples=[0.35])
+
+
+class ConnectionsResponse(BaseModel):
+    """Response model for connections endpoint"""
+
+    exchange: str = Field(default=..., examples=["bybit"])
+    connections: List[ConnectionInfo]
+
+
+class LatencyStage(BaseModel):
+    """Latency histogram summary for one pipeline stage"""
+
+    count: int = Field(default=..., examples=[86400])
+    mean_ms: float = Field(default=..., examples=[0.041])
+    p50_ms: float = Field(default=..., examples=[0.032])
+    p90_ms: float = Field(default=..., examples=[0.064])
+    p99_ms: float = Field(default=..., examples=[0.128])
+    max_ms: float = Field(default=..., examples=[2.315])
+
+
+class LatencyResponse(BaseModel):
+    """Response model for latency endpoint"""
+
+    exchange: str = Field(default=..., examples=["bybit"])
+    stages: Dict[str, LatencyStage]
+
+
+class HandlerTiming(LatencyStage):
+    """Duration summary of one handler or background loop step"""
+
+    busy_s: float = Field(default=..., examples=[28.5])
+
+
+class SlowCallback(BaseModel):
+    """Event loop stall above the slow threshold"""
+
+    time: float = Field(default=..., examples=[1767225600.5])
+    handler: Optional[str] = Field(default=None, examples=["save_history_loop"])
+    lag_ms: float = Field(default=..., examples=[143.2])
+    stack: List[str] = Field(default=..., examples=[["/app/vh_float.py:3284 save_history"]])
+
+
+class LoopResponse(BaseModel):
+    """Response model for event loop monitor endpoint"""
+
+    exchange: str = Field(default=..., examples=["bybit"])
+    running: bool = Field(default=..., examples=[True])
+    interval_ms: float = Field(default=..., examples=[50.0])
+    threshold_ms: float = Field(default=..., examples=[100.0])
+    lag: LatencyStage
+    handlers: Dict[str, HandlerTiming]
+    stalls: int = Field(default=..., examples=[1])
+    slow: List[SlowCallback]
+
+
+class ShadowInfo(BaseModel):
+    """Paper-trading results of one shadow strategy"""
+
+    name: str = Field(default=..., examples=["wide-range"])
+    config: Dict[str, Any] = Field(
+        default=..., examples=[{"ma_length": 24.0, "range": 70.0, "rebalance_top": 3.0}]
+    )
+    start_ts: int = Field(default=..., examples=[1767225600000])
+    start_price: float = Field(default=..., examples=[98765.43])
+    start_equity: float = Field(default=..., examples=[1000.0])
+    equity: float = Field(default=..., examples=[1012.34])
+    return_percent: float = Field(default=..., examples=[1.234])
+    buy_and_hold_percent: float = Field(default=..., examples=[-0.85])
+    base_balance: float = Field(default=..., examples=[0.0041])
+    quote_balance: float = Field(default=..., examples=[607.1])
+    portfolio_ratio: float = Field(default=..., examples=[39.5])
+    traded_price: float = Field(default=..., examples=[97900.0])
+    buy_price_mean: float = Field(default=..., examples=[97900.0])
+    buys: int = Field(default=..., examples=[4])
+    sells: int = Field(default=..., examples=[3])
+    fees: float = Field(default=..., examples=[0.42])
+    last_fills: List[Dict[str, Any]] = Field(default=...)
+
+
+class ShadowsResponse(BaseModel):
+    """Response model for shadows endpoint"""
+
+    exchange: str = Field(default=..., examples=["bybit"])
+    ticks: int = Field(default=..., examples=[86400])
+    mean_tick_us: float = Field(default=..., examples=[212.5])
+    shadows: List[ShadowInfo]
+
+
+class ShadowRequest(BaseModel):
+    """Request model to start a shadow strategy"""
+
+    name: str = Field(default=..., examples=["wide-range"])
+    quote_balance: float = Field(default=1000.0, examples=[1000.0])
+    base_balance: float = Field(default=0.0, examples=[0.0])
+    params: Dict[str, Any] = Field(
+        default_factory=dict, examples=[{"range": 70.0, "rebalance_top": 2.0}]
+    )
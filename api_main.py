@@ -195,6 +195,10 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
                                 "status": "/bybit/status - Get ByBit bot status (requires auth)",
                                 "balance": "/bybit/balance - Get ByBit account balance (requires auth)",
                                 "stats": "/bybit/stats - Get ByBit trading statistics (requires auth)",
+                                "connections": "/bybit/connections - Get ByBit WebSocket health (requires auth)",
+                                "latency": "/bybit/latency - Get ByBit tick-to-order latency (requires auth)",
+                                "shadows": "/bybit/shadows - List (GET) or start (POST) paper-trading shadows, DELETE /bybit/shadows/{name} stops one (requires auth)",
+                                "loop": "/bybit/loop - Get ByBit event loop lag and slow handlers (requires auth)",
                             },
                         },
                     }
@@ -243,6 +247,10 @@ async def root():
                 "status": "/bybit/status - Get ByBit bot status (requires auth)",
                 "balance": "/bybit/balance - Get ByBit account balance (requires auth)",
                 "stats": "/bybit/stats - Get ByBit trading statistics (requires auth)",
+                "connections": "/bybit/connections - Get ByBit WebSocket health (requires auth)",
+                "latency": "/bybit/latency - Get ByBit tick-to-order latency (requires auth)",
+                "shadows": "/bybit/shadows - List (GET) or start (POST) paper-trading shadows, DELETE /bybit/shadows/{name} stops one (requires auth)",
+                "loop": "/bybit/loop - Get ByBit event loop lag and slow handlers (requires auth)",
             },
             "binance": {
                 "info": "/binance/* - Binance endpoints (coming soon, requires auth)"
@@ -0,0 +1,357 @@
+"""
+Backtest engine for the volatility harvesting strategy.
+
+Replays one-second prices through the real TradeAnalyse: indicators from
+``monitor``, decisions from ``trade_signal`` and order sizing from
+``order_size``, exactly as ``Trader.trade_loop`` does live. Orders are filled
+at the next price with the configured fee. No asyncio, no sleeps.
+
+Usage:
+    python backtest.py data/bybit/data_s1.dat
+    python backtest.py prices.csv --quote 1000 --ledger fills.csv --equity equity.csv
+"""
+
+import argparse
+import array as arr
+import csv
+import json
+import math
+import os
+import sys
+import time
+from typing import Optional
+
+from vh_float import StrategyConfig, TradeAnalyse, STABLE_PAIR, paper_fill
+
+
+LEDGER_FIELDS = [
+    "ts",
+    "side",
+    "price",
+    "base_qty",
+    "quote_qty",
+    "fee",
+    "base_balance",
+    "quote_balance",
+    "equity",
+]
+
+
+def load_prices(path: str):
+    """Load (timestamps, prices) from a data_s1.dat history or a CSV file.
+
+    data_s1.dat has no timestamps, its samples are taken as one second apart.
+    CSV rows are ``timestamp_ms,price``, a header row is skipped.
+    """
+    if path.endswith(".csv"):
+        timestamps = arr.array("q")
+        prices = arr.array("d")
+        with open(path, "r", newline="") as f:
+            for row in csv.reader(f):
+                try:
+                    ts, price = int(float(row[0])), float(row[1])
+                except (ValueError, IndexError):
+                    continue
+                timestamps.append(ts)
+                prices.append(price)
+        return timestamps, prices
+
+    header = arr.array("L", [])
+    prices = arr.array("d", [])
+    with open(path, "rb") as f:
+        header.fromfile(f, 1)
+        prices.fromfile(f, header[0])
+    return arr.array("q", range(0, len(prices) * 1000, 1000)), prices
+
+
+class Backtest:
+    """One strategy run over a price series."""
+
+    def __init__(
+        self,
+        config: Optional[StrategyConfig] = None,
+        base: str = "BTC",
+        quote_balance: float = 1000.0,
+        base_balance: float = 0.0,
+        warmup_minutes: Optional[int] = None,
+        ath: Optional[float] = None,
+        min_order_qty: float = 0.000048,
+        min_order_amt: float = 1.0,
+        equity_every: int = 60,
+    ) -> None:
+        """Initialize backtest.
+
+        Args:
+            config: Strategy parameters, StrategyConfig.from_env() if None
+            base: Base coin, traded against STABLE_PAIR
+            quote_balance: Starting quote coin balance
+            base_balance: Starting base coin balance
+            warmup_minutes: Minute closes fed before trading starts,
+                the larger of MA length and amplitude window if None
+            ath: All time high for the working range, the warmup maximum if None
+            min_order_qty: Minimum sell size in base coin
+            min_order_amt: Minimum buy size in quote coin
+            equity_every: Ticks between equity curve samples
+        """
+        self.config = config if config is not None else StrategyConfig.from_env()
+        self.pair = [base, STABLE_PAIR]
+        self.start_balance = (base_balance, quote_balance)
+        if warmup_minutes is None:
+            warmup_minutes = int(max(self.config.ma_length, self.config.amplitude_time_frame))
+        self.warmup_minutes = warmup_minutes
+        self.ath = ath
+        self.min_order_qty = min_order_qty
+        self.min_order_amt = min_order_amt
+        self.equity_every = equity_every
+        self.fee = self.config.fee / 100.0
+
+        self.ta = None
+        self.pending = None
+        self.ledger = []
+        self.equity = []
+        self.elapsed = 0.0
+
+    def _new_analyse(self, market=None):
+        ta = TradeAnalyse(
+            self.pair, log_file=os.devnull, market=market, config=self.config, quiet=True
+        )
+        ta.market.track_impulse = False
+        return ta
+
+    def _set_balance(self, base: float, quote: float, price: float):
+        ta = self.ta
+        ta.native_balance = (base, quote)
+        ta.pair_balance[self.pair[0]] = base * price
+        ta.pair_balance[self.pair[1]] = quote
+
+    def _fill(self, action: str, qty: float, price: float, ts: int):
+        fill = paper_fill(self.ta, action, qty, price, self.fee)
+        self.ledger.append({"ts": ts, **fill})
+
+    def state(self) -> dict:
+        """Balances and strategy state at the end of the run, see ``run(state=...)``.
+
+        Same keys as the trader state file, plus the balances.
+        """
+        ta = self.ta
+        return {
+            "base_balance": ta.native_balance[0],
+            "quote_balance": ta.native_balance[1],
+            "traded_price": ta.traded_price,
+            "buy_price_mean": ta.buy_price_mean,
+            "portfolio_ratio": ta.portfolio_ratio,
+            "trend_crossover": ta.trend_crossover.cross,
+            "trend_crossunder": ta.trend_crossunder.cross,
+            "buy_counter": ta.order_scale._buy_counter,
+            "sell_counter": ta.order_scale._sell_counter,
+        }
+
+    def _load_state(self, state: dict):
+        ta = self.ta
+        ta.traded_price = state["traded_price"]
+        ta.buy_price_mean = state["buy_price_mean"]
+        ta.portfolio_ratio = state["portfolio_ratio"]
+        ta.trend_crossover.cross = state["trend_crossover"]
+        ta.trend_crossunder.cross = state["trend_crossunder"]
+        ta.order_scale._buy_counter = state["buy_counter"]
+        ta.order_scale._sell_counter = state["sell_counter"]
+
+    def run(self, timestamps, prices, start=0, end=None, market=None, state=None) -> dict:
+        """Replay the series, returns the summary statistics.
+
+        Args:
+            timestamps: Tick timestamps in ms
+            prices: Tick prices
+            start: First tick, the warmup starts here
+            end: Tick after the last one, the series end if None
+            market: MarketIndicators already warmed up to ``start``, replaces the warmup.
+                Must be built with the MA length and amplitude window of the config
+            state: ``state()`` of an earlier run to continue from, its balances
+                replace the starting balances
+        """
+        started = time.perf_counter()
+        end = len(prices) if end is None else end
+        warmup = self.begin(timestamps, prices, start, end, market, state)
+        tick = self.tick
+        for i in range(warmup, end):
+            tick(i, prices[i], timestamps[i])
+
+        self.elapsed = time.perf_counter() - started
+        return self.summary(prices[warmup], prices[end - 1], end - warmup)
+
+    def begin(
+        self, timestamps, prices, start=0, end=None, market=None, state=None, follow=None
+    ) -> int:
+        """Warm up and set the starting balances, returns the first trading tick.
+
+        ``follow`` is a MarketIndicators updated by another backtest on every
+        tick before this one, see ``run_group``. Other arguments as ``run``.
+        """
+        self.ta = ta = self._new_analyse(follow)
+        self.ledger = []
+        self.equity = []
+        self.pending = None
+        end = len(prices) if end is None else end
+        if state is not None:
+            self.start_balance = (state["base_balance"], state["quote_balance"])
+
+        if follow is not None:
+            warmup = start
+        elif market is not None:
+            ta.market = market
+            warmup = start
+        else:
+            # warmup on minute closes, like Trader.init_data does with kline.1
+            warmup = start + min(self.warmup_minutes * 60, max(end - start - 1, 0))
+            for i in range(start + 59, warmup, 60):
+                ta.monitor(prices[i], timestamps[i] // 60000, show=False)
+            ta.ATH = self.ath if self.ath is not None else max(prices[start : warmup + 1])
+            if not ta.prices:
+                ta.prices.append(prices[warmup])
+
+        price = prices[warmup]
+        self._set_balance(*self.start_balance, price)
+        if state is not None:
+            self._load_state(state)
+        else:
+            base, quote = self.start_balance
+            ta.portfolio_ratio = base * price / (base * price + quote)
+            ta.traded_price = price
+        return warmup
+
+    def tick(self, i: int, price: float, ts: int) -> None:
+        """Apply tick ``i`` of the series."""
+        ta = self.ta
+        if self.pending is not None:
+            # market order decided on the previous tick fills at this price
+            self._fill(self.pending[0], self.pending[1], price, ts)
+            self.pending = None
+
+        ta.pair_balance[self.pair[0]] = ta.native_balance[0] * price
+        ta.monitor(price, ts // 60000, show=True)
+
+        _crossed, action = ta.trade_signal()
+        if action is not None:
+            qty = ta.order_size(action, price, self.min_order_qty, self.min_order_amt)
+            if qty > 0.0:
+                self.pending = (action, qty)
+
+        if i % self.equity_every == 0:
+            self.equity.append((ts, ta.native_balance[0] * price + ta.native_balance[1]))
+
+    def summary(self, first_price: float, last_price: float, ticks: int) -> dict:
+        base, quote = self.start_balance
+        start_equity = base * first_price + quote
+        end_equity = self.ta.native_balance[0] * last_price + self.ta.native_balance[1]
+        hold_equity = base * last_price + quote
+
+        peak = -math.inf
+        max_drawdown = 0.0
+        returns = []
+        previous = None
+        for _, value in self.equity:
+            peak = max(peak, value)
+            max_drawdown = max(max_drawdown, (peak - value) / peak if peak > 0.0 else 0.0)
+            if previous:
+                returns.append(value / previous - 1.0)
+            previous = value
+
+        sharpe = None
+        if len(returns) > 1:
+            mean = sum(returns) / len(returns)
+            std = math.sqrt(sum((r - mean) ** 2 for r in returns) / (len(returns) - 1))
+            if std > 0.0:
+                # equity samples per year for one-second ticks
+                sharpe = mean / std * math.sqrt(365 * 86400 / self.equity_every)
+
+        return {
+            "ticks": ticks,
+            "start_equity": round(start_equity, 4),
+            "end_equity": round(end_equity, 4),
+            "return_percent": round((end_equity / start_equity - 1.0) * 100.0, 4),
+            "buy_and_hold_percent": round((hold_equity / start_equity - 1.0) * 100.0, 4),
+            "max_drawdown_percent": round(max_drawdown * 100.0, 4),
+            "sharpe": round(sharpe, 4) if sharpe is not None else None,
+            "trades": len(self.ledger),
+            "buys": sum(1 for fill in self.ledger if fill["side"] == "buy"),
+            "sells": sum(1 for fill in self.ledger if fill["side"] == "sell"),
+            "fees": round(sum(fill["fee"] for fill in self.ledger), 4),
+            "elapsed": round(self.elapsed, 3),
+            "ticks_per_second": round(ticks / self.elapsed) if self.elapsed > 0.0 else None,
+        }
+
+
+def run_group(backtests: list, timestamps, prices, start=0, end=None) -> list:
+    """Run backtests of configs with the same MA length and amplitude window together.
+
+    The first backtest warms up and updates the MarketIndicators, the others
+    follow them like the accounts sharing a symbol, so the indicators are
+    computed once for the group. Returns the summary of every backtest.
+    """
+    started = time.perf_counter()
+    end = len(prices) if end is None else end
+    owner = backtests[0]
+    warmup = owner.begin(timestamps, prices, start, end)
+    for bt in backtests[1:]:
+        bt.begin(timestamps, prices, warmup, end, follow=owner.ta.market)
+
+    ticks = [bt.tick for bt in backtests]
+    for i in range(warmup, end):
+        price = prices[i]
+        ts = timestamps[i]
+        for tick in ticks:
+            tick(i, price, ts)
+
+    elapsed = time.perf_counter() - started
+    results = []
+    for bt in backtests:
+        bt.elapsed = elapsed / len(backtests)
+        results.append(bt.summary(prices[warmup], prices[end - 1], end - warmup))
+    return results
+
+
+def write_csv(path: str, rows: list, fieldnames: list):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(fieldnames)
+        for row in rows:
+            writer.writerow(row if isinstance(row, (list, tuple)) else [row[k] for k in fieldnames])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backtest the volatility harvesting strategy")
+    parser.add_argument("prices", help="data_s1.dat history or timestamp_ms,price CSV")
+    parser.add_argument("--base", default="BTC", help="base coin")
+    parser.add_argument("--quote", type=float, default=1000.0, help="starting quote balance")
+    parser.add_argument("--base-balance", type=float, default=0.0, help="starting base balance")
+    parser.add_argument("--warmup", type=int, default=None, help="warmup minutes")
+    parser.add_argument("--ath", type=float, default=None, help="all time high")
+    parser.add_argument("--ledger", help="write the fill ledger to this CSV file")
+    parser.add_argument("--equity", help="write the equity curve to this CSV file")
+    args = parser.parse_args(argv)
+
+    timestamps, prices = load_prices(args.prices)
+    if not prices:
+        print(f"ERROR: no prices in {args.prices}")
+        return 1
+
+    bt = Backtest(
+        base=args.base,
+        quote_balance=args.quote,
+        base_balance=args.base_balance,
+        warmup_minutes=args.warmup,
+        ath=args.ath,
+    )
+    result = bt.run(timestamps, prices)
+
+    if args.ledger:
+        write_csv(args.ledger, bt.ledger, LEDGER_FIELDS)
+    if args.equity:
+        write_csv(args.equity, bt.equity, ["ts", "equity"])
+
+    print(json.dumps(result, indent=4))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,611 @@
+"""
+Local Bybit v5 stand-in for end-to-end tests and offline benchmarks.
+
+An in-process aiohttp server emulating the spot endpoints the bot uses:
+REST kline, instruments-info, wallet-balance, fee-rate, order create and
+create-batch, the public ``kline.1`` / ``publicTrade`` stream and the private
+``wallet`` / ``order`` stream, plus Telegram sendMessage for alerts. Market
+orders fill at the current price of the scripted path, the fill and the new
+balances are pushed on the private stream. Latency and error codes (e.g.
+170131 insufficient balance) can be injected.
+
+Point a trader at it with ``standin.attach(trader)`` before ``init_data``.
+
+Usage:
+    python bybit_standin.py --ticks 5000 --step-ms 60000 --quiet
+    python bybit_standin.py --prices data/bybit/data_s1.dat --latency 20 --stream-latency 5
+"""
+
+import argparse
+import asyncio
+import collections
+import hashlib
+import hmac
+import json
+import math
+import random
+import sys
+import tempfile
+import time
+from typing import Optional
+
+from aiohttp import WSMsgType, web
+
+from backtest import load_prices
+from vh_float import Trader
+
+LOT_SIZE_FILTER = {
+    "basePrecision": "0.000001",
+    "quotePrecision": "0.00000001",
+    "minOrderQty": "0.000048",
+    "maxOrderQty": "71.73956243",
+    "minOrderAmt": "1",
+    "maxOrderAmt": "2000000",
+}
+
+
+class BybitStandIn:
+    """Scriptable Bybit v5 spot exchange for one symbol."""
+
+    def __init__(
+        self,
+        symbol: str = "BTCUSDT",
+        base: str = "BTC",
+        quote: str = "USDT",
+        balances: Optional[dict] = None,
+        price: float = 100000.0,
+        history: Optional[list] = None,
+        fee: float = 0.001,
+        latency: float = 0.0,
+        stream_latency: float = 0.0,
+        step_ms: int = 1000,
+        start_ms: Optional[int] = None,
+        lot_size_filter: Optional[dict] = None,
+        secret: Optional[str] = None,
+    ) -> None:
+        """Initialize stand-in.
+
+        Args:
+            symbol: Traded symbol
+            base: Base coin of the symbol
+            quote: Quote coin of the symbol
+            balances: Starting {coin: amount}, 1000 quote coin if None
+            price: Price until the first tick
+            history: Closes returned by the kline endpoint, oldest first
+            fee: Taker fee rate, charged on the received coin
+            latency: Seconds added to every REST response
+            stream_latency: Seconds added before every stream frame
+            step_ms: Exchange clock advance per tick without a timestamp
+            start_ms: Exchange clock at start, the current time if None
+            lot_size_filter: instruments-info lotSizeFilter
+            secret: Checks private stream auth signatures if set
+        """
+        self.symbol = symbol
+        self.base = base
+        self.quote = quote
+        self.balances = dict(balances) if balances is not None else {base: 0.0, quote: 1000.0}
+        self.price = price
+        self.history = list(history) if history is not None else [price] * 200
+        self.fee = fee
+        self.latency = latency
+        self.stream_latency = stream_latency
+        self.step_ms = step_ms
+        self.now_ms = start_ms if start_ms is not None else int(time.time() * 1000)
+        self.lot_size_filter = lot_size_filter or dict(LOT_SIZE_FILTER)
+        self.secret = secret
+
+        self.orders = {}
+        self.requests = collections.Counter()
+        self.frames = 0
+        self.errors = collections.defaultdict(collections.deque)
+        self.rejects = collections.deque()
+        self.public = {}
+        self.private = set()
+        self.subscribed = asyncio.Event()
+        self.private_subscribed = asyncio.Event()
+        self._bar = None
+        self._seq = 0
+        self._creation_time = 0
+        self._tasks = set()
+        self._runner = None
+        self._host = "127.0.0.1"
+        self._port = 0
+
+    # lifecycle
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0):
+        app = web.Application()
+        app.router.add_get("/v5/public/spot", self._public_ws)
+        app.router.add_get("/v5/private", self._private_ws)
+        # the client joins "https://host/" with "/v5/...", the path may start with "//"
+        app.router.add_route("*", "/{path:.*}", self._rest)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        self._host = host
+        self._port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self):
+        for ws in list(self.public) + list(self.private):
+            await ws.close()
+        for task in list(self._tasks):
+            task.cancel()
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    @property
+    def rest_url(self) -> str:
+        return f"http://{self._host}:{self._port}/"
+
+    @property
+    def public_url(self) -> str:
+        return f"ws://{self._host}:{self._port}/v5/public/spot"
+
+    @property
+    def private_url(self) -> str:
+        return f"ws://{self._host}:{self._port}/v5/private"
+
+    def attach(self, session) -> None:
+        """Point a Trader, MultiSymbolTrader or MultiAccountTrader at the stand-in."""
+        session.rest_url = self.rest_url
+        session.public_stream_url = self.public_url
+        session.private_stream_url = self.private_url
+
+    # scripting
+
+    def fail(self, path: str, ret_code: int, ret_msg: str = "", count: int = 1, status=200):
+        """Answer the next ``count`` requests to a path like "v5/order/create" with an error."""
+        for _ in range(count):
+            self.errors[path.strip("/")].append((status, ret_code, ret_msg or "injected error"))
+
+    def reject_orders(self, ret_code: int, ret_msg: str = "", count: int = 1):
+        """Reject the next ``count`` orders, single or in a batch, with ``ret_code``."""
+        for _ in range(count):
+            self.rejects.append((ret_code, ret_msg or "injected reject"))
+
+    async def disconnect(self):
+        """Drop every stream connection, like an exchange side restart."""
+        self.subscribed.clear()
+        self.private_subscribed.clear()
+        for ws in list(self.public) + list(self.private):
+            await ws.close()
+
+    def trim(self, keep: int = 1000):
+        """Forget all but the last ``keep`` bars and orders, keeps long runs flat."""
+        del self.history[:-keep]
+        for link_id in list(self.orders)[:-keep]:
+            del self.orders[link_id]
+
+    async def tick(self, price: float, ts_ms: Optional[int] = None):
+        """Trade at ``price`` and publish it to the public subscribers."""
+        self.now_ms = ts_ms if ts_ms is not None else self.now_ms + self.step_ms
+        self.price = price
+        start = self.now_ms // 60000 * 60000
+        if self._bar is None or self._bar["start"] != start:
+            self._bar = {"start": start, "open": price, "high": price, "low": price}
+            self.history.append(price)
+        else:
+            self._bar["high"] = max(self._bar["high"], price)
+            self._bar["low"] = min(self._bar["low"], price)
+            self.history[-1] = price
+
+        if self.stream_latency:
+            await asyncio.sleep(self.stream_latency)
+        frames = {}
+        for ws, topics in list(self.public.items()):
+            for topic in topics:
+                if topic not in frames:
+                    frames[topic] = self._public_frame(topic)
+                if frames[topic] is None:
+                    continue
+                try:
+                    await ws.send_str(frames[topic])
+                    self.frames += 1
+                except ConnectionError:
+                    self.public.pop(ws, None)
+
+    async def play(self, prices, interval: float = 0.0):
+        """Tick through a price path once a public subscriber is connected."""
+        await self.subscribed.wait()
+        for price in prices:
+            await self.tick(price)
+            # yield even without an interval, the clients share the loop
+            await asyncio.sleep(interval)
+
+    # public stream
+
+    def _public_frame(self, topic: str):
+        if topic == f"kline.1.{self.symbol}":
+            bar = self._bar
+            data = {
+                "start": bar["start"],
+                "end": bar["start"] + 59999,
+                "interval": "1",
+                "open": str(bar["open"]),
+                "close": str(self.price),
+                "high": str(bar["high"]),
+                "low": str(bar["low"]),
+                "volume": "0",
+                "turnover": "0",
+                "confirm": False,
+                "timestamp": self.now_ms,
+            }
+        elif topic == f"publicTrade.{self.symbol}":
+            self._seq += 1
+            data = {
+                "T": self.now_ms,
+                "s": self.symbol,
+                "S": "Buy",
+                "v": "0.001",
+                "p": str(self.price),
+                "L": "PlusTick",
+                "i": str(self._seq),
+                "BT": False,
+            }
+        else:
+            return None
+        return json.dumps({"topic": topic, "ts": self.now_ms, "type": "snapshot", "data": [data]})
+
+    async def _public_ws(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.public[ws] = set()
+        try:
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    continue
+                data = json.loads(msg.data)
+                if data.get("op") == "subscribe":
+                    self.public[ws].update(data.get("args", []))
+                    await ws.send_json(
+                        {"success": True, "ret_msg": "", "conn_id": "standin", "op": "subscribe"}
+                    )
+                    self.subscribed.set()
+                elif data.get("op") == "ping":
+                    await ws.send_json(
+                        {"success": True, "ret_msg": "pong", "conn_id": "standin", "op": "ping"}
+                    )
+        finally:
+            self.public.pop(ws, None)
+        return ws
+
+    # private stream
+
+    async def _private_ws(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        try:
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    continue
+                data = json.loads(msg.data)
+                match data.get("op"):
+                    case "auth":
+                        ok = self._check_auth(data.get("args", []))
+                        await ws.send_json(
+                            {"success": ok, "ret_msg": "" if ok else "Invalid sign", "op": "auth"}
+                        )
+                    case "subscribe":
+                        self.private.add(ws)
+                        await ws.send_json({"success": True, "ret_msg": "", "op": "subscribe"})
+                        self.private_subscribed.set()
+                    case "ping":
+                        await ws.send_json({"op": "pong", "args": [str(self.now_ms)]})
+        finally:
+            self.private.discard(ws)
+        return ws
+
+    def _check_auth(self, args: list) -> bool:
+        if self.secret is None:
+            return True
+        if len(args) != 3:
+            return False
+        _, expires, signature = args
+        expected = hmac.new(
+            self.secret.encode("utf-8"), f"GET/realtime{expires}".encode(), hashlib.sha256
+        ).hexdigest()
+        return hmac.compare_digest(expected, str(signature))
+
+    def _wallet_frame(self) -> str:
+        # creationTime must grow, BalanceCache drops older snapshots
+        self._creation_time = max(self._creation_time + 1, int(time.time() * 1000))
+        return json.dumps(
+            {
+                "topic": "wallet",
+                "creationTime": self._creation_time,
+                "data": [{"accountType": "UNIFIED", "coin": self._coins()}],
+            }
+        )
+
+    async def _push_fill(self, order: dict):
+        if self.stream_latency:
+            await asyncio.sleep(self.stream_latency)
+        frames = [
+            json.dumps(
+                {"topic": "order", "creationTime": int(time.time() * 1000), "data": [order]}
+            ),
+            self._wallet_frame(),
+        ]
+        for ws in list(self.private):
+            try:
+                for frame in frames:
+                    await ws.send_str(frame)
+                    self.frames += 1
+            except ConnectionError:
+                self.private.discard(ws)
+
+    # REST
+
+    def _coins(self) -> list:
+        return [
+            {"coin": coin, "equity": str(amount), "walletBalance": str(amount), "locked": "0"}
+            for coin, amount in self.balances.items()
+        ]
+
+    def _response(self, result: dict, ret_code: int = 0, ret_msg: str = "OK", ext=None):
+        return {
+            "retCode": ret_code,
+            "retMsg": ret_msg,
+            "result": result,
+            "retExtInfo": ext or {},
+            "time": int(time.time() * 1000),
+        }
+
+    async def _rest(self, request):
+        path = request.path.strip("/")
+        self.requests[path] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if self.errors[path]:
+            status, ret_code, ret_msg = self.errors[path].popleft()
+            return web.json_response(self._response({}, ret_code, ret_msg), status=status)
+
+        if path.endswith("/sendMessage"):
+            # Telegram Bot API, for the alerts of a trader pointed at the stand-in
+            body = await request.json()
+            return web.json_response({"ok": True, "result": {"text": body.get("text", "")}})
+
+        query = request.query
+        match path:
+            case "v5/market/kline":
+                return web.json_response(self._klines(query))
+            case "v5/market/instruments-info":
+                item = {"symbol": self.symbol, "lotSizeFilter": self.lot_size_filter}
+                return web.json_response(self._response({"category": "spot", "list": [item]}))
+            case "v5/account/wallet-balance":
+                account = {"accountType": "UNIFIED", "coin": self._coins()}
+                return web.json_response(self._response({"list": [account]}))
+            case "v5/account/fee-rate":
+                rate = {
+                    "symbol": self.symbol,
+                    "takerFeeRate": str(self.fee),
+                    "makerFeeRate": str(self.fee),
+                }
+                return web.json_response(self._response({"list": [rate]}))
+            case "v5/order/create":
+                ret_code, ret_msg, result = self._execute(await request.json())
+                return web.json_response(self._response(result, ret_code, ret_msg))
+            case "v5/order/create-batch":
+                body = await request.json()
+                placed, codes = [], []
+                for item in body.get("request", []):
+                    ret_code, ret_msg, result = self._execute(item)
+                    placed.append(result)
+                    codes.append({"code": ret_code, "msg": ret_msg})
+                return web.json_response(
+                    self._response({"list": placed}, ext={"list": codes})
+                )
+        return web.json_response(self._response({}, 10001, f"unknown path {path}"), status=404)
+
+    def _klines(self, query) -> dict:
+        interval_ms = int(query.get("interval", "1")) * 60000
+        limit = int(query.get("limit", 200))
+        closes = self.history[-limit:]
+        start = self.now_ms // interval_ms * interval_ms
+        rows = []
+        for i, close in enumerate(reversed(closes)):
+            value = str(close)
+            rows.append([str(start - i * interval_ms), value, value, value, value, "0", "0"])
+        return self._response({"category": "spot", "symbol": self.symbol, "list": rows})
+
+    def _execute(self, item: dict):
+        """Fill one market order at the current price, returns (retCode, retMsg, result)."""
+        link_id = item.get("orderLinkId", "")
+        if link_id and link_id in self.orders:
+            return 170141, "Duplicate clientOrderId", {}
+        if self.rejects:
+            ret_code, ret_msg = self.rejects.popleft()
+            return ret_code, ret_msg, {}
+
+        side = item.get("side")
+        qty = float(item.get("qty") or 0.0)
+        price = self.price
+        if side == "Buy":
+            if qty < float(self.lot_size_filter["minOrderAmt"]):
+                return 170140, "Order value exceeded lower limit.", {}
+            if qty > self.balances.get(self.quote, 0.0):
+                return 170131, "Insufficient balance.", {}
+            received = qty / price
+            fee = received * self.fee
+            self.balances[self.quote] -= qty
+            self.balances[self.base] = self.balances.get(self.base, 0.0) + received - fee
+            exec_qty, exec_value = received, qty
+        elif side == "Sell":
+            if qty < float(self.lot_size_filter["minOrderQty"]):
+                return 170136, "Order quantity exceeded lower limit.", {}
+            if qty > self.balances.get(self.base, 0.0):
+                return 170131, "Insufficient balance.", {}
+            received = qty * price
+            fee = received * self.fee
+            self.balances[self.base] -= qty
+            self.balances[self.quote] = self.balances.get(self.quote, 0.0) + received - fee
+            exec_qty, exec_value = qty, received
+        else:
+            return 10001, f"invalid side {side}", {}
+
+        self._seq += 1
+        order_id = f"standin-{self._seq}"
+        order = {
+            "category": "spot",
+            "symbol": self.symbol,
+            "orderId": order_id,
+            "orderLinkId": link_id,
+            "side": side,
+            "orderType": "Market",
+            "price": "0",
+            "qty": item.get("qty"),
+            "avgPrice": str(price),
+            "cumExecQty": str(exec_qty),
+            "cumExecValue": str(exec_value),
+            "cumExecFee": str(fee),
+            "orderStatus": "Filled",
+            "updatedTime": str(self.now_ms),
+        }
+        self.orders[link_id or order_id] = order
+
+        task = asyncio.get_running_loop().create_task(self._push_fill(order))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return 0, "OK", {"orderId": order_id, "orderLinkId": link_id}
+
+
+def swing_prices(ticks: int, price: float = 100000.0, amplitude: float = 0.1, seed: int = 0):
+    """Reproducible path swinging by ``amplitude`` around ``price`` with short wiggles."""
+    rnd = random.Random(seed)
+    prices = []
+    for i in range(ticks):
+        swing = amplitude * math.sin(i / ticks * 2 * math.pi * 4) + 0.005 * math.sin(i / 15)
+        prices.append(round(price * (1.0 + swing) + rnd.gauss(0.0, price * 0.0005), 2))
+    return prices
+
+
+async def benchmark(
+    prices: list,
+    step_ms: int = 1000,
+    interval: float = 0.0,
+    latency: float = 0.0,
+    stream_latency: float = 0.0,
+    quote_balance: float = 1000.0,
+    base_balance: float = 0.0,
+    warmup: float = 10.0,
+    quiet: bool = False,
+    data_dir: Optional[str] = None,
+) -> dict:
+    """Run a Trader against the stand-in over a price path.
+
+    Args:
+        warmup: Seconds between the first tick and the path, Trader.trade_loop
+            waits this long before it starts trading
+    """
+    loop = asyncio.get_running_loop()
+    with tempfile.TemporaryDirectory() as tmp:
+        standin = BybitStandIn(
+            balances={"BTC": base_balance, "USDT": quote_balance},
+            price=prices[0],
+            history=[prices[0]] * 1000,
+            latency=latency,
+            stream_latency=stream_latency,
+            step_ms=step_ms,
+        )
+        async with standin:
+            trader = Trader(loop, "standin", "standin", data_dir=data_dir or tmp)
+            trader.ta.quiet = quiet
+            standin.attach(trader)
+            await trader.init_data()
+
+            tasks = [
+                loop.create_task(coro)
+                for coro in (
+                    trader.ws_ticker(),
+                    trader.ws_user_data(),
+                    trader.account_balance_loop(),
+                    trader.trade_loop(),
+                )
+            ]
+            try:
+                await standin.private_subscribed.wait()
+                await standin.play(prices[:1])
+                await asyncio.sleep(warmup)
+
+                started = time.perf_counter()
+                await standin.play(prices[1:], interval)
+                # the last frame is handled once the trader has seen its price
+                while trader.last_price != prices[-1] or trader.orders.tasks:
+                    await asyncio.sleep(0.001)
+                elapsed = time.perf_counter() - started
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                await trader.client.session.close()
+
+    ticks = len(prices) - 1
+    fills = [order for order in standin.orders.values() if order["orderStatus"] == "Filled"]
+    return {
+        "ticks": ticks,
+        "elapsed": round(elapsed, 3),
+        "ticks_per_second": round(ticks / elapsed) if elapsed > 0.0 else None,
+        "frames": standin.frames,
+        "fills": len(fills),
+        "requests": dict(standin.requests),
+        "balances": standin.balances,
+        "latency": trader.latency.snapshot(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the trader against a local stand-in")
+    parser.add_argument("--prices", help="data_s1.dat history or timestamp_ms,price CSV")
+    parser.add_argument("--ticks", type=int, default=2000, help="synthetic path length")
+    parser.add_argument("--step-ms", type=int, default=1000, help="exchange ms per tick")
+    parser.add_argument("--interval", type=float, default=0.0, help="seconds between ticks")
+    parser.add_argument("--latency", type=float, default=0.0, help="REST latency in ms")
+    parser.add_argument("--stream-latency", type=float, default=0.0, help="stream latency in ms")
+    parser.add_argument("--quote", type=float, default=1000.0, help="starting quote balance")
+    parser.add_argument("--base-balance", type=float, default=0.0, help="starting base balance")
+    parser.add_argument("--warmup", type=float, default=10.0, help="seconds before the path")
+    parser.add_argument("--quiet", action="store_true", help="no per tick trader output")
+    parser.add_argument("--out", help="write the report JSON to this file")
+    args = parser.parse_args(argv)
+
+    if args.prices:
+        prices = list(load_prices(args.prices)[1])
+    else:
+        prices = swing_prices(args.ticks)
+    if len(prices) < 2:
+        print("ERROR: the price path needs at least two prices")
+        return 1
+
+    report = asyncio.run(
+        benchmark(
+            prices,
+            step_ms=args.step_ms,
+            interval=args.interval,
+            latency=args.latency / 1000.0,
+            stream_latency=args.stream_latency / 1000.0,
+            quote_balance=args.quote,
+            base_balance=args.base_balance,
+            warmup=args.warmup,
+            quiet=args.quiet,
+        )
+    )
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=4)
+    print(json.dumps(report, indent=4))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,436 @@
+"""
+Monte Carlo stress test of the rebalancing logic on synthetic price paths.
+
+Generates thousands of price paths (geometric Brownian motion, jump
+diffusion or a block bootstrap of recorded returns) as one NumPy array and
+runs the strategy on all of them at once: every step updates the
+indicators, ``change_portfolio_ratio``, ``calculate_profit``, the order
+scale and ``trade_signal`` for all paths as array operations, following
+TradeAnalyse the way backtest.py drives it on bars. Orders fill at the next
+step. Returns and drawdowns are reported as distributions over the paths.
+
+One step is one bar, a minute by default. A path of one minute bars gives
+the same trades as backtest.py on those closes. Shorter steps evaluate the
+rebalancing every step while the indicators update on the first step of
+every minute, as MarketIndicators does on live ticks; steps longer than a
+minute are rejected, the MA and amplitude windows count minutes.
+
+Usage:
+    python monte_carlo.py --model gbm --paths 5000 --days 30 --sigma 0.8
+    python monte_carlo.py --model jump --jump-rate 12 --jump-mean -0.08 --jump-std 0.04
+    python monte_carlo.py --model bootstrap --history data/bybit/data_s1.dat --block 60
+"""
+
+import argparse
+import json
+import math
+import sys
+from typing import Optional
+
+import numpy as np
+
+from backtest import load_prices
+from vh_float import DynamicOrderScale, StrategyConfig
+
+YEAR_SECONDS = 365 * 86400
+
+
+def gbm_paths(
+    s0: float, mu: float, sigma: float, steps: int, paths: int, step: float = 60.0, rng=None
+) -> np.ndarray:
+    """Geometric Brownian motion, ``mu`` and ``sigma`` annualized, shape (paths, steps)."""
+    rng = rng if rng is not None else np.random.default_rng()
+    dt = step / YEAR_SECONDS
+    log_returns = (mu - 0.5 * sigma**2) * dt + sigma * math.sqrt(dt) * rng.standard_normal(
+        (paths, steps - 1)
+    )
+    return _from_log_returns(s0, log_returns)
+
+
+def jump_paths(
+    s0: float,
+    mu: float,
+    sigma: float,
+    jump_rate: float,
+    jump_mean: float,
+    jump_std: float,
+    steps: int,
+    paths: int,
+    step: float = 60.0,
+    rng=None,
+) -> np.ndarray:
+    """Merton jump diffusion: GBM plus ``jump_rate`` jumps a year of normal log size."""
+    rng = rng if rng is not None else np.random.default_rng()
+    dt = step / YEAR_SECONDS
+    shape = (paths, steps - 1)
+    log_returns = (mu - 0.5 * sigma**2) * dt + sigma * math.sqrt(dt) * rng.standard_normal(shape)
+    jumps = rng.poisson(jump_rate * dt, shape)
+    log_returns += jumps * jump_mean + np.sqrt(jumps) * jump_std * rng.standard_normal(shape)
+    return _from_log_returns(s0, log_returns)
+
+
+def bar_closes(timestamps, prices, step: float = 60.0) -> np.ndarray:
+    """Last price of every ``step`` seconds bar of a recorded series."""
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    prices = np.asarray(prices, dtype=np.float64)
+    if not len(prices):
+        return prices
+    bars = timestamps // int(step * 1000)
+    last = np.append(np.flatnonzero(np.diff(bars)), len(bars) - 1)
+    return prices[last]
+
+
+def bootstrap_paths(
+    closes, steps: int, paths: int, block: int = 60, s0: Optional[float] = None, rng=None
+) -> np.ndarray:
+    """Paths of randomly drawn blocks of recorded log returns.
+
+    Blocks keep the volatility clustering of the recording.
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    closes = np.asarray(closes, dtype=np.float64)
+    returns = np.diff(np.log(closes))
+    block = min(block, len(returns))
+    if block < 1:
+        raise ValueError("not enough recorded prices to bootstrap")
+    blocks = -(-(steps - 1) // block)
+    starts = rng.integers(0, len(returns) - block + 1, (paths, blocks))
+    log_returns = returns[starts[..., None] + np.arange(block)].reshape(paths, blocks * block)
+    return _from_log_returns(s0 if s0 is not None else closes[-1], log_returns[:, : steps - 1])
+
+
+def _from_log_returns(s0: float, log_returns: np.ndarray) -> np.ndarray:
+    paths = np.empty((log_returns.shape[0], log_returns.shape[1] + 1))
+    paths[:, 0] = 0.0
+    np.cumsum(log_returns, axis=1, out=paths[:, 1:])
+    return s0 * np.exp(paths)
+
+
+def rolling_range(paths: np.ndarray, window: int) -> np.ndarray:
+    """High minus low of the last ``window`` steps, fewer at the start, for every step.
+
+    van Herk/Gil-Werman: block prefix and suffix extremes, three passes
+    whatever the window length.
+    """
+    count, steps = paths.shape
+    padded = np.concatenate([np.repeat(paths[:, :1], window - 1, axis=1), paths], axis=1)
+    blocks = -(-padded.shape[1] // window)
+    tail = blocks * window - padded.shape[1]
+    padded = np.concatenate([padded, np.repeat(padded[:, -1:], tail, axis=1)], axis=1)
+    padded = padded.reshape(count, blocks, window)
+
+    extremes = []
+    for fn in (np.maximum, np.minimum):
+        prefix = fn.accumulate(padded, axis=2).reshape(count, -1)
+        suffix = fn.accumulate(padded[:, :, ::-1], axis=2)[:, :, ::-1].reshape(count, -1)
+        extremes.append(fn(suffix[:, :steps], prefix[:, window - 1 : window - 1 + steps]))
+    return extremes[0] - extremes[1]
+
+
+def simulate(
+    paths,
+    config: Optional[StrategyConfig] = None,
+    quote_balance: float = 1000.0,
+    base_balance: float = 0.0,
+    ath: Optional[float] = None,
+    warmup: int = 0,
+    min_order_qty: float = 0.000048,
+    min_order_amt: float = 1.0,
+    step: float = 60.0,
+) -> dict:
+    """Run the strategy on every path, returns per path result arrays.
+
+    Args:
+        paths: Prices, shape (paths, steps), one bar per step
+        config: Strategy parameters, StrategyConfig.from_env() if None
+        quote_balance: Starting quote coin balance
+        base_balance: Starting base coin balance
+        ath: All time high for the working range, the warmup maximum of each path if None
+        warmup: Steps that only update the indicators before trading starts
+        min_order_qty: Minimum sell size in base coin
+        min_order_amt: Minimum buy size in quote coin
+        step: Seconds per step, at most a minute
+    """
+    config = config if config is not None else StrategyConfig.from_env()
+    paths = np.asarray(paths, dtype=np.float64)
+    count, steps = paths.shape
+    if warmup >= steps:
+        raise ValueError(f"warmup of {warmup} steps leaves no steps to trade of {steps}")
+    if step > 60.0:
+        raise ValueError(f"steps of {step} s skip the one minute indicator updates")
+
+    fee = config.fee / 100.0
+    length = int(config.ma_length)
+    gap = config.ma_length / 4.8
+    alpha = 2 / (length + 1)
+    min_ratio, max_ratio = config.min_ratio, config.max_ratio
+    fibonacci = np.array(DynamicOrderScale.FIBONACCI_SEQUENCE, dtype=np.float64)
+    top_counter = len(fibonacci)
+
+    # MarketIndicators, updated on the first step of every minute
+    minutes = np.floor(np.arange(steps) * step / 60.0)
+    new_minute = np.diff(minutes, prepend=-1.0) != 0.0
+    sma_window = np.zeros((count, length))
+    sma_sum = np.zeros(count)
+    local_ranges = np.trunc(rolling_range(paths[:, new_minute], config.amplitude_time_frame))
+    ma_trend = np.zeros(count)
+    ma_fast = np.zeros(count)
+    minute = -1
+
+    for t in range(steps):
+        price = paths[:, t]
+
+        if new_minute[t]:
+            minute += 1
+            slot = minute % length
+            sma_sum += price - sma_window[:, slot]
+            sma_window[:, slot] = price
+            ma_trend_prev = ma_trend
+            ma_trend = np.round(sma_sum / min(minute + 1, length), 2) - gap
+            ma_fast = np.round(
+                (price - ma_fast) * alpha + np.where(ma_fast == 0.0, price, ma_fast), 2
+            )
+            local_range = local_ranges[:, minute]
+
+        if t < warmup:
+            continue
+
+        if t == warmup:
+            # strategy state, as Backtest sets it up after the warmup
+            ath_price = (
+                np.full(count, float(ath)) if ath is not None
+                else paths[:, : warmup + 1].max(axis=1)
+            )
+            base = np.full(count, float(base_balance))
+            quote = np.full(count, float(quote_balance))
+            start_equity = base * price + quote
+            ratio = base * price / start_equity
+            traded_price = price.copy()
+            buy_counter = np.ones(count, dtype=np.int64)
+            sell_counter = np.ones(count, dtype=np.int64)
+            min_buy = np.full(count, config.rebalance_bottom)
+            min_sell = np.full(count, config.rebalance_top)
+            rebalance_bottom = min_buy.copy()
+            rebalance_top = min_sell.copy()
+            cross_over = np.zeros(count, dtype=bool)
+            cross_under = np.zeros(count, dtype=bool)
+            pending = np.zeros(count, dtype=np.int8)
+            pending_qty = np.zeros(count)
+            trades = np.zeros(count, dtype=np.int64)
+            fees = np.zeros(count)
+            peak = start_equity.copy()
+            max_drawdown = np.zeros(count)
+        else:
+            # orders decided on the previous step fill at this price
+            buys = pending == 1
+            sells = pending == -1
+            if buys.any() or sells.any():
+                qty = np.where(buys, np.minimum(pending_qty, quote), 0.0)
+                received = qty / price
+                buy_fee = received * fee
+                base = base + received - buy_fee
+                quote = quote - qty
+
+                sold = np.where(sells, np.minimum(pending_qty, base), 0.0)
+                sell_fee = sold * price * fee
+                base = base - sold
+                quote = quote + sold * price - sell_fee
+
+                filled = buys | sells
+                traded_price = np.where(filled, price, traded_price)
+                trades += filled
+                fees += buy_fee * price + sell_fee
+                buy_counter = np.where(
+                    buys, np.minimum(buy_counter + 1, top_counter),
+                    np.where(sells, np.maximum(buy_counter - 1, 1), buy_counter),
+                )
+                sell_counter = np.where(
+                    sells, np.minimum(sell_counter + 1, top_counter),
+                    np.where(buys, np.maximum(sell_counter - 1, 1), sell_counter),
+                )
+
+        # change_portfolio_ratio
+        ath_price = np.maximum(ath_price, price)
+        working_range = ath_price / 100.0 * config.range
+        previous = paths[:, t - 1] if t > 0 else price
+        ratio = np.clip(ratio + (previous - price) / working_range, min_ratio, max_ratio)
+
+        # calculate_profit
+        base_value = base * price
+        total = base_value + quote
+        trade_profit = base_value - total * ratio
+        percent_diff = trade_profit / total * 100.0
+        price_diff = price - traded_price
+
+        # print_setup, the order scale
+        profitable_range = (1000.0 * fee * 2.0) / (1000.0 / price * (price + 1.0) - 1000.0)
+        min_profitable_percent = profitable_range / (working_range / 100.0)
+        min_sell = np.where(rebalance_top < min_profitable_percent, rebalance_top, min_sell)
+        min_buy = np.where(rebalance_bottom < min_profitable_percent, rebalance_bottom, min_buy)
+        if config.rebalance_isdynamic:
+            rebalance_top = min_sell * fibonacci[sell_counter - 1]
+            rebalance_bottom = min_buy * fibonacci[buy_counter - 1]
+        else:
+            rebalance_top = min_sell
+            rebalance_bottom = min_buy
+
+        # trade_signal
+        valid = (ma_trend != 0.0) & (ma_fast != 0.0)
+        above = ma_fast > ma_trend
+        below = ma_fast < ma_trend
+        crossed_over = valid & above & ~cross_over
+        crossed_under = valid & below & ~cross_under
+        cross_over = np.where(valid, above, cross_over)
+        cross_under = np.where(valid, below, cross_under)
+
+        trend = ma_trend - ma_trend_prev
+        moved = np.abs(price_diff) > local_range
+        buy = (
+            crossed_over & (trend >= 1.0) & (np.abs(percent_diff) >= rebalance_bottom)
+            & (trade_profit < 0.0) & moved
+        )
+        sell = (
+            crossed_under & (trend <= -1.0) & (np.abs(percent_diff) >= rebalance_top)
+            & (trade_profit > 0.0) & moved
+        )
+
+        # order_size
+        buy_qty = np.minimum(np.abs(trade_profit), quote)
+        buy &= (np.abs(trade_profit) >= min_order_amt) & (quote >= min_order_amt)
+        sell_qty = trade_profit / price
+        sell &= sell_qty >= min_order_qty
+        pending = np.where(buy, 1, np.where(sell, -1, 0)).astype(np.int8)
+        pending_qty = np.where(buy, buy_qty, np.where(sell, sell_qty, 0.0))
+
+        equity = base * price + quote
+        peak = np.maximum(peak, equity)
+        max_drawdown = np.maximum(max_drawdown, (peak - equity) / peak)
+
+    last = paths[:, -1]
+    end_equity = base * last + quote
+    hold_equity = base_balance * last + quote_balance
+    return {
+        "start_equity": start_equity,
+        "end_equity": end_equity,
+        "return_percent": (end_equity / start_equity - 1.0) * 100.0,
+        "buy_and_hold_percent": (hold_equity / start_equity - 1.0) * 100.0,
+        "max_drawdown_percent": max_drawdown * 100.0,
+        "trades": trades,
+        "fees": fees,
+    }
+
+
+def distribution(values) -> dict:
+    values = np.asarray(values, dtype=np.float64)
+    p5, p25, p50, p75, p95 = np.percentile(values, [5, 25, 50, 75, 95])
+    return {
+        "mean": round(float(values.mean()), 4),
+        "p5": round(float(p5), 4),
+        "p25": round(float(p25), 4),
+        "median": round(float(p50), 4),
+        "p75": round(float(p75), 4),
+        "p95": round(float(p95), 4),
+    }
+
+
+def summarize(result: dict) -> dict:
+    """Distributions of the per path results."""
+    returns = result["return_percent"]
+    return {
+        "paths": len(returns),
+        "return_percent": distribution(returns),
+        "buy_and_hold_percent": distribution(result["buy_and_hold_percent"]),
+        "max_drawdown_percent": distribution(result["max_drawdown_percent"]),
+        "trades": distribution(result["trades"]),
+        "fees": distribution(result["fees"]),
+        "loss_probability": round(float((returns < 0.0).mean()), 4),
+        "beats_hold_probability": round(
+            float((returns > result["buy_and_hold_percent"]).mean()), 4
+        ),
+    }
+
+
+def run(generate, paths: int, chunk: int = 1000, **options) -> dict:
+    """Simulate ``generate(count)`` paths in chunks, returns the joined results.
+
+    Chunks bound the memory of the path array.
+    """
+    parts = []
+    for first in range(0, paths, chunk):
+        parts.append(simulate(generate(min(chunk, paths - first)), **options))
+    return {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Monte Carlo stress test of the strategy")
+    parser.add_argument("--model", choices=["gbm", "jump", "bootstrap"], default="gbm")
+    parser.add_argument("--paths", type=int, default=1000, help="number of paths")
+    parser.add_argument("--days", type=float, default=7.0, help="path length")
+    parser.add_argument("--step", type=float, default=60.0, help="seconds per step")
+    parser.add_argument("--price", type=float, default=None, help="starting price")
+    parser.add_argument("--mu", type=float, default=0.0, help="annual drift")
+    parser.add_argument("--sigma", type=float, default=0.6, help="annual volatility")
+    parser.add_argument("--jump-rate", type=float, default=6.0, help="jumps per year")
+    parser.add_argument("--jump-mean", type=float, default=-0.05, help="mean log jump size")
+    parser.add_argument("--jump-std", type=float, default=0.05, help="log jump size deviation")
+    parser.add_argument("--history", help="data_s1.dat or CSV to bootstrap returns from")
+    parser.add_argument("--block", type=int, default=60, help="bootstrap block length in steps")
+    parser.add_argument("--seed", type=int, default=None, help="random seed")
+    parser.add_argument("--chunk", type=int, default=1000, help="paths simulated at once")
+    parser.add_argument("--warmup", type=int, default=None, help="indicator warmup in steps")
+    parser.add_argument("--quote", type=float, default=1000.0, help="starting quote balance")
+    parser.add_argument("--base-balance", type=float, default=0.0, help="starting base balance")
+    parser.add_argument("--ath", type=float, default=None, help="all time high")
+    parser.add_argument("--out", help="write the summary JSON to this file")
+    args = parser.parse_args(argv)
+
+    if args.step > 60.0:
+        parser.error("--step is at most 60 s, the indicators update once a minute")
+
+    config = StrategyConfig.from_env()
+    rng = np.random.default_rng(args.seed)
+    warmup = args.warmup
+    if warmup is None:
+        warmup = int(max(config.ma_length, config.amplitude_time_frame) * 60 / args.step)
+    steps = warmup + int(args.days * 86400 / args.step) + 1
+
+    if args.model == "bootstrap":
+        if not args.history:
+            parser.error("--model bootstrap needs --history")
+        closes = bar_closes(*load_prices(args.history), step=args.step)
+        if len(closes) < 2:
+            print(f"ERROR: not enough prices in {args.history}")
+            return 1
+
+        def generate(count):
+            return bootstrap_paths(closes, steps, count, args.block, args.price, rng)
+
+    elif args.model == "jump":
+
+        def generate(count):
+            return jump_paths(
+                args.price or 100000.0, args.mu, args.sigma, args.jump_rate, args.jump_mean,
+                args.jump_std, steps, count, args.step, rng,
+            )
+
+    else:
+
+        def generate(count):
+            return gbm_paths(args.price or 100000.0, args.mu, args.sigma, steps, count,
+                             args.step, rng)
+
+    result = run(
+        generate, args.paths, args.chunk, config=config, quote_balance=args.quote,
+        base_balance=args.base_balance, ath=args.ath, warmup=warmup, step=args.step,
+    )
+    summary = summarize(result)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(summary, f, indent=4)
+    print(json.dumps(summary, indent=4))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,407 @@
+"""
+Replay of a WebSocket frame capture through the trader.
+
+A capture (WS_CAPTURE, vh_float.FrameRecorder) holds every raw frame of the
+public ticker and the private wallet / order stream with its monotonic
+receive time, and the state trade_loop starts trading from (indicators,
+strategy state, balances, instrument filter). The replay restores that
+state in a fresh Trader, feeds the frames to ``ticker_handler`` and
+``message_handler`` and evaluates the strategy after every tick like
+trade_loop does, with the original frame spacing (optionally sped up) or as
+fast as possible. Orders go to a ReplayClient that acknowledges them
+without trading; fills and balances come from the private frames of the
+capture, the state follows production. The decisions are diffed against
+the decisions.jsonl written by the recording process.
+
+Captures of several pairs (TRADE_COINS) or accounts (ACCOUNTS) keep the
+private stream and start state of each under "<SYMBOL>/" or "<account>/"
+channels. The pair of ``--base`` and the account of ``--account`` are
+replayed, the channels of the others are skipped.
+
+Usage:
+    python replay.py data/bybit/capture.vhcap --production data/bybit/decisions.jsonl --quiet
+    python replay.py capture.vhcap --realtime --speed 10 --out replay.json
+    python replay.py capture.vhcap --from-start --data-dir data/bybit --balance USDT=1000
+    python replay.py capture.vhcap --base ETH --account sub --quiet
+"""
+
+import argparse
+import asyncio
+import collections
+import json
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+
+from backtest import load_prices
+from bybit_standin import LOT_SIZE_FILTER
+from vh_float import (
+    FrameDeduplicator,
+    InstrumentQuantizer,
+    LatencyHistogram,
+    Trader,
+    read_capture,
+)
+
+
+class ReplayClient:
+    """REST stand-in for replays, acknowledges orders without placing them."""
+
+    def __init__(self, lot_size_filter: Optional[dict] = None, fee: Optional[dict] = None) -> None:
+        self.lot_size_filter = lot_size_filter or LOT_SIZE_FILTER
+        self.fee = fee or {"takerFeeRate": "0.001", "makerFeeRate": "0.001"}
+        self.instruments = {}
+        self.orders = []
+
+    def register_instrument(self, symbol: str, lot_size_filter: dict):
+        quantizer = InstrumentQuantizer.from_lot_size_filter(symbol, lot_size_filter)
+        self.instruments[symbol] = quantizer
+        return quantizer
+
+    def quantizer(self, symbol: str):
+        if symbol not in self.instruments:
+            self.instruments[symbol] = InstrumentQuantizer(symbol)
+        return self.instruments[symbol]
+
+    async def instrument_info(self, symbol: str):
+        return {"retCode": 0, "result": {"list": [{"lotSizeFilter": self.lot_size_filter}]}}
+
+    async def fee_rate(self, symbol: str):
+        return {"retCode": 0, "result": {"list": [self.fee]}}
+
+    async def account(self):
+        # balances come from the wallet frames of the capture
+        return None
+
+    async def market_order(self, symbol: str, side: str, quantity_size: float, order_link_id=""):
+        self.orders.append(
+            {"symbol": symbol, "side": side, "qty": quantity_size, "link_id": order_link_id}
+        )
+        return {"retCode": 0, "retMsg": "OK", "result": {"orderId": order_link_id}}, 200
+
+    async def batch_orders(self, items: list) -> list:
+        results = []
+        for symbol, side, qty, link_id in items:
+            await self.market_order(symbol, side, qty, link_id)
+            results.append((200, 0, "OK", link_id))
+        return results
+
+
+async def prepare(
+    trader: Trader, history=(), ath: Optional[float] = None, balances: Optional[dict] = None
+):
+    """Warm a trader up like init_data does, for captures replayed from their start.
+
+    Args:
+        trader: Trader with a ReplayClient
+        history: 1m closes monitored before the capture, oldest first
+        ath: All time high, the maximum of history if None
+        balances: {coin: equity} before the first wallet frame of the capture
+    """
+    trader.orders.client = trader.client
+    # the production instrument filter and fee rate, also when the cache is stale
+    lot_size_filter = trader.metadata.get("instrument", trader.symbol, allow_stale=True)
+    if lot_size_filter is not None:
+        trader.client.lot_size_filter = lot_size_filter
+    fee = trader.metadata.get("fee", trader.symbol, allow_stale=True)
+    if fee is not None:
+        trader.client.fee = fee
+
+    for price in history:
+        trader.ta.monitor(price, 1.0, show=False)
+    if trader.ta.prices:
+        trader.last_price = trader.ta.prices[-1]
+    trader.ta.ATH = ath if ath is not None else max(history, default=trader.ta.ATH)
+
+    await trader.Get_instrument_info(trader.last_price, refresh=True)
+    await trader.Get_fee_rate(refresh=True)
+    if balances:
+        trader.balances.apply_rest(
+            [{"coin": coin, "equity": str(equity)} for coin, equity in balances.items()]
+        )
+
+
+async def restore(trader: Trader, state: dict):
+    """Continue from the state Trader.capture_state recorded before the first decision."""
+    trader.orders.client = trader.client
+    if state.get("instrument"):
+        trader.client.lot_size_filter = state["instrument"]
+    if state.get("fee"):
+        trader.client.fee = state["fee"]
+    trader.last_price = state["last_price"]
+    await trader.Get_instrument_info(trader.last_price, refresh=True)
+    await trader.Get_fee_rate(refresh=True)
+
+    market = trader.ta.market
+    for name, value in state["market"].items():
+        current = getattr(market, name, None)
+        if isinstance(current, collections.deque):
+            value = collections.deque(value, maxlen=current.maxlen)
+        setattr(market, name, value)
+
+    trader.apply_states(state["states"])
+    if state.get("quote_balance") is not None:
+        # a pair of a MultiSymbolTrader, its own share of the quote coin
+        trader.quote_ledger = True
+        trader.quote_balance = state["quote_balance"]
+    if state["balances"]:
+        trader.balances.apply_rest(state["balances"])
+        trader.get_pair_balance(state["balances"])
+
+
+def _start_trading(trader: Trader) -> None:
+    """The start of trade_loop: balances, then the saved or new states."""
+    if not trader.balances.is_empty:
+        trader.get_pair_balance(trader.balances.as_list())
+    trader.load_states()
+
+
+async def replay(
+    frames,
+    trader: Trader,
+    realtime: bool = False,
+    speed: float = 1.0,
+    from_start: bool = False,
+    account: Optional[str] = None,
+) -> dict:
+    """Feed captured frames to a trader and evaluate the strategy after each tick.
+
+    Args:
+        frames: (channel, recv_ns, text) tuples, e.g. read_capture()
+        trader: Trader with a ReplayClient
+        realtime: Keep the recorded spacing of the frames, divided by speed
+        speed: Time scale of the realtime mode
+        from_start: Trade from the first tick of a trader made ready by prepare()
+            instead of from the recorded start state
+        account: Account of a multi-account capture, its "<account>/" channels are replayed
+
+    Returns:
+        Report with frame counts, throughput, handler latencies and decisions
+    """
+    # fills arrive in the captured order frames under production ids, not ours to wait for
+    trader.orders.ack_timeout = 0.0
+    # redundant ticker connections were recorded apart, merged like FrameDeduplicator does live
+    merged = FrameDeduplicator(trader.ticker_handler, 1).handler(0)
+    timing = {name: LatencyHistogram() for name in ("ticker", "user_data", "decide")}
+    counts = collections.Counter()
+    first_ts = last_ts = None
+    first_ns = start_ns = None
+    trading = False
+    owners = {trader.symbol, account}
+    started = time.perf_counter()
+
+    for channel, recv_ns, text in frames:
+        owner, _, channel = channel.rpartition("/")
+        if owner and owner not in owners:
+            # another pair or account of the capture
+            continue
+        if realtime:
+            if first_ns is None:
+                first_ns, start_ns = recv_ns, time.monotonic_ns()
+            delay = (start_ns + (recv_ns - first_ns) / speed - time.monotonic_ns()) / 1e9
+            await asyncio.sleep(max(delay, 0.0))
+        else:
+            # order tasks run in between, like they do between live frames
+            await asyncio.sleep(0)
+        counts["frames"] += 1
+
+        if channel == "state":
+            if not from_start:
+                await restore(trader, json.loads(text))
+                trading = True
+            continue
+
+        # WSClient drops pongs and consumes the op acknowledgements
+        if not text or "ping" in text:
+            continue
+        msg = json.loads(text)
+        if "topic" not in msg:
+            continue
+
+        if channel.startswith("ticker"):
+            stream = "ticker"
+            handler = merged if "." in channel else trader.ticker_handler
+        else:
+            stream = "user_data"
+            handler = trader.message_handler
+        counts[stream] += 1
+
+        trader.latency.frame_ns = time.monotonic_ns()
+        handler(msg)
+        timing[stream].record(time.monotonic_ns() - trader.latency.frame_ns)
+
+        if stream != "ticker" or not trader.indicators_updated.is_set():
+            continue
+        trader.indicators_updated.clear()
+        if not trading:
+            if not from_start:
+                continue
+            _start_trading(trader)
+            trading = True
+        if first_ts is None:
+            first_ts = trader.tick_ts
+        last_ts = trader.tick_ts
+
+        decide_ns = time.monotonic_ns()
+        await trader.decide()
+        timing["decide"].record(time.monotonic_ns() - decide_ns)
+
+    await asyncio.gather(*trader.orders.tasks)
+    elapsed = time.perf_counter() - started
+    return {
+        "frames": counts["frames"],
+        "ticker_frames": counts["ticker"],
+        "private_frames": counts["user_data"],
+        "elapsed": round(elapsed, 3),
+        "frames_per_second": round(counts["frames"] / elapsed) if elapsed > 0.0 else None,
+        "first_ts": first_ts,
+        "last_ts": last_ts,
+        "handlers": {name: h.snapshot() for name, h in timing.items()},
+        "latency": trader.latency.snapshot(),
+        "decisions": list(trader.decisions),
+        "orders": len(trader.client.orders),
+    }
+
+
+def load_decisions(path) -> list:
+    with open(path, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def diff_decisions(replayed: list, production: list, first_ts=None, last_ts=None) -> dict:
+    """Compare decisions tick by tick, production limited to the replayed span.
+
+    Returns:
+        Counts and the differing decisions: changed (other action or result on
+        the same tick), missing (production only) and extra (replay only)
+    """
+    if first_ts is not None:
+        production = [d for d in production if first_ts <= d["ts"] <= last_ts]
+
+    expected = {d["ts"]: d for d in production}
+    seen = {d["ts"]: d for d in replayed}
+    matched = 0
+    changed = []
+    for ts, decision in seen.items():
+        other = expected.get(ts)
+        if other is None:
+            continue
+        if (other["action"], other["result"]) == (decision["action"], decision["result"]):
+            matched += 1
+        else:
+            changed.append({"production": other, "replay": decision})
+
+    missing = [d for ts, d in expected.items() if ts not in seen]
+    extra = [d for ts, d in seen.items() if ts not in expected]
+    return {
+        "matched": matched,
+        "changed": changed,
+        "missing": missing,
+        "extra": extra,
+        "identical": not (changed or missing or extra),
+    }
+
+
+async def run(
+    capture: str,
+    base: str = "BTC",
+    realtime: bool = False,
+    speed: float = 1.0,
+    quiet: bool = False,
+    from_start: bool = False,
+    data_dir: Optional[str] = None,
+    history: Optional[str] = None,
+    ath: Optional[float] = None,
+    balances: Optional[dict] = None,
+    account: Optional[str] = None,
+) -> dict:
+    """Replay a capture through a fresh Trader in a temporary data directory.
+
+    ``data_dir`` and the arguments after it set up a replay from the start.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        trader = Trader(
+            asyncio.get_running_loop(), "replay", "replay",
+            data_dir=tmp, base=base, client=ReplayClient(),
+        )
+        trader.ta.quiet = quiet
+
+        if from_start:
+            # states and metadata of production, the replay writes into the copy
+            for name in (Path(trader.state_file).name, "metadata.json"):
+                if data_dir is not None and (Path(data_dir) / name).exists():
+                    shutil.copy(Path(data_dir) / name, tmp)
+            trader.metadata.load()
+
+            closes = ()
+            history = history or (str(Path(data_dir) / "data_s1.dat") if data_dir else None)
+            if history and Path(history).exists():
+                closes = list(load_prices(history)[1])
+            await prepare(trader, closes, ath, balances)
+
+        return await replay(
+            read_capture(capture), trader, realtime, speed, from_start, account
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a frame capture through the trader")
+    parser.add_argument("capture", help="capture file written with WS_CAPTURE")
+    parser.add_argument("--base", default="BTC", help="base coin of the pair")
+    parser.add_argument("--account", help="account of a capture recorded with ACCOUNTS")
+    parser.add_argument("--realtime", action="store_true", help="keep the recorded frame timing")
+    parser.add_argument("--speed", type=float, default=1.0, help="time scale of --realtime")
+    parser.add_argument(
+        "--from-start", action="store_true",
+        help="trade from the first tick instead of the recorded start state",
+    )
+    parser.add_argument("--data-dir", help="--from-start: production data dir for states")
+    parser.add_argument("--history", help="--from-start: warmup closes, data_s1.dat of --data-dir")
+    parser.add_argument("--ath", type=float, help="--from-start: all time high")
+    parser.add_argument(
+        "--balance", action="append", default=[], metavar="COIN=EQUITY",
+        help="--from-start: balance before the first wallet frame, repeatable",
+    )
+    parser.add_argument("--production", help="decisions.jsonl of the recording process to diff")
+    parser.add_argument("--quiet", action="store_true", help="no per tick trader output")
+    parser.add_argument("--out", help="write the report JSON to this file")
+    args = parser.parse_args(argv)
+
+    balances = {}
+    for spec in args.balance:
+        coin, _, equity = spec.partition("=")
+        balances[coin.strip().upper()] = float(equity)
+
+    report = asyncio.run(
+        run(
+            args.capture,
+            base=args.base,
+            realtime=args.realtime,
+            speed=args.speed,
+            quiet=args.quiet,
+            from_start=args.from_start,
+            data_dir=args.data_dir,
+            history=args.history,
+            ath=args.ath,
+            balances=balances,
+            account=args.account,
+        )
+    )
+    if args.production:
+        report["diff"] = diff_decisions(
+            report["decisions"], load_decisions(args.production),
+            report["first_ts"], report["last_ts"],
+        )
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=4)
+    print(json.dumps(report, indent=4))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
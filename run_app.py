@@ -1,21 +1,19 @@
 import os
 import signal
 import subprocess
-import time
+import sys
 
 # The os.setsid() is passed in the argument preexec_fn so
 # it's run after the fork() and before  exec() to run the shell.
 
 pro = subprocess.Popen(["python", "/app/vh_float.py"], preexec_fn=os.setsid)
 
-start_time = time.time()
-work_time = 0.0
-delay = float(60 * 60 * 10)
 
-# restart app for every 10h
-while work_time < delay:
-    work_time = time.time() - start_time
-    time.sleep(1.0)
+def stop(signum, frame):
+    os.killpg(os.getpgid(pro.pid), signal.SIGTERM)
 
 
-os.killpg(os.getpgid(pro.pid), signal.SIGTERM)
+# runs until stopped, the periodic restart is gone (soak.py checks the bot stays flat)
+signal.signal(signal.SIGTERM, stop)
+signal.signal(signal.SIGINT, stop)
+sys.exit(pro.wait())
@@ -0,0 +1,289 @@
+"""
+Soak test of the trader against the local Bybit stand-in.
+
+Runs a Trader with all its background loops through simulated days of
+ticks, as fast as it handles them. The stand-in drops the stream
+connections every ``reconnect_every`` simulated seconds and answers the
+Telegram alerts of the fills, so reconnects and alerts are exercised as
+often as ticks. RSS, open file descriptors, asyncio tasks and live objects
+by type are sampled along the way. A resource keeps growing when the
+minimum of every segment of the samples after the warmup is higher than
+the one before, and the last is more than its tolerance above the first;
+transient peaks (orders in flight, a reconnect) do not count.
+
+Usage:
+    python soak.py --days 3 --quiet
+    python soak.py --prices data/bybit/data_s1.dat --days 2 --reconnect-every 600 --out soak.json
+"""
+
+import argparse
+import asyncio
+import collections
+import gc
+import itertools
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+from typing import Optional
+
+from backtest import load_prices
+from bybit_standin import BybitStandIn, swing_prices
+from vh_float import AlertDispatcher, Trader
+
+TOLERANCES = {"rss_mb": 8.0, "fds": 0, "tasks": 0, "objects": 50}
+
+
+def rss_mb() -> float:
+    """Resident set size, the peak where /proc is missing."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        # kB on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def open_fds():
+    for path in ("/proc/self/fd", "/dev/fd"):
+        try:
+            return len(os.listdir(path))
+        except OSError:
+            continue
+    return None
+
+
+def object_counts() -> collections.Counter:
+    """Objects tracked by the garbage collector, by type name."""
+    gc.collect()
+    return collections.Counter(type(obj).__name__ for obj in gc.get_objects())
+
+
+def growth(values: list, tolerance: float, segments: int = 4):
+    """(first, last) segment minimum if the values keep growing, else None."""
+    if len(values) < segments or any(value is None for value in values):
+        return None
+    size = len(values) // segments
+    floors = [min(values[i * size : (i + 1) * size]) for i in range(segments - 1)]
+    floors.append(min(values[(segments - 1) * size :]))
+
+    if any(later <= earlier for earlier, later in itertools.pairwise(floors)):
+        return None
+    if floors[-1] - floors[0] <= tolerance:
+        return None
+    return floors[0], floors[-1]
+
+
+class ResourceSampler:
+    """Resource series of a run.
+
+    Kept as one list per resource and object type, a sample adds no object
+    the garbage collector tracks, so the sampler does not show up as growth.
+    """
+
+    def __init__(self) -> None:
+        self.ticks = []
+        self.series = {"rss_mb": [], "fds": [], "tasks": []}
+        self.objects = {}
+
+    def sample(self, tick: int) -> None:
+        counts = object_counts()
+        self.ticks.append(tick)
+        self.series["rss_mb"].append(round(rss_mb(), 2))
+        self.series["fds"].append(open_fds())
+        self.series["tasks"].append(len(asyncio.all_tasks()))
+        for name in counts.keys() - self.objects.keys():
+            self.objects[name] = [0] * (len(self.ticks) - 1)
+        for name, values in self.objects.items():
+            values.append(counts.get(name, 0))
+
+    def growing(
+        self, warmup: float = 0.25, segments: int = 4, tolerances: Optional[dict] = None
+    ) -> dict:
+        """Resources growing over the samples after the ``warmup`` fraction."""
+        tolerances = dict(TOLERANCES, **(tolerances or {}))
+        start = int(len(self.ticks) * warmup)
+        growing = {}
+        for key, values in self.series.items():
+            found = growth(values[start:], tolerances[key], segments)
+            if found is not None:
+                growing[key] = {"first": found[0], "last": found[1]}
+
+        objects = {}
+        for name, values in sorted(self.objects.items()):
+            found = growth(values[start:], tolerances["objects"], segments)
+            if found is not None:
+                objects[name] = {"first": found[0], "last": found[1]}
+        if objects:
+            growing["objects"] = objects
+        return growing
+
+    def report(self, step_ms: int) -> list:
+        objects = [sum(counts) for counts in zip(*self.objects.values())]
+        return [
+            {
+                "tick": tick,
+                "hours": round(tick * step_ms / 3600000.0, 3),
+                **{key: values[i] for key, values in self.series.items()},
+                "objects": objects[i],
+            }
+            for i, tick in enumerate(self.ticks)
+        ]
+
+
+async def wait_tick(trader: Trader, ts: int, timeout: float = 10.0) -> None:
+    deadline = time.monotonic() + timeout
+    while trader.tick_ts != ts:
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"the trader stopped receiving ticks at {ts}")
+        await asyncio.sleep(0)
+
+
+async def soak(
+    prices: list,
+    days: float = 1.0,
+    step_ms: int = 1000,
+    sample_every: float = 600.0,
+    reconnect_every: float = 3600.0,
+    warmup: float = 10.0,
+    quiet: bool = True,
+    data_dir: Optional[str] = None,
+) -> dict:
+    """Run a Trader against the stand-in for simulated days.
+
+    Args:
+        prices: Price path of the ticks, repeated to fill the days
+        days: Simulated days
+        step_ms: Exchange ms per tick
+        sample_every: Simulated seconds between resource samples
+        reconnect_every: Simulated seconds between dropped stream connections, 0 never
+        warmup: Seconds between the first tick and the path, Trader.trade_loop
+            waits this long before it starts trading
+    """
+    loop = asyncio.get_running_loop()
+    ticks = int(days * 86400000 / step_ms)
+    sample_ticks = max(int(sample_every * 1000 / step_ms), 1)
+    reconnect_ticks = int(reconnect_every * 1000 / step_ms)
+    feed = itertools.cycle(prices)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        standin = BybitStandIn(
+            price=prices[0], history=[prices[0]] * 1000, step_ms=step_ms
+        )
+        async with standin:
+            alerts = AlertDispatcher("standin", "soak", base_url=standin.rest_url)
+            trader = Trader(loop, "standin", "standin", data_dir=data_dir or tmp, alerts=alerts)
+            trader.ta.quiet = quiet
+            standin.attach(trader)
+            # a full day of history, the price deque does not fill up during the run
+            trader.ta.prices.extend(itertools.islice(itertools.cycle(prices), 86400))
+            trader.save_history()
+            trader.ta.prices.clear()
+            await trader.init_data()
+
+            tasks = [
+                loop.create_task(coro)
+                for coro in (
+                    trader.ws_ticker(),
+                    trader.ws_user_data(),
+                    trader.account_balance_loop(),
+                    trader.save_history_loop(),
+                    trader.metadata_refresh_loop(),
+                    trader.resample_clock_loop(),
+                    trader.trade_loop(),
+                    alerts.run(),
+                )
+            ]
+            sampler = ResourceSampler()
+            try:
+                await standin.private_subscribed.wait()
+                await standin.tick(next(feed))
+                await asyncio.sleep(warmup)
+
+                started = time.perf_counter()
+                for tick in range(1, ticks + 1):
+                    await standin.tick(next(feed))
+                    await wait_tick(trader, standin.now_ms)
+
+                    if reconnect_ticks and tick % reconnect_ticks == 0 and tick < ticks:
+                        await standin.disconnect()
+                        await standin.subscribed.wait()
+                        await standin.private_subscribed.wait()
+
+                    if tick % sample_ticks == 0:
+                        standin.trim()
+                        sampler.sample(tick)
+                elapsed = time.perf_counter() - started
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                await trader.client.session.close()
+
+    growing = sampler.growing()
+    reconnects = sum(stats["reconnects"] for stats in trader.connection_stats())
+    return {
+        "ticks": ticks,
+        "days": days,
+        "elapsed": round(elapsed, 3),
+        "ticks_per_second": round(ticks / elapsed) if elapsed > 0.0 else None,
+        "reconnects": reconnects,
+        "fills": trader.latency.histograms["order_fill"].count,
+        "alerts": alerts.stats["sent"],
+        "samples": sampler.report(step_ms),
+        "growing": growing,
+        "ok": not growing,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Soak the trader against a local stand-in")
+    parser.add_argument("--prices", help="data_s1.dat history or timestamp_ms,price CSV")
+    parser.add_argument("--days", type=float, default=1.0, help="simulated days")
+    parser.add_argument("--step-ms", type=int, default=1000, help="exchange ms per tick")
+    parser.add_argument(
+        "--sample-every", type=float, default=600.0, help="simulated seconds between samples"
+    )
+    parser.add_argument(
+        "--reconnect-every", type=float, default=3600.0,
+        help="simulated seconds between dropped connections, 0 never",
+    )
+    parser.add_argument("--warmup", type=float, default=10.0, help="seconds before the path")
+    parser.add_argument("--quiet", action="store_true", help="no per tick trader output")
+    parser.add_argument("--out", help="write the report JSON to this file")
+    args = parser.parse_args(argv)
+
+    if args.prices:
+        prices = list(load_prices(args.prices)[1])
+    else:
+        # four swings in three simulated days, the default strategy trades a few times a day
+        prices = swing_prices(int(3 * 86400000 / args.step_ms), amplitude=0.05)
+    if len(prices) < 2:
+        print("ERROR: the price path needs at least two prices")
+        return 1
+
+    report = asyncio.run(
+        soak(
+            prices,
+            days=args.days,
+            step_ms=args.step_ms,
+            sample_every=args.sample_every,
+            reconnect_every=args.reconnect_every,
+            warmup=args.warmup,
+            quiet=args.quiet,
+        )
+    )
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=4)
+    print(json.dumps(report, indent=4))
+    return 0 if report["ok"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
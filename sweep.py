@@ -0,0 +1,261 @@
+"""
+Parameter sweep over the backtest engine.
+
+Expands a parameter grid (or a random sample of it) and backtests every
+point on all cores. Points with the same MA length and amplitude window run
+in groups of up to GROUP_SIZE that replay the series once, with the
+indicators computed for the whole group (see ``backtest.run_group``). The
+price series is loaded once into shared memory and attached by every
+worker, nothing but the parameters and the summaries is pickled. Results are
+appended to a JSON lines file as they finish, so an interrupted sweep
+continues where it stopped when started again.
+
+Measured on one core: about 0.8M ticks/s for a single backtest and 1.1M
+point-ticks/s in a group. 10000 points over a month of 1 s ticks (2.6M) is
+then about 7 CPU hours, 25 minutes on 16 cores; sample with ``--random`` or
+use a shorter series to stay within minutes.
+
+Usage:
+    python sweep.py data/bybit/data_s1.dat --grid ma_length=12,24,48 --grid range=25,50
+    python sweep.py ticks.csv --grid rebalance_top=1,2,3 --grid rebalance_bottom=1,2,3 \\
+        --random 500 --results sweep.jsonl --top 20
+"""
+
+import argparse
+import array as arr
+import dataclasses
+import itertools
+import json
+import os
+import random
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+from typing import Optional
+
+from backtest import Backtest, load_prices, run_group
+from vh_float import StrategyConfig
+
+# points replayed together by one worker task, groups are split in chunks
+# of this size so they still spread over all cores
+GROUP_SIZE = 32
+
+# per worker process, set by _attach
+_series = None
+
+
+def parse_grid(specs: list) -> dict:
+    """``name=v1,v2,...`` specs to {StrategyConfig field: [values]}."""
+    types = {field.name: field.type for field in dataclasses.fields(StrategyConfig)}
+    grid = {}
+    for spec in specs:
+        name, _, values = spec.partition("=")
+        name = name.strip().lower()
+        if name not in types:
+            raise ValueError(f"unknown parameter: {name}, expected one of {sorted(types)}")
+        if types[name] is bool:
+            grid[name] = [v.strip().lower() in ("true", "1", "yes", "y") for v in values.split(",")]
+        else:
+            grid[name] = [types[name](v) for v in values.split(",")]
+    return grid
+
+
+def expand(grid: dict, samples: int = 0, seed: int = 0) -> list:
+    """All grid points, or ``samples`` distinct random ones."""
+    names = list(grid)
+    sizes = [len(grid[name]) for name in names]
+    total = 1
+    for size in sizes:
+        total *= size
+
+    if not samples or samples >= total:
+        combos = itertools.product(*(grid[name] for name in names))
+        return [dict(zip(names, combo)) for combo in combos]
+
+    # sample indices into the product, the full grid is never materialized
+    points = []
+    for index in random.Random(seed).sample(range(total), samples):
+        point = {}
+        for name, size in zip(reversed(names), reversed(sizes)):
+            index, i = divmod(index, size)
+            point[name] = grid[name][i]
+        points.append({name: point[name] for name in names})
+    return points
+
+
+def point_key(point: dict) -> str:
+    return json.dumps(point, sort_keys=True)
+
+
+def market_key(config: StrategyConfig) -> tuple:
+    """Parameters the MarketIndicators depend on."""
+    return config.ma_length, config.amplitude_time_frame
+
+
+def group_points(points: list, base_config: StrategyConfig, size: int = GROUP_SIZE) -> list:
+    """Points in chunks of at most ``size`` sharing the same market_key."""
+    groups = {}
+    for point in points:
+        key = market_key(dataclasses.replace(base_config, **point))
+        groups.setdefault(key, []).append(point)
+    return [
+        group[i : i + size] for group in groups.values() for i in range(0, len(group), size)
+    ]
+
+
+def share_series(timestamps, prices):
+    """Copy the series into one shared memory block: int64 timestamps, then float64 prices."""
+    count = len(prices)
+    shm = shared_memory.SharedMemory(create=True, size=max(count * 16, 1))
+    shm.buf[: count * 8] = arr.array("q", timestamps).tobytes()
+    shm.buf[count * 8 : count * 16] = arr.array("d", prices).tobytes()
+    return shm
+
+
+def _attach(name: str, count: int):
+    global _series
+    shm = shared_memory.SharedMemory(name=name)
+    buf = shm.buf
+    # keep the block referenced for the lifetime of the worker
+    _series = (shm, buf[: count * 8].cast("q"), buf[count * 8 : count * 16].cast("d"))
+
+
+def _run_group(points: list, base_config: StrategyConfig, options: dict) -> list:
+    _, timestamps, prices = _series
+    backtests = [
+        Backtest(config=dataclasses.replace(base_config, **point), **options) for point in points
+    ]
+    results = run_group(backtests, timestamps, prices)
+    return [{"params": point, "result": result} for point, result in zip(points, results)]
+
+
+def load_results(path: str) -> dict:
+    """Finished points of an earlier run, keyed by point_key."""
+    done = {}
+    if not path or not os.path.exists(path):
+        return done
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError:
+                # the last line of an interrupted run may be cut
+                continue
+            done[point_key(row["params"])] = row
+    return done
+
+
+def run_sweep(
+    timestamps,
+    prices,
+    points: list,
+    results_path: Optional[str] = None,
+    workers: Optional[int] = None,
+    base_config: Optional[StrategyConfig] = None,
+    options: Optional[dict] = None,
+) -> list:
+    """Backtest every point not yet in ``results_path``, returns all results.
+
+    Args:
+        timestamps: Tick timestamps in ms
+        prices: Tick prices
+        points: Parameter dicts, StrategyConfig field overrides
+        results_path: JSON lines file results are appended to and resumed from
+        workers: Worker processes, all cores if None
+        base_config: Config the points override, StrategyConfig.from_env() if None
+        options: Backtest keyword arguments (balances, ath, warmup_minutes, ...)
+    """
+    base_config = base_config if base_config is not None else StrategyConfig.from_env()
+    options = options or {}
+    done = load_results(results_path)
+    rows = [done[point_key(p)] for p in points if point_key(p) in done]
+
+    todo = []
+    for point in points:
+        config = dataclasses.replace(base_config, **point)
+        if point_key(point) in done or config.min_ratio >= config.max_ratio:
+            continue
+        todo.append(point)
+    groups = group_points(todo, base_config)
+    print(
+        f"INFO: sweep, {len(points)} points, {len(rows)} done, {len(todo)} to run "
+        f"in {len(groups)} groups"
+    )
+    if not todo:
+        return rows
+
+    shm = share_series(timestamps, prices)
+    out = open(results_path, "a") if results_path else None
+    try:
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_attach, initargs=(shm.name, len(prices))
+        ) as pool:
+            futures = [pool.submit(_run_group, g, base_config, options) for g in groups]
+            count = 0
+            for future in as_completed(futures):
+                group_rows = future.result()
+                rows.extend(group_rows)
+                if out is not None:
+                    out.writelines(json.dumps(row) + "\n" for row in group_rows)
+                    out.flush()
+                count += len(group_rows)
+                print(f"INFO: sweep, {count}/{len(todo)}")
+    finally:
+        if out is not None:
+            out.close()
+        shm.close()
+        shm.unlink()
+    return rows
+
+
+def rank(rows: list, metric: str = "return_percent") -> list:
+    return sorted(
+        rows,
+        key=lambda row: row["result"].get(metric) if row["result"].get(metric) is not None
+        else float("-inf"),
+        reverse=True,
+    )
+
+
+def format_table(rows: list, top: int = 20, metric: str = "return_percent") -> str:
+    columns = ["return_percent", "max_drawdown_percent", "sharpe", "trades", "fees"]
+    if metric not in columns:
+        columns.insert(0, metric)
+    lines = []
+    for place, row in enumerate(rank(rows, metric)[:top], 1):
+        stats = ", ".join(f"{c}: {row['result'].get(c)}" for c in columns)
+        lines.append(f"{place:>4}. {point_key(row['params'])} | {stats}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Parameter sweep over backtest.py")
+    parser.add_argument("prices", help="data_s1.dat history or timestamp_ms,price CSV")
+    parser.add_argument(
+        "--grid", action="append", default=[], help="parameter=v1,v2,... (repeatable)"
+    )
+    parser.add_argument("--random", type=int, default=0, help="sample this many grid points")
+    parser.add_argument("--seed", type=int, default=0, help="random sample seed")
+    parser.add_argument("--results", default="sweep.jsonl", help="JSON lines results file")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes")
+    parser.add_argument("--metric", default="return_percent", help="ranking metric")
+    parser.add_argument("--top", type=int, default=20, help="rows in the ranked table")
+    parser.add_argument("--quote", type=float, default=1000.0, help="starting quote balance")
+    parser.add_argument("--base-balance", type=float, default=0.0, help="starting base balance")
+    parser.add_argument("--ath", type=float, default=None, help="all time high")
+    args = parser.parse_args(argv)
+
+    if not args.grid:
+        parser.error("at least one --grid is required")
+
+    timestamps, prices = load_prices(args.prices)
+    points = expand(parse_grid(args.grid), args.random, args.seed)
+    options = {"quote_balance": args.quote, "base_balance": args.base_balance, "ath": args.ath}
+    rows = run_sweep(timestamps, prices, points, args.results, args.workers, options=options)
+
+    print(format_table(rows, args.top, args.metric))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+"""
+Tests for the backtest engine (backtest.py).
+"""
+import array as arr
+import dataclasses
+import json
+import math
+import random
+
+from backtest import Backtest, load_prices, main, run_group
+from vh_float import StrategyConfig
+
+CONFIG = StrategyConfig(range=10.0, rebalance_top=1.0, rebalance_bottom=1.0)
+
+
+def swing_series(seed=0, n=86400 * 2):
+    """Two days of one-second prices swinging around 100000."""
+    rnd = random.Random(seed)
+    prices = arr.array(
+        "d",
+        [
+            100000.0
+            + 6000.0 * math.sin(i / n * 2 * math.pi * 4)
+            + 150.0 * math.sin(i / 700)
+            + rnd.gauss(0, 20)
+            for i in range(n)
+        ],
+    )
+    return arr.array("q", range(0, n * 1000, 1000)), prices
+
+
+def run_backtest(timestamps, prices):
+    bt = Backtest(config=CONFIG, quote_balance=1000.0, base_balance=0.005, ath=110000.0)
+    return bt, bt.run(timestamps, prices)
+
+
+class TestBacktest:
+    """Test replaying prices through the real strategy."""
+
+    def test_trades_and_ledger(self):
+        """Test swings are harvested and the ledger matches the balances."""
+        bt, result = run_backtest(*swing_series())
+        assert result["buys"] >= 2 and result["sells"] >= 2
+        sides = [fill["side"] for fill in bt.ledger]
+        assert sides[:2] == ["buy", "sell"]
+
+        last = bt.ledger[-1]
+        assert bt.ta.native_balance == (last["base_balance"], last["quote_balance"])
+        assert result["fees"] > 0.0
+        assert result["return_percent"] > result["buy_and_hold_percent"]
+        assert 0.0 < result["max_drawdown_percent"] < 100.0
+        assert len(bt.equity) > 0
+
+    def test_deterministic(self):
+        """Test the same input gives the same fills."""
+        series = swing_series(seed=3)
+        first, _ = run_backtest(*series)
+        second, _ = run_backtest(*series)
+        assert first.ledger == second.ledger
+
+    def test_fill_at_next_price(self):
+        """Test a decision fills at the following tick with the fee."""
+        timestamps, prices = swing_series()
+        bt, _ = run_backtest(timestamps, prices)
+        fill = bt.ledger[0]
+        index = timestamps.index(fill["ts"])
+        assert fill["price"] == prices[index]
+        assert math.isclose(fill["fee"], fill["quote_qty"] * CONFIG.fee / 100.0)
+
+    def test_group_matches_separate_runs(self):
+        """Test backtests sharing the indicators trade like separate runs."""
+        timestamps, prices = swing_series()
+        configs = [
+            dataclasses.replace(CONFIG, range=r, rebalance_top=top)
+            for r in (10.0, 30.0)
+            for top in (1.0, 2.0)
+        ]
+        options = {"quote_balance": 1000.0, "base_balance": 0.005, "ath": 110000.0}
+        separate = [Backtest(config=c, **options) for c in configs]
+        for bt in separate:
+            bt.run(timestamps, prices)
+        grouped = [Backtest(config=c, **options) for c in configs]
+        results = run_group(grouped, timestamps, prices)
+
+        assert [bt.ledger for bt in grouped] == [bt.ledger for bt in separate]
+        assert [bt.equity for bt in grouped] == [bt.equity for bt in separate]
+        assert separate[0].ledger != separate[-1].ledger
+        assert all(r["trades"] == len(bt.ledger) for r, bt in zip(results, grouped))
+
+    def test_load_dat_and_csv(self, tmp_path):
+        """Test the trader price history and CSV archives are both read."""
+        path = tmp_path / "data_s1.dat"
+        with open(path, "wb") as f:
+            arr.array("L", [3]).tofile(f)
+            arr.array("d", [1.0, 2.0, 3.0]).tofile(f)
+        timestamps, prices = load_prices(str(path))
+        assert list(prices) == [1.0, 2.0, 3.0]
+        assert list(timestamps) == [0, 1000, 2000]
+
+        csv_path = tmp_path / "ticks.csv"
+        csv_path.write_text("ts,price\n1000,5.5\n2000,6.5\n")
+        timestamps, prices = load_prices(str(csv_path))
+        assert list(timestamps) == [1000, 2000]
+        assert list(prices) == [5.5, 6.5]
+
+    def test_cli(self, tmp_path, capsys):
+        """Test the command line writes summary, ledger and equity curve."""
+        timestamps, prices = swing_series(n=86400)
+        path = tmp_path / "ticks.csv"
+        path.write_text("".join(f"{t},{p}\n" for t, p in zip(timestamps, prices)))
+        ledger = tmp_path / "fills.csv"
+        equity = tmp_path / "equity.csv"
+
+        argv = [str(path), "--ath", "110000", "--ledger", str(ledger), "--equity", str(equity)]
+        assert main(argv) == 0
+        result = json.loads(capsys.readouterr().out)
+        assert result["ticks"] > 0
+        assert ledger.read_text().startswith("ts,")
+        assert equity.read_text().startswith("ts,equity")
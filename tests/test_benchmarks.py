@@ -0,0 +1,246 @@
+"""
+Throughput benchmarks of the hot paths, compared against a stored baseline.
+
+Skipped unless VH_BENCHMARK=1. Every benchmark runs on the same reproducible
+price path and stand-in frames, reports operations per second (best of
+VH_BENCHMARK_REPEAT runs) and fails when it is more than
+VH_BENCHMARK_THRESHOLD (a fraction, default 0.25) below the baseline in
+VH_BENCHMARK_BASELINE. Benchmarks missing from the baseline are added to it,
+VH_BENCHMARK_UPDATE=1 rewrites their numbers.
+
+    VH_BENCHMARK=1 python -m pytest tests/test_benchmarks.py -q
+"""
+import asyncio
+import itertools
+import json
+import os
+import platform
+import timeit
+from pathlib import Path
+
+import pytest
+
+from bybit_standin import BybitStandIn, swing_prices
+from vh_float import Client, MarketIndicators, StrategyConfig, TradeAnalyse, Trader
+
+BENCHMARK = os.getenv("VH_BENCHMARK", "") not in ("", "0")
+UPDATE = os.getenv("VH_BENCHMARK_UPDATE", "") not in ("", "0")
+THRESHOLD = float(os.getenv("VH_BENCHMARK_THRESHOLD", "0.25"))
+REPEAT = int(os.getenv("VH_BENCHMARK_REPEAT", "5"))
+BASELINE = Path(
+    os.getenv("VH_BENCHMARK_BASELINE", str(Path(__file__).parent / "benchmark_baseline.json"))
+)
+
+pytestmark = pytest.mark.skipif(not BENCHMARK, reason="set VH_BENCHMARK=1 to run benchmarks")
+
+# fixed, not from .env, so the numbers only change with the code
+CONFIG = StrategyConfig(range=50.0, rebalance_top=1.0, rebalance_bottom=1.0)
+BENCHMARKS = {}
+
+
+def benchmark(number: int):
+    """Register a setup returning the operation to time, ``number`` calls per run."""
+
+    def register(setup):
+        BENCHMARKS[setup.__name__] = (setup, number)
+        return setup
+
+    return register
+
+
+def measure(op, number: int, repeat: int = REPEAT) -> float:
+    """Operations per second of the fastest run."""
+    best = min(timeit.Timer(op).repeat(repeat=repeat, number=number))
+    return number / best
+
+
+def load_baseline(path: Path = BASELINE) -> dict:
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"benchmarks": {}}
+
+
+def save_baseline(baseline: dict, path: Path = BASELINE) -> None:
+    baseline["python"] = platform.python_version()
+    baseline["machine"] = platform.machine()
+    with open(path, "w") as f:
+        json.dump(baseline, f, indent=4, sort_keys=True)
+        f.write("\n")
+
+
+@pytest.fixture(scope="module")
+def data(tmp_path_factory):
+    """A day of one-second prices, their history file and recorded kline/trade frames."""
+    prices = swing_prices(86400, seed=7)
+    data_dir = tmp_path_factory.mktemp("benchmark")
+    trader = Trader(None, "key", "secret", data_dir=str(data_dir), config=CONFIG)
+    trader.ta.prices.extend(prices)
+    trader.save_history()
+
+    async def record():
+        standin = BybitStandIn(step_ms=1000)
+        frames = []
+        for price in prices[:5000]:
+            await standin.tick(price)
+            frames.append(standin._public_frame("kline.1.BTCUSDT"))
+            frames.append(standin._public_frame("publicTrade.BTCUSDT"))
+        return frames
+
+    return {"prices": prices, "data_dir": data_dir, "frames": asyncio.run(record())}
+
+
+def live_analyse(prices: list) -> TradeAnalyse:
+    """Warmed up TradeAnalyse holding a position, like the trader after start."""
+    ta = TradeAnalyse(["BTC", "USDT"], log_file=os.devnull, config=CONFIG, quiet=True)
+    for price in prices[:3600]:
+        ta.monitor(price, 1.0, show=False)
+    ta.ATH = max(prices)
+    ta.native_balance = (0.005, 500.0)
+    ta.pair_balance = {"BTC": 0.005 * prices[3600], "USDT": 500.0}
+    ta.traded_price = prices[3600]
+    ta.portfolio_ratio = 0.5
+    return ta
+
+
+def ticks(prices: list, start: int = 3600):
+    """Endless (price, minute) ticks, a new minute every 60 prices."""
+    return itertools.cycle((price, float(i // 60)) for i, price in enumerate(prices[start:]))
+
+
+@benchmark(number=2000)
+def monitor_warmup(data):
+    ta = TradeAnalyse(["BTC", "USDT"], log_file=os.devnull, config=CONFIG, quiet=True)
+    feed = ticks(data["prices"], start=0)
+
+    def op():
+        price, m1_time = next(feed)
+        ta.monitor(price, m1_time, show=False)
+
+    return op
+
+
+@benchmark(number=2000)
+def monitor_live(data):
+    ta = live_analyse(data["prices"])
+    feed = ticks(data["prices"])
+
+    def op():
+        price, m1_time = next(feed)
+        ta.monitor(price, m1_time, show=True)
+
+    return op
+
+
+@benchmark(number=2000)
+def count_power_s1(data):
+    market = MarketIndicators(CONFIG)
+    market.prices.extend(data["prices"][:3600])
+    for price in data["prices"][:3600]:
+        market.append_diff(price)
+    feed = itertools.cycle(data["prices"])
+
+    def op():
+        price = next(feed)
+        market.count_power_s1(price)
+        market.prices.append(price)
+
+    return op
+
+
+@benchmark(number=100000)
+def sma(data):
+    market = MarketIndicators(CONFIG)
+    market.ma_trend_win.extend(data["prices"][:market.ma_trend_win.maxlen])
+    feed = itertools.cycle(data["prices"])
+    return lambda: market.sma(market.ma_trend_win, next(feed))
+
+
+@benchmark(number=100000)
+def ema(data):
+    market = MarketIndicators(CONFIG)
+    period = int(market.ma_length)
+    feed = itertools.cycle(data["prices"])
+
+    def op():
+        market.ma_fast_m = market.ema(period, market.ma_fast_m, next(feed))
+
+    return op
+
+
+@benchmark(number=100000)
+def change_portfolio_ratio(data):
+    ta = live_analyse(data["prices"])
+    feed = itertools.cycle(data["prices"])
+
+    def op():
+        ta.portfolio_ratio = ta.change_portfolio_ratio(next(feed), ta.portfolio_ratio)
+
+    return op
+
+
+@benchmark(number=100000)
+def calculate_profit(data):
+    ta = live_analyse(data["prices"])
+    feed = itertools.cycle(data["prices"])
+    return lambda: ta.calculate_profit(next(feed))
+
+
+@benchmark(number=3)
+def load_history(data):
+    """One op reads the whole day of history."""
+    trader = Trader(None, "key", "secret", data_dir=str(data["data_dir"]), config=CONFIG)
+    return trader.load_history
+
+
+@benchmark(number=20)
+def save_history(data):
+    """One op writes the whole day of history."""
+    trader = Trader(None, "key", "secret", data_dir=str(data["data_dir"]), config=CONFIG)
+    trader.ta.prices.extend(data["prices"])
+    return trader.save_history
+
+
+@benchmark(number=10000)
+def decode_frames(data):
+    feed = itertools.cycle(data["frames"])
+    return lambda: json.loads(next(feed))
+
+
+@benchmark(number=50000)
+def gen_signature(data):
+    async def create():
+        client = Client(asyncio.get_running_loop(), "http://localhost", "key", "secret")
+        await client.session.close()
+        return client
+
+    client = asyncio.run(create())
+    payload = json.dumps(
+        {"category": "spot", "symbol": "BTCUSDT", "side": "Buy", "orderType": "Market",
+         "qty": "100.0", "marketUnit": "quoteCoin", "orderLinkId": "BTCUSDT-1700000000000-1"}
+    )
+    return lambda: client.genSignature(payload, "1700000000000", "5000")
+
+
+class TestBenchmarks:
+    """Test the hot paths keep their throughput."""
+
+    @pytest.mark.parametrize("name", sorted(BENCHMARKS))
+    def test_throughput(self, name, data):
+        """Test the operations per second are within the threshold of the baseline."""
+        setup, number = BENCHMARKS[name]
+        ops = measure(setup(data), number)
+
+        baseline = load_baseline()
+        expected = baseline["benchmarks"].get(name)
+        if UPDATE or expected is None:
+            baseline["benchmarks"][name] = round(ops, 1)
+            save_baseline(baseline)
+            return
+
+        floor = expected * (1.0 - THRESHOLD)
+        assert ops >= floor, (
+            f"{name}: {ops:.1f} ops/s, baseline {expected:.1f} ops/s, "
+            f"{1.0 - ops / expected:.1%} slower (threshold {THRESHOLD:.0%})"
+        )
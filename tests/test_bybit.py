@@ -55,6 +55,27 @@ class TestByBitAuth:
         response = client.get("/bybit/stats")
         assert response.status_code == 401
 
+    def test_connections_requires_auth(self):
+        """Test that getting connection health requires authentication."""
+        response = client.get("/bybit/connections")
+        assert response.status_code == 401
+
+    def test_latency_requires_auth(self):
+        """Test that getting latency histograms requires authentication."""
+        response = client.get("/bybit/latency")
+        assert response.status_code == 401
+
+    def test_loop_requires_auth(self):
+        """Test that getting event loop health requires authentication."""
+        response = client.get("/bybit/loop")
+        assert response.status_code == 401
+
+    def test_shadows_requires_auth(self):
+        """Test that shadow results and changes require authentication."""
+        assert client.get("/bybit/shadows").status_code == 401
+        assert client.post("/bybit/shadows", json={"name": "a"}).status_code == 401
+        assert client.delete("/bybit/shadows/a").status_code == 401
+
 
 class TestByBitStatus:
     """Test ByBit status endpoint."""
@@ -97,6 +118,56 @@ class TestByBitStats:
         assert "not initialized" in response.json()["detail"].lower()
 
 
+class TestByBitConnections:
+    """Test ByBit connections endpoint."""
+
+    def test_connections_not_initialized(self):
+        """Test getting connection health when bot is not initialized."""
+        headers = get_auth_headers()
+
+        response = client.get("/bybit/connections", headers=headers)
+        assert response.status_code == 400
+        assert "not initialized" in response.json()["detail"].lower()
+
+
+class TestByBitLatency:
+    """Test ByBit latency endpoint."""
+
+    def test_latency_not_initialized(self):
+        """Test getting latency when bot is not initialized."""
+        headers = get_auth_headers()
+
+        response = client.get("/bybit/latency", headers=headers)
+        assert response.status_code == 400
+        assert "not initialized" in response.json()["detail"].lower()
+
+
+class TestByBitLoop:
+    """Test ByBit event loop monitor endpoint."""
+
+    def test_loop_not_initialized(self):
+        """Test getting loop health when bot is not initialized."""
+        headers = get_auth_headers()
+
+        response = client.get("/bybit/loop", headers=headers)
+        assert response.status_code == 400
+        assert "not initialized" in response.json()["detail"].lower()
+
+
+class TestByBitShadows:
+    """Test ByBit shadows endpoints."""
+
+    def test_shadows_not_initialized(self):
+        """Test getting and adding shadows when bot is not initialized."""
+        headers = get_auth_headers()
+
+        response = client.get("/bybit/shadows", headers=headers)
+        assert response.status_code == 400
+        assert "not initialized" in response.json()["detail"].lower()
+        response = client.post("/bybit/shadows", json={"name": "a"}, headers=headers)
+        assert response.status_code == 400
+
+
 class TestByBitStop:
     """Test ByBit stop endpoint."""
     
@@ -0,0 +1,130 @@
+"""
+End-to-end tests of Client, WSClient and Trader against the local Bybit stand-in.
+"""
+import asyncio
+import time
+
+from bybit_standin import BybitStandIn, benchmark, swing_prices
+from vh_float import Client, Trader
+
+
+async def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        await asyncio.sleep(0.005)
+
+
+async def start_trader(standin, data_dir):
+    """Trader pointed at the stand-in with both streams connected."""
+    trader = Trader(asyncio.get_running_loop(), "key", "secret", data_dir=str(data_dir))
+    trader.ta.quiet = True
+    standin.attach(trader)
+    await trader.init_data()
+    tasks = [asyncio.create_task(trader.ws_ticker()), asyncio.create_task(trader.ws_user_data())]
+    await standin.subscribed.wait()
+    await standin.private_subscribed.wait()
+    return trader, tasks
+
+
+async def stop_trader(trader, tasks):
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await trader.client.session.close()
+
+
+class TestBybitStandIn:
+    """Test the bot end to end against the stand-in exchange."""
+
+    def test_rest_endpoints(self):
+        """Test the Client requests are answered like the exchange does."""
+
+        async def run():
+            async with BybitStandIn(history=[90000.0, 95000.0, 91000.0], fee=0.002) as standin:
+                client = Client(asyncio.get_running_loop(), standin.rest_url, "key", "secret")
+                try:
+                    klines = await client.get_klines("BTCUSDT", interval="1")
+                    account = await client.account()
+                    fee = await client.fee_rate("BTCUSDT")
+                    info = await client.instrument_info("BTCUSDT")
+                finally:
+                    await client.session.close()
+            return klines, account, fee, info, standin
+
+        klines, account, fee, info, standin = asyncio.run(run())
+        closes = [float(row[4]) for row in klines["result"]["list"]]
+        assert closes == [91000.0, 95000.0, 90000.0]
+        coins = {c["coin"]: c["equity"] for c in account["result"]["list"][0]["coin"]}
+        assert coins == {"BTC": "0.0", "USDT": "1000.0"}
+        assert fee["result"]["list"][0]["takerFeeRate"] == "0.002"
+        assert info["result"]["list"][0]["lotSizeFilter"]["minOrderAmt"] == "1"
+        assert standin.requests["v5/account/wallet-balance"] == 1
+
+    def test_trader_ticks_orders_and_fills(self, tmp_path):
+        """Test ticks reach the strategy and an order is filled over the private stream."""
+
+        async def run():
+            async with BybitStandIn(history=[100000.0] * 50 + [120000.0]) as standin:
+                trader, tasks = await start_trader(standin, tmp_path)
+                try:
+                    assert trader.ta.ATH == 120000.0
+                    assert trader.minOrderAmt == 1.0
+                    for price in (100010.0, 100020.0, 100030.0):
+                        await standin.tick(price)
+                    await wait_for(lambda: trader.last_price == 100030.0)
+
+                    order = trader.orders.submit(trader.symbol, "Buy", 100.0)
+                    await wait_for(lambda: order.state == "filled")
+                    await wait_for(lambda: trader.balances.coins.get("USDT") == 900.0)
+                finally:
+                    await stop_trader(trader, tasks)
+                return trader, order, standin
+
+        trader, order, standin = asyncio.run(run())
+        assert order.avg_price == 100030.0
+        assert trader.ta.traded_price == 100030.0
+        assert standin.balances["USDT"] == 900.0
+        assert abs(trader.balances.coins["BTC"] - 100.0 / 100030.0 * 0.999) < 1e-12
+        assert trader.latency.histograms["order_fill"].count == 1
+
+    def test_injected_errors_and_latency(self, tmp_path):
+        """Test 170131 is retried smaller, duplicates are refused and latency is added."""
+
+        async def run():
+            async with BybitStandIn(latency=0.05) as standin:
+                trader, tasks = await start_trader(standin, tmp_path)
+                try:
+                    await standin.tick(100000.0)
+                    standin.reject_orders(170131, "Insufficient balance.")
+                    order = trader.orders.submit(trader.symbol, "Buy", 100.0)
+                    await wait_for(lambda: order.state == "filled")
+
+                    resp, _status = await trader.client.market_order(
+                        trader.symbol, "Buy", 10.0, order.link_id
+                    )
+                    standin.fail("v5/account/wallet-balance", 10006, "Too many visits")
+                    failed = await trader.client.account()
+                finally:
+                    await stop_trader(trader, tasks)
+                return trader, order, resp, failed, standin
+
+        trader, order, resp, failed, standin = asyncio.run(run())
+        assert order.adjustments == 1 and order.link_id.endswith("-1")
+        assert order.filled_qty == 99.0 / 100000.0
+        assert standin.requests["v5/order/create"] == 3
+        assert resp["retCode"] == 170141
+        assert failed["retCode"] == 10006
+        ack = trader.latency.histograms["order_ack"].snapshot()
+        assert ack["count"] == 2 and ack["mean_ms"] >= 50.0
+
+    def test_benchmark(self, tmp_path):
+        """Test the benchmark runs the full trader over a path and reports latencies."""
+        report = asyncio.run(
+            benchmark(swing_prices(300), step_ms=60000, warmup=0.0, quiet=True,
+                      data_dir=str(tmp_path))
+        )
+        assert report["ticks"] == 299
+        assert report["ticks_per_second"] > 0
+        assert report["frames"] >= 299
+        assert report["latency"]["monitor"]["count"] >= 299
@@ -0,0 +1,117 @@
+"""
+Tests for the Monte Carlo simulator (monte_carlo.py).
+"""
+import array as arr
+import json
+import math
+
+import numpy as np
+import pytest
+
+from backtest import Backtest
+from monte_carlo import (
+    bar_closes,
+    bootstrap_paths,
+    gbm_paths,
+    jump_paths,
+    main,
+    rolling_range,
+    simulate,
+    summarize,
+)
+from tests.test_backtest import CONFIG, swing_series
+
+
+class TestMonteCarlo:
+    """Test path generators and the batched strategy against backtest.py."""
+
+    def test_matches_backtest(self):
+        """Test a path of minute closes trades like the backtest on those closes."""
+        _, prices = swing_series(n=86400 * 4)
+        closes = np.asarray(prices)[59::60]
+        timestamps = arr.array("q", range(60000, 60000 * (len(closes) + 1), 60000))
+
+        bt = Backtest(
+            config=CONFIG, quote_balance=1000.0, base_balance=0.005, ath=110000.0,
+            warmup_minutes=0, equity_every=1,
+        )
+        expected = bt.run(timestamps, arr.array("d", closes))
+        # the same path twice, next to a different one
+        paths = np.stack([closes, closes[::-1], closes])
+        result = simulate(paths, CONFIG, 1000.0, 0.005, 110000.0)
+
+        assert expected["trades"] > 2
+        assert list(result["trades"][[0, 2]]) == [expected["trades"]] * 2
+        assert math.isclose(result["end_equity"][0], expected["end_equity"], abs_tol=1e-4)
+        assert math.isclose(result["fees"][0], expected["fees"], abs_tol=1e-4)
+        assert math.isclose(
+            result["max_drawdown_percent"][0], expected["max_drawdown_percent"], abs_tol=1e-4
+        )
+        assert result["end_equity"][1] != result["end_equity"][0]
+
+    def test_sub_minute_steps(self):
+        """Test 15 s steps update the indicators once a minute, like the backtest on ticks."""
+        _, prices = swing_series(n=86400 * 2)
+        prices = arr.array("d", prices[::15])
+        timestamps = arr.array("q", range(60000, 60000 + 15000 * len(prices), 15000))
+
+        bt = Backtest(
+            config=CONFIG, quote_balance=1000.0, base_balance=0.005, ath=110000.0,
+            warmup_minutes=0, equity_every=1,
+        )
+        expected = bt.run(timestamps, prices)
+        result = simulate(np.stack([prices]), CONFIG, 1000.0, 0.005, 110000.0, step=15.0)
+
+        assert expected["trades"] > 2
+        assert result["trades"][0] == expected["trades"]
+        assert math.isclose(result["end_equity"][0], expected["end_equity"], abs_tol=1e-4)
+        with pytest.raises(ValueError, match="minute"):
+            simulate(np.stack([prices]), CONFIG, step=120.0)
+
+    def test_rolling_range(self):
+        """Test the rolling high minus low against a direct window scan."""
+        paths = np.random.default_rng(0).random((3, 50))
+        ranges = rolling_range(paths, 7)
+        for t in range(50):
+            window = paths[:, max(0, t - 6) : t + 1]
+            assert np.allclose(ranges[:, t], window.max(axis=1) - window.min(axis=1))
+
+    def test_generators(self):
+        """Test path shapes, start price, seeding and bootstrapped returns."""
+        paths = gbm_paths(100.0, 0.0, 0.5, 100, 20, rng=np.random.default_rng(1))
+        assert paths.shape == (20, 100)
+        assert np.all(paths[:, 0] == 100.0)
+        assert np.array_equal(paths, gbm_paths(100.0, 0.0, 0.5, 100, 20,
+                                               rng=np.random.default_rng(1)))
+
+        crashes = jump_paths(100.0, 0.0, 0.0, 1e6, -0.1, 0.0, 10, 5, rng=np.random.default_rng(2))
+        jumps = np.diff(np.log(crashes), axis=1) / -0.1
+        assert np.allclose(jumps, np.round(jumps)) and jumps.sum() > 0.0
+
+        closes = np.array([100.0, 101.0, 99.0, 102.0, 100.0])
+        boot = bootstrap_paths(closes, 30, 10, block=2, rng=np.random.default_rng(3))
+        assert boot.shape == (10, 30)
+        assert np.all(boot[:, 0] == 100.0)
+        recorded = np.round(np.diff(np.log(closes)), 12)
+        assert set(np.round(np.diff(np.log(boot)), 12).ravel()) <= set(recorded)
+
+    def test_bar_closes(self):
+        """Test the last price of every bar is kept."""
+        timestamps = [0, 30000, 59000, 60000, 61000, 185000]
+        prices = [1.0, 2.0, 3.0, 4.0, 5.0, 6.0]
+        assert list(bar_closes(timestamps, prices)) == [3.0, 5.0, 6.0]
+
+    def test_summary_and_cli(self, tmp_path, capsys):
+        """Test distributions over the paths and the command line."""
+        paths = gbm_paths(100000.0, 0.0, 0.8, 2000, 50, rng=np.random.default_rng(4))
+        summary = summarize(simulate(paths, CONFIG, 1000.0, 0.005, warmup=120))
+        assert summary["paths"] == 50
+        stats = summary["return_percent"]
+        assert stats["p5"] <= stats["median"] <= stats["p95"]
+        assert 0.0 <= summary["loss_probability"] <= 1.0
+
+        out = tmp_path / "mc.json"
+        argv = ["--paths", "30", "--days", "0.5", "--chunk", "20", "--seed", "1", "--out", str(out)]
+        assert main(argv) == 0
+        assert json.loads(out.read_text())["paths"] == 30
+        assert json.loads(capsys.readouterr().out)["paths"] == 30
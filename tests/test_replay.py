@@ -0,0 +1,246 @@
+"""
+Tests for frame captures (FrameRecorder) and their replay (replay.py).
+"""
+import asyncio
+import gzip
+import json
+import time
+
+import pytest
+
+from bybit_standin import BybitStandIn, swing_prices
+from replay import ReplayClient, diff_decisions, load_decisions, replay, run
+from tests.test_bybit_standin import stop_trader, wait_for
+from vh_float import (
+    FrameRecorder,
+    MultiAccountTrader,
+    MultiSymbolTrader,
+    Trader,
+    read_capture,
+)
+
+
+def kline(price: float, ts: int) -> str:
+    start = ts // 60000 * 60000
+    data = {"start": start, "end": start + 59999, "close": str(price), "timestamp": ts}
+    return json.dumps({"topic": "kline.1.BTCUSDT", "ts": ts, "type": "snapshot", "data": [data]})
+
+
+async def settle(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        await asyncio.sleep(0.0002)
+
+
+async def live_session(standin, trader, prices):
+    """Trade like trade_loop does, without its startup pauses."""
+    await standin.tick(prices[0])
+    await wait_for(lambda: trader.tick_ts == standin.now_ms)
+    await trader.get_account_balance()
+    trader.load_states()
+    trader.capture_state()
+
+    for price in prices[1:]:
+        await standin.tick(price)
+        await settle(lambda: trader.tick_ts == standin.now_ms)
+        trader.indicators_updated.clear()
+        await trader.decide()
+        await settle(lambda: not trader.orders.in_flight(trader.symbol))
+        await settle(lambda: trader.balances.coins["USDT"] == standin.balances["USDT"])
+
+
+class TestReplay:
+    """Test recording frames and replaying them through a trader."""
+
+    def test_capture_round_trip(self, tmp_path):
+        """Test frames come back with their channel and receive time, a cut record ends them."""
+        path = tmp_path / "capture.vhcap"
+        recorder = FrameRecorder(path)
+        recorder.write("ticker", 10, kline(100.0, 60000))
+        recorder.write("user_data", 20, '{"topic": "wallet"}')
+        recorder.write("ticker", 30, kline(101.0, 61000))
+        recorder.close()
+        recorder.write("ticker", 40, "after close")
+
+        frames = list(read_capture(path))
+        expected = [("ticker", 10), ("user_data", 20), ("ticker", 30)]
+        assert [(channel, ns) for channel, ns, _ in frames] == expected
+        assert json.loads(frames[2][2])["data"][0]["close"] == "101.0"
+        assert recorder.frames == 3
+
+        with gzip.open(path, "rb") as f:
+            raw = f.read()
+        with gzip.open(path, "wb") as f:
+            f.write(raw[:-5])
+        assert len(list(read_capture(path))) == 2
+
+        with gzip.open(path, "wb") as f:
+            f.write(b"something else")
+        with pytest.raises(ValueError):
+            list(read_capture(path))
+
+    def test_replay_matches_live_decisions(self, tmp_path):
+        """Test a recorded session replays to the decisions made live."""
+        capture = tmp_path / "capture.vhcap"
+        prices = swing_prices(2000)
+
+        async def record():
+            async with BybitStandIn(history=[prices[0]] * 1000, step_ms=60000) as standin:
+                trader = Trader(asyncio.get_running_loop(), "key", "secret",
+                                data_dir=str(tmp_path / "live"))
+                trader.ta.quiet = True
+                trader.recorder = FrameRecorder(capture)
+                standin.attach(trader)
+                await trader.init_data()
+                tasks = [
+                    asyncio.create_task(trader.ws_ticker()),
+                    asyncio.create_task(trader.ws_user_data()),
+                ]
+                await standin.subscribed.wait()
+                await standin.private_subscribed.wait()
+                try:
+                    await live_session(standin, trader, prices)
+                finally:
+                    await stop_trader(trader, tasks)
+                    trader.recorder.close()
+            return trader
+
+        live = asyncio.run(record())
+        channels = {channel for channel, _, _ in read_capture(capture)}
+        assert channels == {"ticker", "user_data", "state"}
+
+        report = asyncio.run(run(str(capture), quiet=True))
+        production = load_decisions(tmp_path / "live" / "decisions.jsonl")
+        placed = [d for d in production if d["result"] == "placed"]
+        assert len(placed) > 2
+        assert report["decisions"] == list(live.decisions)
+        assert report["orders"] == len(placed)
+        assert report["ticker_frames"] == len(prices)
+
+        diff = diff_decisions(
+            report["decisions"], production, report["first_ts"], report["last_ts"]
+        )
+        assert diff["identical"] and diff["matched"] == len(production)
+        assert report["handlers"]["ticker"]["count"] == len(prices)
+        assert report["handlers"]["decide"]["count"] == len(prices) - 1
+
+    def test_multi_account_capture(self, tmp_path):
+        """Test the accounts of one capture record their stream and state apart."""
+        capture = tmp_path / "capture.vhcap"
+        prices = swing_prices(30)
+
+        async def record():
+            async with BybitStandIn(history=[prices[0]] * 1000, step_ms=60000) as standin:
+                ma = MultiAccountTrader(
+                    asyncio.get_running_loop(), {"main": ("k1", "s1"), "sub": ("k2", "s2")},
+                    data_dir=str(tmp_path / "live"),
+                )
+                for tr in ma.accounts.values():
+                    tr.ta.quiet = True
+                ma.recorder = FrameRecorder(capture)
+                standin.attach(ma)
+                await ma.init_data()
+                tasks = [asyncio.create_task(ma.ws_ticker()), asyncio.create_task(ma.run())]
+                try:
+                    await standin.subscribed.wait()
+                    await wait_for(lambda: len(standin.private) == 2)
+                    for i, price in enumerate(prices):
+                        await standin.tick(price)
+                        await wait_for(lambda: ma.leader.tick_ts == standin.now_ms)
+                        if i == 0:
+                            # what trade_loop does after its startup pause
+                            for tr in ma.accounts.values():
+                                tr.capture_state()
+                finally:
+                    for task in tasks:
+                        task.cancel()
+                    await asyncio.gather(*tasks, return_exceptions=True)
+                    for tr in ma.accounts.values():
+                        await tr.client.session.close()
+                    ma.recorder.close()
+
+        asyncio.run(record())
+        frames = [channel for channel, _, _ in read_capture(capture)]
+        assert set(frames) == {
+            "ticker", "main/user_data", "sub/user_data", "main/state", "sub/state"
+        }
+
+        report = asyncio.run(run(str(capture), quiet=True, account="sub"))
+        assert report["frames"] == len([c for c in frames if not c.startswith("main/")])
+        assert report["handlers"]["decide"]["count"] == len(prices) - 1
+        # without the account its state is skipped, nothing is traded
+        report = asyncio.run(run(str(capture), quiet=True))
+        assert report["frames"] == frames.count("ticker")
+        assert report["handlers"]["decide"]["count"] == 0
+
+    def test_multi_symbol_state(self, tmp_path):
+        """Test a pair of a multi-pair capture restores its own state and quote ledger."""
+        capture = tmp_path / "capture.vhcap"
+        mt = MultiSymbolTrader(None, "", "", coins=["BTC", "ETH"], data_dir=str(tmp_path / "live"))
+        recorder = FrameRecorder(capture)
+        coins = [
+            {"coin": coin, "equity": equity}
+            for coin, equity in (("BTC", "0.01"), ("ETH", "2"), ("USDT", "400"))
+        ]
+        mt.message_handler({"topic": "wallet", "data": [{"coin": coins}]})
+        mt.traders["BTCUSDT"].quote_balance = 50.0
+        mt.traders["BTCUSDT"].ta.portfolio_ratio = 0.7
+        for tr in mt.traders.values():
+            tr.last_price = 100.0
+            # as MultiSymbolTrader.run hands it down
+            tr.recorder = recorder
+            tr.capture_state()
+        recorder.close()
+        assert [c for c, _, _ in read_capture(capture)] == ["BTCUSDT/state", "ETHUSDT/state"]
+
+        async def restore(base):
+            trader = Trader(
+                asyncio.get_running_loop(), "replay", "replay",
+                data_dir=str(tmp_path / base), base=base, client=ReplayClient(),
+            )
+            await replay(read_capture(capture), trader)
+            return trader
+
+        btc, eth = asyncio.run(restore("BTC")), asyncio.run(restore("ETH"))
+        assert btc.ta.native_balance == (0.01, 50.0) and btc.ta.portfolio_ratio == 0.7
+        assert eth.ta.native_balance == (2.0, 200.0)
+        assert eth.ta.portfolio_ratio == mt.traders["ETHUSDT"].ta.portfolio_ratio
+
+    def test_realtime_and_from_start(self, tmp_path):
+        """Test the recorded spacing is kept, scaled by speed, and acks are skipped."""
+        path = tmp_path / "capture.vhcap"
+        recorder = FrameRecorder(path)
+        recorder.write("ticker", 0, '{"success": true, "op": "subscribe"}')
+        for i in range(5):
+            recorder.write("ticker", i * 50_000_000, kline(100000.0 + i, 60000 * (i + 1)))
+        recorder.close()
+        history = tmp_path / "history.csv"
+        history.write_text("".join(f"{i * 60000},100000.0\n" for i in range(50)))
+
+        options = {"quiet": True, "from_start": True, "history": str(history), "ath": 120000.0}
+        fast = asyncio.run(run(str(path), **options))
+        timed = asyncio.run(run(str(path), realtime=True, speed=2.0, **options))
+        assert fast["frames"] == timed["frames"] == 6
+        assert fast["ticker_frames"] == 5
+        assert timed["elapsed"] >= 0.1 > fast["elapsed"]
+        assert fast["first_ts"] == 60000 and fast["last_ts"] == 300000
+
+    def test_diff_decisions(self):
+        """Test decisions are matched by tick, production outside the replay is ignored."""
+        production = [
+            {"ts": 1, "action": "buy", "price": 1.0, "result": "placed"},
+            {"ts": 5, "action": "sell", "price": 1.0, "result": "placed"},
+            {"ts": 7, "action": "buy", "price": 1.0, "result": "placed"},
+            {"ts": 99, "action": "buy", "price": 1.0, "result": "placed"},
+        ]
+        replayed = [
+            {"ts": 5, "action": "sell", "price": 1.0, "result": "low_qty"},
+            {"ts": 6, "action": "buy", "price": 1.0, "result": "placed"},
+            {"ts": 7, "action": "buy", "price": 1.0, "result": "placed"},
+        ]
+        diff = diff_decisions(replayed, production, first_ts=2, last_ts=10)
+        assert diff["matched"] == 1
+        assert [c["replay"]["ts"] for c in diff["changed"]] == [5]
+        assert diff["missing"] == [] and [d["ts"] for d in diff["extra"]] == [6]
+        assert not diff["identical"]
@@ -0,0 +1,56 @@
+"""
+Tests for the soak harness (soak.py).
+"""
+import asyncio
+
+from bybit_standin import swing_prices
+from soak import ResourceSampler, growth, soak
+
+
+class Leak:
+    pass
+
+
+class TestSoak:
+    """Test resource growth detection and a short soak run."""
+
+    def test_growth(self):
+        """Test only floors rising in every segment beyond the tolerance count as growth."""
+        assert growth([10, 11, 12, 13, 14, 15, 16, 17], tolerance=0) == (10, 16)
+        assert growth([10, 11, 12, 13, 14, 15, 16, 17], tolerance=6) is None
+        # peaks of transient work on a flat floor
+        assert growth([10, 30, 10, 40, 10, 50, 10, 60], tolerance=0) is None
+        # grows and settles
+        assert growth([10, 20, 30, 40, 40, 40, 40, 40], tolerance=0) is None
+        assert growth([1, 2, 3], tolerance=0) is None
+        assert growth([1, 2, None, 4, 5, 6, 7, 8], tolerance=0) is None
+
+    def test_sampler_finds_leak(self):
+        """Test objects kept between samples are found, the samples themselves are not."""
+
+        async def run(leak: bool):
+            sampler = ResourceSampler()
+            kept = []
+            for tick in range(12):
+                if leak:
+                    kept.extend(Leak() for _ in range(100))
+                sampler.sample(tick)
+            return sampler
+
+        leaking = asyncio.run(run(leak=True))
+        assert leaking.growing()["objects"]["Leak"] == {"first": 400, "last": 1000}
+        assert leaking.growing(tolerances={"objects": 1000}) == {}
+        assert asyncio.run(run(leak=False)).growing() == {}
+        assert [s["tick"] for s in leaking.report(1000)] == list(range(12))
+
+    def test_soak(self):
+        """Test a short soak reconnects, samples and stays flat."""
+        report = asyncio.run(
+            soak(swing_prices(720), days=0.5, step_ms=60000, sample_every=1800,
+                 reconnect_every=3600, warmup=0.0)
+        )
+        assert report["ticks"] == 720
+        assert report["reconnects"] == 2 * 11
+        assert len(report["samples"]) == 24
+        assert report["samples"][-1]["hours"] == 12.0
+        assert report["ok"], report["growing"]
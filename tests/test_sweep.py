@@ -0,0 +1,77 @@
+"""
+Tests for the parameter sweep runner (sweep.py).
+"""
+import json
+
+import pytest
+
+from sweep import expand, format_table, group_points, parse_grid, rank, run_sweep
+from tests.test_backtest import CONFIG, swing_series
+
+
+class TestSweep:
+    """Test grid expansion and the resumable process-pool sweep."""
+
+    def test_parse_grid_types(self):
+        """Test values are converted to the StrategyConfig field types."""
+        grid = parse_grid(
+            ["MA_LENGTH=12,24", "amplitude_time_frame=60", "rebalance_isdynamic=true,false"]
+        )
+        assert grid == {
+            "ma_length": [12.0, 24.0],
+            "amplitude_time_frame": [60],
+            "rebalance_isdynamic": [True, False],
+        }
+        with pytest.raises(ValueError):
+            parse_grid(["unknown=1"])
+
+    def test_expand_grid_and_sample(self):
+        """Test full expansion and distinct random samples."""
+        grid = {"ma_length": [12.0, 24.0, 48.0], "range": [25.0, 50.0]}
+        assert len(expand(grid)) == 6
+        sample = expand(grid, samples=4, seed=1)
+        assert len(sample) == 4
+        assert len({json.dumps(p, sort_keys=True) for p in sample}) == 4
+        assert all(p["ma_length"] in grid["ma_length"] for p in sample)
+        assert sample == expand(grid, samples=4, seed=1)
+
+    def test_group_points(self):
+        """Test points are grouped by MA length and amplitude window, in chunks."""
+        points = expand({"ma_length": [12.0, 24.0], "rebalance_top": [1.0, 2.0, 3.0]})
+        groups = group_points(points, CONFIG, size=2)
+        assert sorted(len(g) for g in groups) == [1, 1, 2, 2]
+        assert all(len({p["ma_length"] for p in g}) == 1 for g in groups)
+        tops = sorted(p["rebalance_top"] for g in groups for p in g)
+        assert tops == [1.0, 1.0, 2.0, 2.0, 3.0, 3.0]
+
+    def test_sweep_resumes(self, tmp_path):
+        """Test results stream to the file and finished points are skipped."""
+        timestamps, prices = swing_series(n=30000)
+        points = expand({"rebalance_top": [1.0, 2.0], "min_ratio": [0.01, 0.995]})
+        options = {"quote_balance": 1000.0, "base_balance": 0.005, "ath": 110000.0}
+        results = str(tmp_path / "sweep.jsonl")
+
+        rows = run_sweep(
+            timestamps, prices, points, results, workers=2, base_config=CONFIG, options=options
+        )
+        # min_ratio above max_ratio is not a valid strategy
+        assert len(rows) == 2
+        assert len(open(results).read().splitlines()) == 2
+
+        again = run_sweep(
+            timestamps, prices, points, results, workers=2, base_config=CONFIG, options=options
+        )
+        assert sorted(json.dumps(r, sort_keys=True) for r in again) == sorted(
+            json.dumps(r, sort_keys=True) for r in rows
+        )
+        assert len(open(results).read().splitlines()) == 2
+
+    def test_rank_table(self):
+        """Test rows are ranked by the metric, missing values last."""
+        rows = [
+            {"params": {"ma_length": 12.0}, "result": {"return_percent": 1.0}},
+            {"params": {"ma_length": 24.0}, "result": {"return_percent": 3.0}},
+            {"params": {"ma_length": 48.0}, "result": {"return_percent": None}},
+        ]
+        assert [r["params"]["ma_length"] for r in rank(rows)] == [24.0, 12.0, 48.0]
+        assert format_table(rows, top=1).startswith('   1. {"ma_length": 24.0}')
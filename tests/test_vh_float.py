@@ -0,0 +1,1268 @@
+"""
+Tests for the ByBit spot trader core (vh_float.py).
+
+All tests run offline, network calls are replaced by local coroutines.
+"""
+import array as arr
+import asyncio
+import dataclasses
+import json
+import time
+
+import pytest
+
+from aiohttp import web
+
+from vh_float import (
+    AlertDispatcher,
+    Client,
+    InstrumentQuantizer,
+    LatencyHistogram,
+    LoopMonitor,
+    MetadataCache,
+    MultiSymbolTrader,
+    MultiAccountTrader,
+    OrderManager,
+    RET_DUPLICATE_ORDER_LINK_ID,
+    RET_INSUFFICIENT_BALANCE,
+    WSClient,
+    BalanceCache,
+    TradeAnalyse,
+    Trader,
+    FrameDeduplicator,
+    TokenBucket,
+    RequestScheduler,
+    Resampler,
+    StrategyConfig,
+    ShadowBook,
+    StreamSession,
+    PRIORITY_ORDER,
+    PRIORITY_POLL,
+    RET_RATE_LIMIT,
+)
+
+
+class TestRequestScheduler:
+    """Test rate-limit aware request scheduling."""
+
+    def test_classify_endpoints(self):
+        """Test endpoints are mapped to their rate-limit class."""
+        scheduler = RequestScheduler()
+        assert scheduler.classify("v5/order/create") == "order"
+        assert scheduler.classify("/v5/account/wallet-balance") == "account"
+        assert scheduler.classify("/v5/market/instruments-info") == "market"
+
+    def test_reserve_kept_for_orders(self):
+        """Test low priority requests cannot drain the reserved tokens."""
+        bucket = TokenBucket(rate=1.0, capacity=3.0, reserve=2.0)
+        assert bucket.take(PRIORITY_POLL) == 0.0
+        assert bucket.take(PRIORITY_POLL) > 0.0
+        assert bucket.take(PRIORITY_ORDER) == 0.0
+        assert bucket.take(PRIORITY_ORDER) == 0.0
+
+    def test_headers_update_bucket(self):
+        """Test exhausted quota from headers blocks the bucket."""
+        scheduler = RequestScheduler()
+        headers = {
+            "X-Bapi-Limit": "10",
+            "X-Bapi-Limit-Status": "0",
+            "X-Bapi-Limit-Reset-Timestamp": "0",
+        }
+        scheduler.update("account", headers)
+        assert scheduler.buckets["account"].take(PRIORITY_POLL) > 0.0
+        assert scheduler.buckets["order"].take(PRIORITY_ORDER) == 0.0
+
+    def test_rate_limit_ret_code_blocks(self):
+        """Test retCode 10006 without headers blocks the class for a while."""
+        scheduler = RequestScheduler()
+        scheduler.update("account", {}, RET_RATE_LIMIT)
+        assert scheduler.buckets["account"].take(PRIORITY_POLL) > 0.0
+        assert scheduler.stats["rate_limited"] == 1
+
+    def test_cancelled_caller_keeps_shared_request(self):
+        """Test cancelling the first caller does not cancel the other waiters."""
+        scheduler = RequestScheduler()
+
+        async def request():
+            await asyncio.sleep(0.01)
+            return {"retCode": 0}
+
+        async def run():
+            first = asyncio.create_task(scheduler.coalesce("wallet", request))
+            await asyncio.sleep(0)
+            second = asyncio.create_task(scheduler.coalesce("wallet", request))
+            await asyncio.sleep(0)
+            first.cancel()
+            return await second, first.cancelled()
+
+        result, cancelled = asyncio.run(run())
+        assert result == {"retCode": 0} and cancelled
+        assert scheduler.stats["coalesced"] == 1
+        assert not scheduler._inflight
+
+    def test_coalesce_identical_requests(self):
+        """Test concurrent identical GETs share one round-trip."""
+        scheduler = RequestScheduler()
+        calls = []
+
+        async def request():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return {"retCode": 0}
+
+        async def run():
+            return await asyncio.gather(
+                *[scheduler.coalesce(("wallet", "UNIFIED"), request) for _ in range(5)]
+            )
+
+        results = asyncio.run(run())
+        assert len(calls) == 1
+        assert all(r == {"retCode": 0} for r in results)
+        assert scheduler.stats["coalesced"] == 4
+
+
+class TestFrameDeduplicator:
+    """Test merging of redundant public connections."""
+
+    def test_first_frame_wins(self):
+        """Test a frame is delivered once, from the connection that was first."""
+        received = []
+        feed = FrameDeduplicator(received.append, connections=2)
+        first, second = feed.handler(0), feed.handler(1)
+
+        frame = {"topic": "kline.1.BTCUSDT", "ts": 1000, "data": []}
+        second(frame)
+        first(dict(frame))
+        first({"topic": "kline.1.BTCUSDT", "ts": 1001, "data": []})
+        second({"topic": "kline.1.BTCUSDT", "ts": 1001, "data": []})
+
+        assert [m["ts"] for m in received] == [1000, 1001]
+        assert feed.accepted == [1, 1]
+        assert feed.dropped == [1, 1]
+
+    def test_older_frames_dropped(self):
+        """Test a lagging connection cannot move the stream back in time."""
+        received = []
+        feed = FrameDeduplicator(received.append, connections=2)
+        feed.handler(0)({"topic": "kline.1.BTCUSDT", "ts": 2000})
+        feed.handler(1)({"topic": "kline.1.BTCUSDT", "ts": 1500})
+        assert len(received) == 1
+
+    def test_trades_with_same_ts_kept(self):
+        """Test distinct publicTrade frames of one millisecond are all delivered."""
+        received = []
+        feed = FrameDeduplicator(received.append, connections=2)
+        first, second = feed.handler(0), feed.handler(1)
+
+        def trades(*ids):
+            data = [{"i": i, "p": "100000", "v": "0.001"} for i in ids]
+            return {"topic": "publicTrade.BTCUSDT", "ts": 1000, "data": data}
+
+        first(trades("1", "2"))
+        second(trades("1", "2"))
+        second(trades("3"))
+        first(trades("3"))
+        # a copy that overlaps an accepted frame only delivers the new trades
+        first(trades("3", "4"))
+
+        assert [[t["i"] for t in m["data"]] for m in received] == [["1", "2"], ["3"], ["4"]]
+        assert feed.accepted == [2, 1]
+        assert feed.dropped == [1, 1]
+
+    def test_control_frames_pass_through(self):
+        """Test frames without topic (subscribe responses) are not filtered."""
+        received = []
+        feed = FrameDeduplicator(received.append, connections=2)
+        feed.handler(0)({"op": "subscribe", "success": True})
+        feed.handler(1)({"op": "subscribe", "success": True})
+        assert len(received) == 2
+
+
+def wallet_msg(creation_time, btc, usdt):
+    """Build a private wallet topic message."""
+    return {
+        "topic": "wallet",
+        "creationTime": creation_time,
+        "data": [
+            {
+                "coin": [
+                    {"coin": "BTC", "equity": str(btc)},
+                    {"coin": "USDT", "equity": str(usdt)},
+                ]
+            }
+        ],
+    }
+
+
+class TestBalanceCache:
+    """Test the wallet stream balance cache."""
+
+    def test_stream_updates_trader_balance(self, tmp_path):
+        """Test wallet messages update native_balance without REST."""
+        trader = Trader(loop=None, key="", secret="", data_dir=str(tmp_path))
+        trader.last_price = 100000.0
+        trader.message_handler(wallet_msg(1000, 0.01, 500.0))
+
+        assert trader.ta.native_balance == (0.01, 500.0)
+        assert trader.balances.source == "stream"
+        assert trader.balances.age < 1.0
+        assert not trader.balances.needs_reconcile.is_set()
+
+    def test_sequence_break_requests_reconcile(self):
+        """Test an out of order wallet message is ignored and triggers REST."""
+        cache = BalanceCache()
+        assert cache.apply_stream(wallet_msg(2000, 0.02, 400.0))
+        assert cache.apply_stream(wallet_msg(1000, 0.01, 500.0)) == []
+        assert cache.coins["BTC"] == 0.02
+        assert cache.needs_reconcile.is_set()
+
+    def test_rest_reconcile_drops_sold_coin(self, tmp_path):
+        """Test a coin missing from the REST snapshot is removed and zeroed."""
+        trader = Trader(loop=None, key="", secret="", data_dir=str(tmp_path))
+        trader.last_price = 100000.0
+        trader.message_handler(wallet_msg(1000, 0.01, 500.0))
+        coins = trader.balances.apply_rest([{"coin": "USDT", "equity": "1500"}])
+        trader.get_pair_balance(coins)
+
+        assert trader.balances.coins == {"USDT": 1500.0}
+        assert {"coin": "BTC", "equity": "0"} in coins
+        assert trader.ta.native_balance == (0.0, 1500.0)
+
+    def test_rest_reconcile(self):
+        """Test REST snapshot is recorded as reconciliation."""
+        cache = BalanceCache()
+        assert cache.is_empty and cache.age is None
+        cache.apply_rest([{"coin": "USDT", "equity": "12.5"}])
+        assert cache.coins == {"USDT": 12.5}
+        assert cache.source == "rest"
+        assert cache.reconciles == 1
+
+
+async def start_ws_server(handler):
+    """Start a local WebSocket server, returns (runner, url)."""
+    app = web.Application()
+    app.router.add_get("/ws", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"ws://127.0.0.1:{port}/ws"
+
+
+class TestWSClient:
+    """Test WebSocket session management against a local server."""
+
+    def test_reconnect_after_drop(self):
+        """Test a dropped connection is resubscribed well under a second."""
+        connections = []
+
+        async def handler(request):
+            ws = web.WebSocketResponse()
+            await ws.prepare(request)
+            connections.append(ws)
+            msg = await ws.receive_json()
+            await ws.send_json({"op": msg["op"], "success": True})
+            await ws.send_json({"topic": "kline.1.BTCUSDT", "ts": len(connections)})
+            if len(connections) == 1:
+                await ws.close()
+            else:
+                async for _ in ws:
+                    pass
+            return ws
+
+        async def run():
+            runner, url = await start_ws_server(handler)
+            received = []
+            client = WSClient(None, url, "key", "secret")
+            task = asyncio.create_task(
+                client.start({"op": "subscribe", "args": []}, received.append)
+            )
+            for _ in range(100):
+                if len(received) == 2:
+                    break
+                await asyncio.sleep(0.01)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            await client.close()
+            await runner.cleanup()
+            return received, client.stats()
+
+        received, stats = asyncio.run(run())
+        assert [m["ts"] for m in received] == [1, 2]
+        assert stats["reconnects"] == 1
+        assert stats["last_downtime"] < 1.0
+
+    def test_stale_connection_detected(self):
+        """Test a connection without frames is dropped by the watchdog."""
+        connections = []
+
+        async def handler(request):
+            ws = web.WebSocketResponse()
+            await ws.prepare(request)
+            connections.append(ws)
+            msg = await ws.receive_json()
+            await ws.send_json({"op": msg["op"], "success": True})
+            # never answer pings
+            async for _ in ws:
+                pass
+            return ws
+
+        async def run():
+            runner, url = await start_ws_server(handler)
+            client = WSClient(None, url, "key", "secret", ping_interval=1.0, stale_timeout=0.1)
+            task = asyncio.create_task(client.start({"op": "subscribe", "args": []}, print))
+            for _ in range(100):
+                if client.stale_disconnects and client.reconnects:
+                    break
+                await asyncio.sleep(0.01)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            await client.close()
+            await runner.cleanup()
+            return client.stats()
+
+        stats = asyncio.run(run())
+        assert stats["stale_disconnects"] >= 1
+        assert stats["reconnects"] >= 1
+
+    def test_auth_waits_for_acknowledgement(self):
+        """Test subscribe is sent only after the auth acknowledgement."""
+        ops = []
+
+        async def handler(request):
+            ws = web.WebSocketResponse()
+            await ws.prepare(request)
+            for _ in range(2):
+                msg = await ws.receive_json()
+                ops.append(msg["op"])
+                await ws.send_str(json.dumps({"op": msg["op"], "success": True}))
+            await ws.send_json({"topic": "wallet", "data": []})
+            async for _ in ws:
+                pass
+            return ws
+
+        async def run():
+            runner, url = await start_ws_server(handler)
+            received = []
+            client = WSClient(None, url, "key", "secret")
+            task = asyncio.create_task(
+                client.start(
+                    {"op": "subscribe", "args": ["wallet"]}, received.append, need_auth=True
+                )
+            )
+            for _ in range(100):
+                if received:
+                    break
+                await asyncio.sleep(0.01)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            await client.close()
+            await runner.cleanup()
+            return received
+
+        received = asyncio.run(run())
+        assert ops == ["auth", "subscribe"]
+        assert received == [{"topic": "wallet", "data": []}]
+
+
+class TestAlertDispatcher:
+    """Test Telegram alert delivery against a local stand-in server."""
+
+    def run_dispatcher(self, responses, messages, maxsize=100):
+        """Send messages through a dispatcher, returns (received texts, stats)."""
+        received = []
+
+        async def send_message(request):
+            received.append(await request.json())
+            status, body = responses.pop(0) if responses else (200, {"ok": True})
+            return web.json_response(body, status=status)
+
+        async def run():
+            app = web.Application()
+            app.router.add_post("/bottoken/sendMessage", send_message)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            await site.start()
+            port = site._server.sockets[0].getsockname()[1]
+
+            alerts = AlertDispatcher(
+                "token",
+                "42",
+                base_url=f"http://127.0.0.1:{port}",
+                maxsize=maxsize,
+                batch_window=0.01,
+            )
+            for msg in messages:
+                alerts.send(msg)
+            task = asyncio.create_task(alerts.run())
+            for _ in range(200):
+                done = alerts.stats["sent"] + alerts.stats["failed"]
+                if alerts.queue.empty() and done >= len(messages) - alerts.stats["dropped"]:
+                    break
+                await asyncio.sleep(0.01)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            await runner.cleanup()
+            return alerts.stats
+
+        stats = asyncio.run(run())
+        return received, stats
+
+    def test_burst_coalesced(self):
+        """Test a burst of alerts is delivered as one message."""
+        received, stats = self.run_dispatcher([], ["B: 1", "S: 2", "B: 3"])
+        assert len(received) == 1
+        assert received[0]["text"] == "B: 1\nS: 2\nB: 3"
+        assert received[0]["chat_id"] == "42"
+        assert stats["sent"] == 3 and stats["batches"] == 1
+
+    def test_rate_limit_retry(self):
+        """Test HTTP 429 is retried after retry_after."""
+        limited = (429, {"ok": False, "error_code": 429, "parameters": {"retry_after": 0}})
+        received, stats = self.run_dispatcher([limited], ["B: 1"])
+        assert len(received) == 2
+        assert stats["rate_limited"] == 1
+        assert stats["sent"] == 1
+
+    def test_full_queue_drops_oldest(self):
+        """Test send never blocks, the oldest alert is dropped."""
+        received, stats = self.run_dispatcher([], ["1", "2", "3"], maxsize=2)
+        assert received[0]["text"] == "2\n3"
+        assert stats["dropped"] == 1
+
+    def test_disabled_without_token(self):
+        """Test alerts are ignored when Telegram is not configured."""
+        alerts = AlertDispatcher("", "")
+        alerts.send("B: 1")
+        assert alerts.queue.empty()
+
+
+def make_analyse(**state):
+    """TradeAnalyse with indicator state ready for a signal check."""
+    ta = TradeAnalyse(["BTC", "USDT"], log_file="/dev/null")
+    ta.ma_trend_prev = 100.0
+    ta.ma_trend = 110.0
+    ta.ma_fast_m = 100.0
+    ta.local_range = 50
+    for name, value in state.items():
+        setattr(ta, name, value)
+    return ta
+
+
+class TestTradeSignal:
+    """Test crossover detection and rebalance decisions."""
+
+    def test_buy_on_crossover(self):
+        """Test crossover in an uptrend with enough spread gives a buy."""
+        ta = make_analyse(percent_diff=-5.0, trade_profit=-50.0, price_diff=-100.0)
+        ta.trade_signal()
+        ta.ma_fast_m = 120.0
+        assert ta.trade_signal() == (True, "buy")
+        # no repeated signal while fast EMA stays above
+        assert ta.trade_signal() == (False, None)
+
+    def test_no_buy_below_threshold(self):
+        """Test crossover without rebalance spread is only reported."""
+        ta = make_analyse(percent_diff=-1.0, trade_profit=-10.0, price_diff=-100.0)
+        ta.trade_signal()
+        ta.ma_fast_m = 120.0
+        assert ta.trade_signal() == (True, None)
+
+    def test_sell_on_crossunder(self):
+        """Test crossunder in a downtrend with profit gives a sell."""
+        ta = make_analyse(
+            ma_trend_prev=120.0,
+            ma_fast_m=120.0,
+            percent_diff=5.0,
+            trade_profit=50.0,
+            price_diff=100.0,
+        )
+        ta.trade_signal()
+        ta.ma_fast_m = 100.0
+        assert ta.trade_signal() == (True, "sell")
+
+    def test_monitor_wakes_trader(self, tmp_path):
+        """Test a live tick sets the trader event without polling."""
+        trader = Trader(loop=None, key="", secret="", data_dir=str(tmp_path))
+        trader.ta.prices.extend([100.0, 100.0])
+        assert not trader.indicators_updated.is_set()
+        trader.ticker_handler(
+            {"topic": f"kline.1.{trader.symbol}", "data": [{"close": "101.0", "end": 1}]}
+        )
+        assert trader.indicators_updated.is_set()
+
+
+class TestLatency:
+    """Test latency histograms and tick instrumentation."""
+
+    def test_histogram_buckets(self):
+        """Test samples land in power-of-two microsecond buckets."""
+        hist = LatencyHistogram()
+        for ns in (500, 3_000, 3_500, 1_000_000):
+            hist.record(ns)
+        assert hist.counts[0] == 1
+        assert hist.counts[2] == 2
+        assert hist.count == 4
+        assert hist.percentile(50) == 0.004
+        assert hist.snapshot()["max_ms"] == 1.0
+
+    def test_tick_stages_recorded(self, tmp_path):
+        """Test a tick records frame and monitor stages."""
+        trader = Trader(loop=None, key="", secret="", data_dir=str(tmp_path))
+        trader.ta.prices.extend([100.0, 100.0])
+        trader.ticker_handler(
+            {"topic": f"kline.1.{trader.symbol}", "data": [{"close": "101.0", "end": 1}]}
+        )
+        stages = trader.latency.snapshot()
+        assert stages["frame_to_handler"]["count"] == 1
+        assert stages["monitor"]["count"] == 1
+        assert stages["order_ack"]["count"] == 0
+
+
+class TestLoopMonitor:
+    """Test event loop lag, handler timing and slow callback capture."""
+
+    def test_blocked_loop_recorded(self):
+        """Test a handler blocking the loop is recorded with its name and stack."""
+
+        def block(seconds):
+            time.sleep(seconds)
+
+        async def run():
+            monitor = LoopMonitor(slow_threshold=0.05)
+            probe = asyncio.create_task(monitor.run())
+            await asyncio.sleep(0.05)
+            loop = asyncio.get_running_loop()
+            loop.call_soon(monitor.timed("block", block), 0.25)
+            await asyncio.sleep(0.1)
+            probe.cancel()
+            await asyncio.gather(probe, return_exceptions=True)
+            return monitor
+
+        snapshot = asyncio.run(run()).snapshot()
+        assert not snapshot["running"]
+        assert snapshot["handlers"]["block"]["count"] == 1
+        assert snapshot["handlers"]["block"]["busy_s"] >= 0.25
+        assert snapshot["lag"]["max_ms"] >= 150.0
+        assert snapshot["stalls"] == 1
+        slow = snapshot["slow"][0]
+        assert slow["handler"] == "block" and slow["lag_ms"] >= 150.0
+        assert slow["stack"][-1].endswith(" block")
+
+    def test_track_coroutine(self):
+        """Test tracked coroutine steps are timed, results and cancellation pass through."""
+        monitor = LoopMonitor()
+
+        async def steps():
+            for _ in range(3):
+                time.sleep(0.01)
+                await asyncio.sleep(0)
+            return "done"
+
+        async def forever():
+            await asyncio.Event().wait()
+
+        async def run():
+            result = await monitor.track(steps())
+            task = asyncio.create_task(monitor.track(forever()))
+            await asyncio.sleep(0)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            return result, task
+
+        result, task = asyncio.run(run())
+        assert result == "done" and task.cancelled()
+        assert monitor.handlers["steps"].count == 4
+        assert monitor.handlers["steps"].total_ns >= 30_000_000
+        assert monitor.handlers["forever"].count == 2
+        assert monitor.current is None
+
+    def test_trader_handlers_timed(self, tmp_path):
+        """Test the trader times its handlers only with a monitor."""
+        trader = Trader(loop=None, key="", secret="", data_dir=str(tmp_path))
+        assert trader.timed("ticker_handler", trader.ticker_handler) == trader.ticker_handler
+
+        trader.loop_monitor = LoopMonitor()
+        handler = trader.timed("ticker_handler", trader.ticker_handler)
+        trader.ta.prices.extend([100.0, 100.0])
+        handler({"topic": f"kline.1.{trader.symbol}", "data": [{"close": "101.0", "end": 1}]})
+        assert trader.last_price == 101.0
+        assert trader.loop_monitor.snapshot()["handlers"]["ticker_handler"]["count"] == 1
+
+
+LOT_SIZE_FILTER = {
+    "basePrecision": "0.000001",
+    "quotePrecision": "0.00000001",
+    "minOrderQty": "0.000048",
+    "maxOrderQty": "71.73956243",
+    "minOrderAmt": "1",
+    "maxOrderAmt": "2000000",
+}
+
+
+class TestInstrumentQuantizer:
+    """Test exact lot-step quantization and order payloads."""
+
+    def test_sell_rounds_down_to_base_precision(self):
+        """Test base quantities are floored, never rounded up."""
+        q = InstrumentQuantizer.from_lot_size_filter("BTCUSDT", LOT_SIZE_FILTER)
+        assert q.quantize("Sell", 0.0123456789) == "0.012345"
+        assert q.quantize("Sell", 1.5) == "1.500000"
+        assert q.quantize("Sell", 12.0000009) == "12.000000"
+
+    def test_buy_uses_quote_precision(self):
+        """Test quote amounts of any magnitude keep all significant digits."""
+        q = InstrumentQuantizer.from_lot_size_filter("BTCUSDT", LOT_SIZE_FILTER)
+        assert q.quantize("Buy", 12345.678912345) == "12345.67891234"
+        assert q.quantize("Buy", 0.29 * 100) == "29.00000000"
+
+    def test_minimums(self):
+        """Test quantities below minOrderQty/minOrderAmt are rejected locally."""
+        q = InstrumentQuantizer.from_lot_size_filter("BTCUSDT", LOT_SIZE_FILTER)
+        assert q.quantize("Sell", 0.000047) is None
+        assert q.quantize("Buy", 0.99) is None
+        assert q.payload("Buy", 0.5) is None
+
+    def test_payload_template(self):
+        """Test the payload is valid order create JSON."""
+        q = InstrumentQuantizer.from_lot_size_filter("BTCUSDT", LOT_SIZE_FILTER)
+        payload = json.loads(q.payload("Sell", 0.5, order_link_id="vh-1"))
+        assert payload == {
+            "category": "spot",
+            "symbol": "BTCUSDT",
+            "side": "Sell",
+            "orderType": "Market",
+            "qty": "0.500000",
+            "timeInForce": "IOC",
+            "orderLinkId": "vh-1",
+            "isLeverage": 0,
+        }
+
+    def test_coarse_step(self):
+        """Test non-unit steps and integer precision."""
+        q = InstrumentQuantizer("DOGEUSDT", base_precision="1", quote_precision="0.0005")
+        assert q.quantize("Sell", 123.9) == "123"
+        assert q.quantize("Buy", 1.2349) == "1.2345"
+
+
+class ScriptedOrderClient:
+    """Stand-in REST client answering market orders from a script."""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = []
+        self.batches = []
+
+    async def batch_orders(self, orders):
+        self.batches.append(list(orders))
+        return self.responses.pop(0)
+
+    async def market_order(self, symbol, side, quantity_size, order_link_id=""):
+        self.calls.append((order_link_id, quantity_size))
+        resp = self.responses.pop(0)
+        if isinstance(resp, Exception):
+            raise resp
+        return resp
+
+
+def order_resp(ret_code, status=200):
+    return {"retCode": ret_code, "retMsg": "", "result": {"orderId": "1"}}, status
+
+
+class TestOrderManager:
+    """Test asynchronous order placement with idempotent orderLinkIds."""
+
+    def place(self, client, qty=0.01):
+        async def run():
+            manager = OrderManager(client, retry_delay=0.001)
+            order = manager.submit("BTCUSDT", "Sell", qty)
+            assert manager.in_flight("BTCUSDT")
+            await manager.wait(order)
+            return manager, order
+
+        return asyncio.run(run())
+
+    def test_retry_reuses_link_id(self):
+        """Test timeouts and retryable codes are retried with the same id."""
+        client = ScriptedOrderClient(
+            TimeoutError(), order_resp(10016), order_resp(0)
+        )
+        manager, order = self.place(client)
+        assert order.state == "acked"
+        assert len({link_id for link_id, _ in client.calls}) == 1
+        assert len(client.calls[0][0]) <= 36
+        assert manager.in_flight("BTCUSDT")
+
+    def test_duplicate_is_acked(self):
+        """Test a duplicate orderLinkId answer means the first attempt was placed."""
+        client = ScriptedOrderClient(
+            TimeoutError(), order_resp(RET_DUPLICATE_ORDER_LINK_ID)
+        )
+        _, order = self.place(client)
+        assert order.state == "acked"
+        assert len(client.calls) == 2
+
+    def test_insufficient_balance_new_id(self):
+        """Test a balance reject is retried smaller under a new id."""
+        client = ScriptedOrderClient(order_resp(RET_INSUFFICIENT_BALANCE), order_resp(0))
+        manager, order = self.place(client)
+        (first, qty1), (second, qty2) = client.calls
+        assert first != second and second.startswith(first)
+        assert qty2 < qty1
+        assert manager.orders[second] is order
+
+    def test_reject_is_final(self):
+        """Test non retryable errors end the order without retries."""
+        client = ScriptedOrderClient(order_resp(170136, status=200))
+        manager, order = self.place(client)
+        assert order.state == "rejected"
+        assert len(client.calls) == 1
+        assert not manager.in_flight("BTCUSDT")
+
+    def test_fill_accounted_once(self):
+        """Test repeated and partial fill events are accounted once."""
+        manager, order = self.place(ScriptedOrderClient(order_resp(0)))
+        event = {"orderLinkId": order.link_id, "orderId": "1", "avgPrice": "100"}
+        assert not manager.on_order_event(dict(event, orderStatus="PartiallyFilled"))
+        assert manager.on_order_event(
+            dict(event, orderStatus="Filled", cumExecQty="0.01")
+        )
+        assert not manager.on_order_event(dict(event, orderStatus="Filled"))
+        assert order.state == "filled" and order.avg_price == 100.0
+        assert not manager.in_flight("BTCUSDT")
+
+        # orders placed elsewhere are deduplicated by orderId
+        other = {"orderLinkId": "", "orderId": "2", "orderStatus": "Filled"}
+        assert manager.on_order_event(other)
+        assert not manager.on_order_event(other)
+
+
+class TestBatchOrders:
+    """Test v5/order/create-batch placement."""
+
+    def test_chunks_and_per_order_results(self):
+        """Test orders are chunked by 10 and results keep the input order."""
+        requests = []
+
+        async def create_batch(request):
+            body = await request.json()
+            requests.append(body)
+            items = body["request"]
+            return web.json_response(
+                {
+                    "retCode": 0,
+                    "retMsg": "OK",
+                    "result": {"list": [{"orderId": o["orderLinkId"]} for o in items]},
+                    "retExtInfo": {
+                        "list": [
+                            {"code": 170131 if o["symbol"] == "ETHUSDT" else 0, "msg": ""}
+                            for o in items
+                        ]
+                    },
+                }
+            )
+
+        async def run():
+            app = web.Application()
+            app.router.add_post("/v5/order/create-batch", create_batch)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            await site.start()
+            port = site._server.sockets[0].getsockname()[1]
+
+            client = Client(None, f"http://127.0.0.1:{port}/", "key", "secret")
+            orders = [("BTCUSDT", "Sell", 0.01, f"id-{i}") for i in range(11)]
+            orders[3] = ("ETHUSDT", "Sell", 0.5, "id-3")
+            orders.append(("BTCUSDT", "Sell", 0.0, "id-low"))
+            try:
+                return await client.batch_orders(orders)
+            finally:
+                await client.session.close()
+                await runner.cleanup()
+
+        results = asyncio.run(run())
+        assert sorted(len(body["request"]) for body in requests) == [1, 10]
+        assert all(body["category"] == "spot" for body in requests)
+        assert results[0] == (200, 0, "", "id-0")
+        assert results[3][1] == 170131
+        assert results[10][3] == "id-10"
+        assert results[11][:2] == (400, -1)
+
+    def test_partial_failure_retried(self):
+        """Test only failed orders of a batch are sent again, with the same ids."""
+        client = ScriptedOrderClient(
+            [(200, 0, "OK", "1"), (200, 10016, "busy", ""), (200, 170136, "bad", "")],
+            [(200, 0, "OK", "2")],
+        )
+
+        async def run():
+            manager = OrderManager(client, retry_delay=0.001)
+            orders = manager.submit_batch(
+                [("BTCUSDT", "Sell", 0.01), ("ETHUSDT", "Buy", 20.0), ("SOLUSDT", "Sell", 1.0)]
+            )
+            await asyncio.gather(*(manager.wait(order) for order in orders))
+            return orders
+
+        first, second, third = asyncio.run(run())
+        assert [first.state, second.state, third.state] == ["acked", "acked", "rejected"]
+        assert client.batches[1] == [("ETHUSDT", "Buy", 20.0, second.link_id)]
+        assert second.order_id == "2" and second.attempts == 2
+
+
+class MetadataClient:
+    """Stand-in REST client counting metadata requests."""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.calls = []
+
+    async def instrument_info(self, symbol):
+        self.calls.append("instrument")
+        if self.fail:
+            raise TimeoutError()
+        return {"result": {"list": [{"lotSizeFilter": LOT_SIZE_FILTER}]}}
+
+    async def fee_rate(self, symbol):
+        self.calls.append("fee")
+        if self.fail:
+            raise TimeoutError()
+        return {
+            "result": {
+                "list": [{"symbol": symbol, "takerFeeRate": "0.0008", "makerFeeRate": "0.0006"}]
+            }
+        }
+
+    def register_instrument(self, symbol, lot_size_filter):
+        return InstrumentQuantizer.from_lot_size_filter(symbol, lot_size_filter)
+
+
+class TestMetadataCache:
+    """Test persisted instrument and fee metadata."""
+
+    def test_ttl_and_persistence(self, tmp_path):
+        """Test entries survive a reload and expire after the TTL."""
+        cache = MetadataCache(tmp_path / "metadata.json", ttl=60.0)
+        assert cache.get("fee", "BTCUSDT") is None
+        cache.set("fee", "BTCUSDT", {"takerFeeRate": "0.001"})
+
+        reloaded = MetadataCache(tmp_path / "metadata.json", ttl=60.0)
+        assert reloaded.get("fee", "BTCUSDT") == {"takerFeeRate": "0.001"}
+
+        reloaded.entries["fee"]["BTCUSDT"]["updated"] -= 61.0
+        assert reloaded.expired("fee", "BTCUSDT")
+        assert reloaded.get("fee", "BTCUSDT") is None
+        assert reloaded.get("fee", "BTCUSDT", allow_stale=True) is not None
+
+    def test_restart_skips_requests(self, tmp_path):
+        """Test a second start uses the cache and the account taker fee."""
+
+        async def start(client):
+            trader = Trader(loop=None, key="", secret="", data_dir=str(tmp_path))
+            trader.client = client
+            await trader.Get_instrument_info(100000.0)
+            await trader.Get_fee_rate()
+            return trader
+
+        first = MetadataClient()
+        trader = asyncio.run(start(first))
+        assert first.calls == ["instrument", "fee"]
+        assert trader.ta.fee == 0.0008
+        assert trader.minOrderQty == 0.000048
+
+        second = MetadataClient()
+        trader = asyncio.run(start(second))
+        assert second.calls == []
+        assert trader.ta.fee == 0.0008
+
+    def test_stale_fallback(self, tmp_path):
+        """Test expired metadata is still used when the exchange is unreachable."""
+        cache = MetadataCache(tmp_path / "metadata.json", ttl=0.0)
+        cache.set("fee", "BTCUSDT", {"takerFeeRate": "0.0009", "makerFeeRate": "0.0007"})
+
+        async def run():
+            trader = Trader(loop=None, key="", secret="", data_dir=str(tmp_path))
+            trader.metadata.ttl = 0.0
+            trader.client = MetadataClient(fail=True)
+            await trader.Get_fee_rate()
+            return trader
+
+        assert asyncio.run(run()).ta.fee == 0.0009
+
+
+class TestMultiSymbolTrader:
+    """Test several pairs sharing one account and one set of connections."""
+
+    def make(self, tmp_path, coins=("BTC", "ETH"), allocations=None):
+        mt = MultiSymbolTrader(
+            None, "", "", coins=list(coins), data_dir=str(tmp_path), allocations=allocations
+        )
+        for tr in mt.traders.values():
+            tr.last_price = 100.0
+            tr.ta.prices.extend([100.0, 100.0])
+        return mt
+
+    def test_per_symbol_files(self, tmp_path):
+        """Test every pair keeps its files in its own directory."""
+        mt = self.make(tmp_path)
+        assert set(mt.traders) == {"BTCUSDT", "ETHUSDT"}
+        assert (tmp_path / "ETHUSDT").is_dir()
+        assert mt.traders["ETHUSDT"].state_file == str(tmp_path / "ETHUSDT" / "ETHUSDT.json")
+        assert all(tr.orders is mt.orders for tr in mt.traders.values())
+
+    def test_frames_routed_by_topic(self, tmp_path):
+        """Test one public stream feeds the matching strategy only."""
+        mt = self.make(tmp_path)
+        assert mt.ticker_topics() == ["kline.1.BTCUSDT", "kline.1.ETHUSDT"]
+        mt.ticker_handler({"topic": "kline.1.ETHUSDT", "data": [{"close": "101.0", "end": 1}]})
+        assert mt.traders["ETHUSDT"].last_price == 101.0
+        assert mt.traders["ETHUSDT"].indicators_updated.is_set()
+        assert mt.traders["BTCUSDT"].last_price == 100.0
+        assert not mt.traders["BTCUSDT"].indicators_updated.is_set()
+
+    def test_wallet_split_by_allocation(self, tmp_path):
+        """Test the shared quote balance is divided between the pairs."""
+        mt = self.make(tmp_path, allocations={"BTC": 0.75, "ETH": 0.25})
+        msg = wallet_msg(1000, 0.01, 400.0)
+        msg["data"][0]["coin"].append({"coin": "ETH", "equity": "2"})
+        mt.message_handler(msg)
+        assert mt.traders["BTCUSDT"].ta.native_balance == (0.01, 300.0)
+        assert mt.traders["ETHUSDT"].ta.native_balance == (2.0, 100.0)
+        assert mt.balances.stream_updates == 1
+
+    def test_fill_keeps_other_pairs_balance(self, tmp_path):
+        """Test a fill of one pair moves its quote ledger only."""
+        mt = self.make(tmp_path)
+        btc, eth = mt.traders["BTCUSDT"], mt.traders["ETHUSDT"]
+        msg = wallet_msg(1000, 0.01, 400.0)
+        msg["data"][0]["coin"].append({"coin": "ETH", "equity": "2"})
+        mt.message_handler(msg)
+        eth.ta.calculate_profit(100.0)
+        percent_diff = eth.ta.percent_diff
+
+        fill = {
+            "symbol": "BTCUSDT", "side": "Buy", "orderType": "Market", "orderStatus": "Filled",
+            "orderId": "9", "avgPrice": "100", "qty": "150", "cumExecValue": "150",
+        }
+        mt.message_handler({"topic": "order", "data": [fill]})
+        assert btc.ta.native_balance[1] == 50.0
+        # the wallet stream reports the account total after the fill
+        msg = wallet_msg(1001, 1.51, 250.0)
+        msg["data"][0]["coin"].append({"coin": "ETH", "equity": "2"})
+        mt.message_handler(msg)
+
+        assert btc.ta.native_balance == (1.51, 50.0)
+        assert eth.ta.native_balance == (2.0, 200.0)
+        eth.ta.calculate_profit(100.0)
+        assert eth.ta.percent_diff == percent_diff
+
+    def test_orders_routed_by_symbol(self, tmp_path):
+        """Test order events reach the trader of their symbol."""
+        mt = self.make(tmp_path)
+        handled = []
+        for symbol, tr in mt.traders.items():
+            tr.order_handler = lambda data, symbol=symbol: handled.append((symbol, data))
+        mt.message_handler(
+            {"topic": "order", "data": [{"symbol": "ETHUSDT"}, {"symbol": "XRPUSDT"}]}
+        )
+        assert handled == [("ETHUSDT", {"symbol": "ETHUSDT"})]
+
+    def test_orders_of_one_tick_batched(self, tmp_path):
+        """Test two pairs selling on the same tick place one create-batch request."""
+        mt = self.make(tmp_path)
+        client = ScriptedOrderClient([(200, 0, "OK", "1"), (200, 0, "OK", "2")])
+        mt.orders.client = client
+        for tr in mt.traders.values():
+            tr.ta.trade_profit = 50.0
+            tr.last_price = 100.0
+
+        async def run():
+            traders = list(mt.traders.values())
+            assert await asyncio.gather(*(tr.sell_signal() for tr in traders)) == [True, True]
+            await asyncio.sleep(0)
+            await asyncio.gather(*mt.orders.tasks)
+
+        asyncio.run(run())
+        assert client.calls == []
+        [batch] = client.batches
+        assert [(symbol, side, qty) for symbol, side, qty, _ in batch] == [
+            ("BTCUSDT", "Sell", 0.5),
+            ("ETHUSDT", "Sell", 0.5),
+        ]
+        assert mt.orders.in_flight("BTCUSDT") and mt.orders.in_flight("ETHUSDT")
+
+    def test_session_needs_ticker_handlers(self):
+        """Test a session without its ticker overrides fails when it is created."""
+
+        class NoTicker(StreamSession):
+            def ticker_topics(self):
+                return []
+
+        with pytest.raises(TypeError, match="ticker_handler"):
+            NoTicker()
+
+    def test_subscribe_requests_chunked(self):
+        """Test topics beyond the per-request limit are subscribed in several requests."""
+        requests = []
+
+        async def handler(request):
+            ws = web.WebSocketResponse()
+            await ws.prepare(request)
+            async for msg in ws:
+                data = json.loads(msg.data)
+                requests.append(data)
+                await ws.send_json({"op": data["op"], "success": True})
+            return ws
+
+        async def run():
+            runner, url = await start_ws_server(handler)
+            client = WSClient(None, url, "key", "secret")
+            topics = [f"kline.1.C{i}USDT" for i in range(23)]
+            subscribe = [{"op": "subscribe", "args": topics[i : i + 10]} for i in range(0, 23, 10)]
+            task = asyncio.create_task(client.start(subscribe, print))
+            for _ in range(100):
+                if client.connected:
+                    break
+                await asyncio.sleep(0.01)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            await client.close()
+            await runner.cleanup()
+
+        asyncio.run(run())
+        assert [len(r["args"]) for r in requests] == [10, 10, 3]
+
+
+class TestMultiAccountTrader:
+    """Test accounts fanned out from one market-data pipeline."""
+
+    def make(self, tmp_path):
+        mt = MultiAccountTrader(
+            None, {"main": ("k1", "s1"), "sub": ("k2", "s2")}, data_dir=str(tmp_path)
+        )
+        mt.leader.ta.prices.extend([100.0, 100.0])
+        return mt
+
+    def test_indicators_shared(self, tmp_path):
+        """Test a tick is applied once and seen by every account."""
+        mt = self.make(tmp_path)
+        main, sub = mt.accounts["main"], mt.accounts["sub"]
+        assert main.ta.owns_market and not sub.ta.owns_market
+        assert sub.ta.market is main.ta.market
+
+        mt.ticker_handler({"topic": "kline.1.BTCUSDT", "data": [{"close": "101.0", "end": 1}]})
+        assert list(sub.ta.prices) == [100.0, 100.0, 101.0]
+        assert sub.ta.ma_trend == main.ta.ma_trend != 0.0
+        assert main.indicators_updated.is_set() and sub.indicators_updated.is_set()
+        assert sub.last_price == 101.0
+
+    def test_account_state_isolated(self, tmp_path):
+        """Test keys, balances and strategy state stay per account."""
+        mt = self.make(tmp_path)
+        main, sub = mt.accounts["main"], mt.accounts["sub"]
+        assert (main.key, sub.key) == ("k1", "k2")
+        assert main.balances is not sub.balances
+        assert sub.state_file == str(tmp_path / "sub" / "BTCUSDT.json")
+
+        sub.message_handler(wallet_msg(1000, 0.5, 10.0))
+        sub.ta.portfolio_ratio = 0.7
+        assert main.ta.native_balance == (0.0, 0.0)
+        assert main.ta.portfolio_ratio != 0.7
+
+    def test_endpoints_passed_to_accounts(self, tmp_path):
+        """Test the REST and stream URLs of the session reach every account."""
+        mt = self.make(tmp_path)
+        mt.rest_url = "http://127.0.0.1:1/"
+        mt.public_stream_url = "ws://127.0.0.1:1/public"
+        mt.private_stream_url = "ws://127.0.0.1:1/private"
+
+        async def init_data():
+            pass
+
+        for tr in mt.accounts.values():
+            tr.init_data = init_data
+        asyncio.run(mt.init_data())
+        for tr in mt.accounts.values():
+            assert tr.rest_url == mt.rest_url
+            assert tr.private_stream_url == "ws://127.0.0.1:1/private"
+            assert tr.public_stream_url == "ws://127.0.0.1:1/public"
+
+    def test_follower_skips_history(self, tmp_path):
+        """Test a follower only loads its account metadata."""
+        mt = self.make(tmp_path)
+        sub = mt.accounts["sub"]
+        sub.client = MetadataClient()
+        asyncio.run(sub.init_data())
+        assert sub.client.calls == ["instrument", "fee"]
+        assert sub.last_price == 100.0
+
+
+class TestStrategyConfig:
+    """Test per-instance strategy parameters."""
+
+    def test_from_env(self):
+        """Test environment variables are parsed into the config."""
+        config = StrategyConfig.from_env(
+            {"MA_LENGTH": "12", "REBALANCE_ISDYNAMIC": "Yes", "FEE": "0.075"}
+        )
+        assert config.ma_length == 12.0
+        assert config.rebalance_isdynamic is True
+        assert config.fee == 0.075
+        assert config.range == StrategyConfig().range
+
+    def test_immutable(self):
+        """Test configs cannot change under a running strategy."""
+        config = StrategyConfig()
+        with pytest.raises(dataclasses.FrozenInstanceError):
+            config.ma_length = 10.0
+        assert dataclasses.replace(config, ma_length=10.0).ma_length == 10.0
+
+    def test_side_by_side(self):
+        """Test two parameter sets in one process do not interfere."""
+        narrow = TradeAnalyse(
+            ["BTC", "USDT"],
+            log_file="/dev/null",
+            config=StrategyConfig(ma_length=12.0, range=25.0, min_ratio=0.2, fee=0.05),
+        )
+        wide = TradeAnalyse(["BTC", "USDT"], log_file="/dev/null", config=StrategyConfig())
+        assert narrow.ma_length == 12.0 and wide.ma_length == 24.0
+        assert narrow.fee == 0.0005 and wide.fee == 0.001
+        assert narrow.min_max_ratio[0] == 0.2
+
+        for ta in (narrow, wide):
+            ta.ATH = 100000.0
+            ta.prices.extend([50000.0, 49000.0])
+        assert narrow.change_portfolio_ratio(49000.0, 0.5) == pytest.approx(0.5 + 1000.0 / 25000.0)
+        assert wide.change_portfolio_ratio(49000.0, 0.5) == pytest.approx(0.5 + 1000.0 / 50000.0)
+
+
+class TestResampler:
+    """Test fixed-interval bars from irregular ticks."""
+
+    def make(self, **kwargs):
+        bars = []
+        return Resampler(lambda price, end: bars.append((price, end)), **kwargs), bars
+
+    def test_last_price_per_bucket(self):
+        """Test a burst inside one interval produces one bar with its close."""
+        r, bars = self.make()
+        for i, price in enumerate([100.0, 101.0, 102.0, 103.0]):
+            r.add(price, 5000 + i * 100)
+        assert bars == []
+        r.add(104.0, 6050)
+        assert bars == [(103.0, 6000)]
+
+    def test_forward_fill_and_cap(self):
+        """Test quiet intervals repeat the close, long gaps are capped."""
+        r, bars = self.make(max_fill=3)
+        r.add(100.0, 1000)
+        r.add(101.0, 4500)
+        assert bars == [(100.0, 2000), (100.0, 3000), (100.0, 4000)]
+        r.add(102.0, 20000)
+        assert len(bars) == 7
+        assert bars[-1] == (101.0, 20000)
+        assert r.skipped == 12
+
+    def test_late_ticks_and_advance(self):
+        """Test late ticks are dropped and advance closes a quiet bar."""
+        r, bars = self.make()
+        r.add(100.0, 2500)
+        r.add(99.0, 1900)
+        assert r.late == 1
+        r.advance(2999)
+        assert bars == []
+        r.advance(3000)
+        assert bars == [(100.0, 3000)]
+
+    def test_trader_public_trade(self, tmp_path):
+        """Test publicTrade frames reach monitor once per second."""
+        trader = Trader(loop=None, key="", secret="", data_dir=str(tmp_path))
+        trader.ticker_topic = f"publicTrade.{trader.symbol}"
+        trader.resampler = Resampler(trader.bar_handler)
+        trader.ta.prices.extend([100.0, 100.0])
+
+        def frame(*trades):
+            return {
+                "topic": trader.ticker_topic,
+                "ts": trades[-1][1],
+                "data": [{"T": ts, "p": str(price)} for price, ts in trades],
+            }
+
+        trader.ticker_handler(frame((101.0, 60100), (102.0, 60400), (103.0, 60900)))
+        assert len(trader.ta.prices) == 2
+        trader.ticker_handler(frame((104.0, 62200)))
+        assert list(trader.ta.prices)[2:] == [103.0, 103.0]
+        assert trader.last_price == 103.0
+        assert trader.ta.m1_timer == 119999
+
+
+class TestShadowBook:
+    """Test paper-trading shadows on the live ticks."""
+
+    def test_shadow_trades_like_backtest(self, tmp_path):
+        """Test a shadow trades like a backtest over the same ticks and indicators."""
+        from backtest import Backtest
+        from tests.test_backtest import CONFIG, swing_series
+
+        closes = swing_series()[1][59::60]
+        trader = Trader(loop=None, key="", secret="", data_dir=str(tmp_path), config=CONFIG)
+        trader.ta.quiet = True
+        trader.minOrderQty, trader.minOrderAmt = 0.000048, 1.0
+        for price in closes[:200]:
+            trader.ta.monitor(price, 1.0, show=False)
+        trader.ta.ATH = 110000.0
+        market = trader.ta.market.snapshot()
+
+        same = trader.shadows.add("same")
+        wide = trader.shadows.add(
+            "wide", quote_balance=500.0, rebalance_top=50, rebalance_bottom=50, range=20
+        )
+        assert same.ta.market is wide.ta.market is trader.ta.market
+        assert wide.ta.config.rebalance_top == 50.0 and wide.ta.config.ma_length == 24.0
+
+        timestamps = arr.array("q")
+        for i, price in enumerate(closes[200:]):
+            ts = (200 + i) * 60000
+            timestamps.append(ts)
+            data = [{"close": repr(price), "end": ts}]
+            trader.ticker_handler({"topic": trader.ticker_topic, "ts": ts, "data": data})
+
+        bt = Backtest(config=CONFIG, quote_balance=1000.0, equity_every=1)
+        expected = bt.run(timestamps, arr.array("d", closes[200:]), market=market)
+        stats = {shadow["name"]: shadow for shadow in trader.shadows.stats()["shadows"]}
+
+        assert expected["trades"] > 2
+        assert stats["same"]["buys"] + stats["same"]["sells"] == expected["trades"]
+        assert stats["same"]["equity"] == expected["end_equity"]
+        assert stats["same"]["fees"] == expected["fees"]
+        assert stats["wide"]["buys"] + stats["wide"]["sells"] < expected["trades"]
+        assert stats["wide"]["start_equity"] == 500.0
+        assert trader.shadows.stats()["ticks"] == len(closes) - 200
+
+    def test_add_and_load(self, tmp_path):
+        """Test shadow parameters are checked and loaded from a file."""
+        trader = Trader(loop=None, key="", secret="", data_dir=str(tmp_path))
+        with pytest.raises(ValueError):
+            trader.shadows.add("bad", ma_lenght=12)
+        # indicators and fee come from the live trader
+        for param in ("ma_length", "amplitude_time_frame", "fee"):
+            with pytest.raises(ValueError, match=param):
+                trader.shadows.add("bad", **{param: 12})
+        assert "bad" not in trader.shadows.shadows
+        trader.shadows.add("a")
+        trader.ta.fee = 0.0008
+        trader.shadows.shadows["a"].on_tick(100.0, 60000, trader.ta.fee, 0.0001, 1.0)
+        assert trader.shadows.stats()["shadows"][0]["config"]["fee"] == 0.08
+        with pytest.raises(ValueError):
+            trader.shadows.add("a")
+
+        path = tmp_path / "shadows.json"
+        path.write_text(json.dumps([{"name": "b", "params": {"range": 70}}]))
+        trader.shadows.load(str(path))
+        assert trader.shadows.shadows["b"].ta.config.range == 70.0
+        trader.shadows.remove("a")
+        assert list(trader.shadows.shadows) == ["b"]
+        assert isinstance(trader.shadows, ShadowBook)
+
@@ -0,0 +1,104 @@
+"""
+Tests for walk-forward optimization (walk_forward.py).
+"""
+import itertools
+import json
+
+from backtest import Backtest
+from tests.test_backtest import CONFIG, swing_series
+from walk_forward import DAY_MS, main, market_snapshots, split_windows, walk_forward
+
+OPTIONS = {"quote_balance": 1000.0, "base_balance": 0.005, "ath": 110000.0}
+
+
+class TestWalkForward:
+    """Test rolling windows, indicator snapshots and the out-of-sample chain."""
+
+    def test_split_windows(self):
+        """Test windows roll by the test slice and the incomplete one is dropped."""
+        timestamps, _ = swing_series(n=86400 * 4)
+        windows = split_windows(timestamps, 0, DAY_MS, DAY_MS // 2)
+        assert windows[0] == (0, 86400, 86400 + 43200)
+        assert windows[1] == (43200, 86400 + 43200, 86400 * 2)
+        assert len(windows) == 5
+        assert all(b[0] - a[0] == 43200 for a, b in itertools.pairwise(windows))
+        assert split_windows(timestamps, 0, DAY_MS * 4, DAY_MS) == []
+
+    def test_snapshot_replaces_warmup(self):
+        """Test a run continuing from a snapshot trades exactly like a full run."""
+        timestamps, prices = swing_series(n=86400)
+        full = Backtest(config=CONFIG, **OPTIONS)
+        full.run(timestamps, prices)
+
+        warmup = full.warmup_minutes * 60
+        snapshots = market_snapshots(timestamps, prices, CONFIG, warmup, [warmup], 110000.0)
+        resumed = Backtest(config=CONFIG, **OPTIONS)
+        resumed.run(timestamps, prices, start=warmup, market=snapshots[warmup])
+        assert resumed.ledger == full.ledger
+
+    def test_state_carries_over(self):
+        """Test a run split in two continues with the balances and strategy state."""
+        timestamps, prices = swing_series()
+        full = Backtest(config=CONFIG, **OPTIONS)
+        full.run(timestamps, prices)
+
+        warmup = full.warmup_minutes * 60
+        middle = next(
+            i
+            for i in range(timestamps.index(full.ledger[1]["ts"]) + 1, len(prices))
+            if timestamps[i] not in {fill["ts"] for fill in full.ledger}
+        )
+        snapshots = market_snapshots(
+            timestamps, prices, CONFIG, warmup, [warmup, middle], 110000.0
+        )
+        first = Backtest(config=CONFIG, **OPTIONS)
+        first.run(timestamps, prices, warmup, middle, snapshots[warmup])
+        second = Backtest(config=CONFIG, **OPTIONS)
+        result = second.run(timestamps, prices, middle, None, snapshots[middle], first.state())
+
+        assert first.ledger + second.ledger == full.ledger
+        assert result["start_equity"] == round(
+            first.state()["base_balance"] * prices[middle] + first.state()["quote_balance"], 4
+        )
+
+    def test_walk_forward(self):
+        """Test every window picks its best train point and the test runs chain."""
+        timestamps, prices = swing_series(n=86400 * 2)
+        points = [{"rebalance_top": 1.0}, {"rebalance_top": 3.0}, {"min_ratio": 0.999}]
+        report = walk_forward(
+            timestamps, prices, points, 0.5, 0.25, workers=2, base_config=CONFIG,
+            options=OPTIONS,
+        )
+        windows = report["windows"]
+        assert len(windows) == 5
+        for window in windows:
+            assert window["params"] in points[:2]
+            assert window["train"][1] < window["test"][0]
+        for a, b in itertools.pairwise(windows):
+            assert b["test"][0] == a["test"][1] + 1000
+            assert b["test_result"]["start_equity"] > 0.0
+
+        summary = report["summary"]
+        assert summary["windows"] == 5
+        assert summary["start_equity"] == windows[0]["test_result"]["start_equity"]
+        assert summary["end_equity"] == windows[-1]["test_result"]["end_equity"]
+        assert report["equity"][0][0] >= windows[0]["test"][0]
+
+    def test_cli(self, tmp_path, capsys):
+        """Test the command line writes the windows and the equity curve."""
+        timestamps, prices = swing_series(n=86400)
+        path = tmp_path / "ticks.csv"
+        path.write_text("".join(f"{t},{p}\n" for t, p in zip(timestamps, prices)))
+        out = tmp_path / "wf.json"
+        equity = tmp_path / "equity.csv"
+
+        argv = [
+            str(path), "--grid", "rebalance_top=1,2", "--train-days", "0.25",
+            "--test-days", "0.25", "--workers", "1", "--ath", "110000",
+            "--out", str(out), "--equity", str(equity),
+        ]
+        assert main(argv) == 0
+        report = json.loads(out.read_text())
+        assert report["summary"]["windows"] == len(report["windows"]) > 0
+        assert equity.read_text().startswith("ts,equity")
+        assert main(argv[:1] + ["--grid", "rebalance_top=1", "--train-days", "5"]) == 1
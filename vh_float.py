@@ -5,17 +5,24 @@ import socket
 import array as arr
 import json
 import math
+import random
 import cmath
 import decimal
 import hashlib
 import hmac
+import gzip
+import struct
 import time
 import datetime
 import traceback
 import statistics
+import threading
 import dotenv
+from abc import ABC, abstractmethod
 from pathlib import Path
 from collections import deque
+from dataclasses import asdict, dataclass, replace
+from typing import Optional
 import aiohttp
 
 dotenv.load_dotenv(override=True)
@@ -23,45 +30,211 @@ dotenv.load_dotenv(override=True)
 API_KEY = os.getenv("API_KEY", "")
 SECRET_KEY = os.getenv("SECRET_KEY", "")
 STABLE_PAIR = os.getenv("STABLE_PAIR", "USDT")
-# trading signals length for MA, EMA
-MA_LENGTH = float(os.getenv("MA_LENGTH", 24.0))
-# range = 50% of ATH, ratio_per_point = 1.0 / RANGE (each price tick changes portfolio ratio like ratio +(-) ratio_per_point)
-RANGE = float(os.getenv("RANGE", 50.0))
-# minimum portfolio bitcoin to stablecoin ratio 1% / 99%
-MIN_RATIO = float(os.getenv("MIN_RATIO", 0.01))
-# maximum portfolio bitcoin to stablecoin ratio 99% /1%
-MAX_RATIO = float(os.getenv("MAX_RATIO", 0.99))
-# % rebalance(SELL)
-REBALANCE_TOP = float(os.getenv("REBALANCE_TOP", 3.0))
-# % rebalance(BUY)
-REBALANCE_BOTTOM = float(os.getenv("REBALANCE_BOTTOM", 3.0))
-REBALANCE_ISDYNAMIC = os.getenv("REBALANCE_ISDYNAMIC", "false").lower() in (
-    "true",
-    "1",
-    "yes",
-    "y",
-)
-# secundes, time frame for amplitude calculation
-AMPLITUDE_TIME_FRAME = int(os.getenv("AMPLITUDE_TIME_FRAME", 120))
-# trading fee in percent, default 0.1%
-FEE = float(os.getenv("FEE", 0.1))
 TGBOT_TOKEN = os.getenv("TGBOT_TOKEN", "")
 TGBOT_CHATID = os.getenv("TGBOT_CHATID", "")
+# independent public connections for the ticker, frames are de-duplicated by exchange timestamp
+WS_TICKER_CONNECTIONS = int(os.getenv("WS_TICKER_CONNECTIONS", 1))
+# base coins traded against STABLE_PAIR, more than one runs MultiSymbolTrader
+TRADE_COINS = [c.strip() for c in os.getenv("TRADE_COINS", "BTC").split(",") if c.strip()]
+# sub-accounts sharing one market feed, keys in API_KEY_<NAME> / SECRET_KEY_<NAME>
+ACCOUNTS = [a.strip() for a in os.getenv("ACCOUNTS", "").split(",") if a.strip()]
+# topics per public subscribe request, the Bybit spot limit
+WS_TOPICS_PER_REQUEST = 10
+# public stream feeding the strategy: "kline" (kline.1) or "publicTrade"
+TICKER_STREAM = os.getenv("TICKER_STREAM", "kline")
+# secundes, fixed bar interval fed to TradeAnalyse.monitor, 0 feeds every kline update
+# (publicTrade is always resampled, 1 s if 0)
+RESAMPLE_INTERVAL = float(os.getenv("RESAMPLE_INTERVAL", 0))
+# secundes, instrument filters and account fee rates are refreshed after this age
+METADATA_TTL = float(os.getenv("METADATA_TTL", 86400))
+# exchange endpoints, point them at a local stand-in (bybit_standin.py) to run offline
+BYBIT_REST_URL = os.getenv("BYBIT_REST_URL", "https://api.bybit.com/")
+BYBIT_PUBLIC_STREAM = os.getenv("BYBIT_PUBLIC_STREAM", "wss://stream.bybit.com/v5/public/spot")
+BYBIT_PRIVATE_STREAM = os.getenv("BYBIT_PRIVATE_STREAM", "wss://stream.bybit.com/v5/private")
+# capture file of every raw WebSocket frame for replay.py, empty disables recording
+WS_CAPTURE = os.getenv("WS_CAPTURE", "")
+# JSON list of paper-trading shadow strategies fed by the live ticks, see ShadowBook.load
+SHADOWS = os.getenv("SHADOWS", "")
+# event loop lag and handler timing (LoopMonitor), cheap enough to stay on
+LOOP_MONITOR = os.getenv("LOOP_MONITOR", "true").lower() in ("true", "1", "yes", "y")
+# ms, a loop blocked this long is recorded as slow with the stack of the blocking code
+LOOP_SLOW_THRESHOLD = float(os.getenv("LOOP_SLOW_THRESHOLD", 100))
+
+
+@dataclass(frozen=True)
+class StrategyConfig:
+    """Strategy parameters of one TradeAnalyse instance.
+
+    Immutable, so several strategies with different parameters can run in
+    one process. ``from_env`` reads the documented environment variables.
+    """
 
+    # trading signals length for MA, EMA
+    ma_length: float = 24.0
+    # range = 50% of ATH, ratio_per_point = 1.0 / RANGE (each price tick changes portfolio ratio like ratio +(-) ratio_per_point)
+    range: float = 50.0
+    # minimum portfolio bitcoin to stablecoin ratio 1% / 99%
+    min_ratio: float = 0.01
+    # maximum portfolio bitcoin to stablecoin ratio 99% /1%
+    max_ratio: float = 0.99
+    # % rebalance(SELL)
+    rebalance_top: float = 3.0
+    # % rebalance(BUY)
+    rebalance_bottom: float = 3.0
+    rebalance_isdynamic: bool = False
+    # secundes, time frame for amplitude calculation
+    amplitude_time_frame: int = 120
+    # trading fee in percent, default 0.1%
+    fee: float = 0.1
+
+    @classmethod
+    def from_env(cls, env=None):
+        env = os.environ if env is None else env
+        return cls(
+            ma_length=float(env.get("MA_LENGTH", 24.0)),
+            range=float(env.get("RANGE", 50.0)),
+            min_ratio=float(env.get("MIN_RATIO", 0.01)),
+            max_ratio=float(env.get("MAX_RATIO", 0.99)),
+            rebalance_top=float(env.get("REBALANCE_TOP", 3.0)),
+            rebalance_bottom=float(env.get("REBALANCE_BOTTOM", 3.0)),
+            rebalance_isdynamic=env.get("REBALANCE_ISDYNAMIC", "false").lower()
+            in ("true", "1", "yes", "y"),
+            amplitude_time_frame=int(env.get("AMPLITUDE_TIME_FRAME", 120)),
+            fee=float(env.get("FEE", 0.1)),
+        )
 
-async def Fire_alert(bot_message: str, bot_token: str, bot_chatID: str):
-    if bot_token == "" or bot_chatID == "":
-        return
 
-    msg = bot_message.replace("_", " ")
+class AlertDispatcher:
+    """Telegram alert service.
+
+    Alerts go into a bounded queue and are delivered by one worker over one
+    pooled session limited to a single connection. Bursts are coalesced into
+    one message, HTTP 429 is retried after the ``retry_after`` Telegram asks
+    for. When the queue is full the oldest alert is dropped, so ``send``
+    never blocks the trading path.
+    """
+
+    MAX_MESSAGE_LENGTH = 4096
+
+    def __init__(
+        self,
+        bot_token: str,
+        bot_chatID: str,
+        base_url: str = "https://api.telegram.org",
+        maxsize: int = 100,
+        batch_window: float = 1.0,
+        max_retries: int = 5,
+    ) -> None:
+        """Initialize dispatcher.
+
+        Args:
+            bot_token: Telegram bot token, alerts are disabled if empty
+            bot_chatID: Telegram chat ID, alerts are disabled if empty
+            base_url: Telegram Bot API url (a local stand-in in tests)
+            maxsize: Maximum number of queued alerts
+            batch_window: Seconds to collect a burst into one message
+            max_retries: Delivery attempts per message
+        """
+        self.bot_token = bot_token
+        self.bot_chatID = bot_chatID
+        self.base_url = base_url.rstrip("/")
+        self.batch_window = batch_window
+        self.max_retries = max_retries
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.session = None
+        self.stats = {
+            "queued": 0,
+            "dropped": 0,
+            "sent": 0,
+            "batches": 0,
+            "failed": 0,
+            "retries": 0,
+            "rate_limited": 0,
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return self.bot_token != "" and self.bot_chatID != ""
+
+    def send(self, bot_message: str) -> None:
+        """Queue an alert, never blocks."""
+        if not self.enabled:
+            return
+
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.stats["dropped"] += 1
+
+        self.queue.put_nowait(bot_message.replace("_", " "))
+        self.stats["queued"] += 1
+
+    async def run(self):
+        """Deliver queued alerts until cancelled."""
+        try:
+            while True:
+                messages = [await self.queue.get()]
+                await asyncio.sleep(self.batch_window)
+                while not self.queue.empty():
+                    messages.append(self.queue.get_nowait())
+
+                for text, count in self._batches(messages):
+                    if await self._deliver(text):
+                        self.stats["batches"] += 1
+                        self.stats["sent"] += count
+                    else:
+                        self.stats["failed"] += count
+        finally:
+            await self.close()
+
+    def _batches(self, messages: list) -> list:
+        """Join messages into as few Telegram messages as the length limit allows."""
+        batches = [[messages[0], 1]]
+        for msg in messages[1:]:
+            if len(batches[-1][0]) + len(msg) + 1 > self.MAX_MESSAGE_LENGTH:
+                batches.append([msg, 1])
+            else:
+                batches[-1][0] += "\n" + msg
+                batches[-1][1] += 1
+        return batches
+
+    async def _deliver(self, text: str) -> bool:
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=1)
+            timeout = aiohttp.ClientTimeout(total=10)
+            self.session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+        url = f"{self.base_url}/bot{self.bot_token}/sendMessage"
+        payload = {"chat_id": self.bot_chatID, "parse_mode": "Markdown", "text": text}
+
+        for attempt in range(self.max_retries):
+            if attempt > 0:
+                self.stats["retries"] += 1
+            try:
+                async with self.session.post(url, json=payload) as resp:
+                    if resp.status == 200:
+                        print(f"INFO: ************************* alert sent, {resp.status}")
+                        return True
+
+                    if resp.status == 429:
+                        self.stats["rate_limited"] += 1
+                        data = await resp.json(content_type=None)
+                        delay = data.get("parameters", {}).get("retry_after", 1)
+                        await asyncio.sleep(float(delay))
+                        continue
 
-    try:
-        async with aiohttp.ClientSession() as session:
-            url = f"https://api.telegram.org/bot{bot_token}/sendMessage?chat_id={bot_chatID}&parse_mode=Markdown&text={msg}"
-            async with session.get(url) as resp:
-                print(f"INFO: ************************* alert sent, {resp.status}")
-    except Exception as ex:
-        print(f"ERROR: Fire_alert, {repr(traceback.extract_tb(ex.__traceback__))}")
+                    print(f"ERROR: alert, resp_status: {resp.status}")
+                    if resp.status < 500:
+                        return False
+            except Exception as ex:
+                print(f"ERROR: alert, {traceback.extract_tb(ex.__traceback__)!r}")
+
+            await asyncio.sleep(min(2.0**attempt, 30.0))
+
+        return False
+
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
 
 
 def log(data: str, log_file: str = "trading.log"):
@@ -110,26 +283,70 @@ def rotate_log_file(log_file: str, max_files: int = 5, max_size_mb: float = 10.0
 
 
 class WSClient:
-    def __init__(self, loop: asyncio.AbstractEventLoop, stream_url, key, secret):
+    """WebSocket session manager for Bybit v5 streams.
+
+    Keeps one connection alive: authenticates and subscribes waiting on the
+    exchange acknowledgements, detects stale connections by heartbeat and
+    reconnects with jittered exponential backoff. The ping task is owned by
+    the connection it serves and cancelled together with it.
+    """
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        stream_url,
+        key,
+        secret,
+        ping_interval: float = 20.0,
+        stale_timeout: float = 30.0,
+        ack_timeout: float = 5.0,
+        latency=None,
+        recorder=None,
+        channel: str = "",
+    ):
         self.loop = loop
         self.key = key
         self.secret = secret
         self.stream_url = stream_url
-        resolver = aiohttp.resolver.AsyncResolver(nameservers=["1.1.1.1", "8.8.8.8"])
+        self.ping_interval = ping_interval
+        # no frame (data or pong) for this long means the connection is dead
+        self.stale_timeout = stale_timeout
+        self.ack_timeout = ack_timeout
+        self.backoff_base = 0.05
+        self.backoff_cap = 5.0
+        self.session = None
+        self.resolver = None
+        # LatencyTracker, gets the receive time of each frame passed to the callback
+        self.latency = latency
+        self.last_frame_ns = 0
+        # FrameRecorder, gets every text frame under the channel name
+        self.recorder = recorder
+        self.channel = channel
+
+        self.connected = False
+        self.connects = 0
+        self.reconnects = 0
+        self.stale_disconnects = 0
+        self.downtime = 0.0
+        self.last_downtime = 0.0
+        self.last_message = 0.0
+        self._disconnected_at = None
+
+    async def initialize(self):
+        if self.session is not None and not self.session.closed:
+            return
+
+        # a resolver passed in is not closed with the connector, close() does it
+        self.resolver = aiohttp.resolver.AsyncResolver(nameservers=["1.1.1.1", "8.8.8.8"])
         connector = aiohttp.TCPConnector(
-            loop=self.loop,
             family=socket.AF_INET,
             limit=100,
             ttl_dns_cache=30000,
-            resolver=resolver,
+            resolver=self.resolver,
         )
-        timeout = aiohttp.ClientTimeout(total=5)
-        self.session = aiohttp.ClientSession(
-            loop=self.loop, connector=connector, timeout=timeout
-        )
-
-    async def initialize(self):
-        self.session = aiohttp.ClientSession()
+        # no total timeout, it would also limit the lifetime of the stream
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=5)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=timeout)
         self.session.headers.update(
             {
                 "Content-Type": "application/json",
@@ -137,6 +354,13 @@ class WSClient:
             },
         )
 
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        if self.resolver is not None:
+            await self.resolver.close()
+            self.resolver = None
+
     async def _create_auth(self):
         # Generate expires.
         expires = int((time.time() + 100) * 1000)
@@ -177,9 +401,8 @@ class WSClient:
         return sub_msg
 
     async def ws_ping_loop(self, ws):
-        await asyncio.sleep(5.0)
-
         while True:
+            await asyncio.sleep(self.ping_interval)
             try:
                 data = {"op": "ping"}
                 await ws.send_str(json.dumps(data, ensure_ascii=False), compress=None)
@@ -188,59 +411,1321 @@ class WSClient:
                 print(f"{repr(traceback.extract_tb(ex.__traceback__))}")
                 return
 
-            await asyncio.sleep(20.0)
+    def stats(self) -> dict:
+        """Connection health counters."""
+        downtime = self.downtime
+        if self._disconnected_at is not None and self.connects > 0:
+            downtime += time.monotonic() - self._disconnected_at
+
+        return {
+            "url": self.stream_url,
+            "connected": self.connected,
+            "reconnects": self.reconnects,
+            "stale_disconnects": self.stale_disconnects,
+            "downtime": round(downtime, 3),
+            "last_downtime": round(self.last_downtime, 3),
+            "last_message_age": round(time.monotonic() - self.last_message, 3)
+            if self.last_message
+            else None,
+        }
+
+    async def _receive(self, ws, timeout: float):
+        """Receive one frame, returns None if the connection is finished."""
+        try:
+            msg = await ws.receive(timeout=timeout)
+        except TimeoutError:
+            return None
+
+        match msg.type:
+            case aiohttp.WSMsgType.TEXT:
+                self.last_frame_ns = time.monotonic_ns()
+                self.last_message = self.last_frame_ns / 1e9
+                if self.recorder is not None:
+                    self.recorder.write(self.channel, self.last_frame_ns, msg.data)
+                return msg.data
+            case aiohttp.WSMsgType.BINARY:
+                self.last_message = time.monotonic()
+                print("Binary: ", msg.data)
+                return ""
+            case aiohttp.WSMsgType.CLOSE | aiohttp.WSMsgType.CLOSING:
+                print(f"WARNING: ws start, close received, {self.stream_url}")
+            case aiohttp.WSMsgType.CLOSED:
+                print(f"WARNING: ws start, closed, {self.stream_url}")
+            case aiohttp.WSMsgType.ERROR:
+                print(f"ERROR: ws, Error during receive, {self.stream_url}, {ws.exception()}")
+            case _:
+                print(f"WARNING: ws, unknown command: {msg}")
+                return ""
+        return None
+
+    async def _request(self, ws, data: dict, callback):
+        """Send an op request and wait for its acknowledgement.
+
+        Data frames received before the acknowledgement go to the callback.
+        """
+        await ws.send_str(json.dumps(data, ensure_ascii=False), compress=None)
+        deadline = time.monotonic() + self.ack_timeout
+        while True:
+            txt = await self._receive(ws, max(deadline - time.monotonic(), 0.001))
+            if txt is None:
+                raise ConnectionError(f"no {data['op']} acknowledgement")
+            if not txt:
+                continue
+
+            msg = json.loads(txt)
+            if msg.get("op") == data["op"] and "topic" not in msg:
+                if not msg.get("success", False):
+                    raise ConnectionError(f"{data['op']} rejected: {msg}")
+                return
+            if "ping" not in txt:
+                callback(msg)
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0.0, min(self.backoff_cap, self.backoff_base * 2**attempt))
+
+    async def start(self, subscribe: list, callback, need_auth=False, on_connect=None):
+        attempt = 0
+        while 1:
+            await self.initialize()
+            print(f"INFO: ws start: {self.stream_url}")
+            ping_task = None
+            try:
+                async with self.session.ws_connect(self.stream_url) as ws:
+                    if need_auth:
+                        data = await self._create_auth()
+                        await self._request(ws, data, callback)
+
+                    # a list when the topics do not fit into one request
+                    for request in subscribe if isinstance(subscribe, list) else [subscribe]:
+                        await self._request(ws, request, callback)
+
+                    self.connected = True
+                    self.connects += 1
+                    if self._disconnected_at is not None:
+                        self.reconnects += 1
+                        self.last_downtime = time.monotonic() - self._disconnected_at
+                        self.downtime += self.last_downtime
+                        self._disconnected_at = None
+                        print(
+                            f"INFO: ws reconnected in {round(self.last_downtime, 3)} s: {self.stream_url}"
+                        )
+                    attempt = 0
+                    if on_connect is not None:
+                        on_connect()
+
+                    ping_task = asyncio.create_task(self.ws_ping_loop(ws))
+
+                    while True:
+                        txt = await self._receive(ws, self.stale_timeout)
+                        if txt is None:
+                            if not ws.closed and ws.exception() is None:
+                                self.stale_disconnects += 1
+                                print(
+                                    f"WARNING: ws stale, no data for {self.stale_timeout} s, {subscribe}"
+                                )
+                            break
+                        if txt and "ping" not in txt:
+                            if self.latency is not None:
+                                self.latency.frame_ns = self.last_frame_ns
+                            callback(json.loads(txt))
+
+            except Exception as ex:
+                print(f"ERROR: ws start, {subscribe}, {ex}")
+                print(f"{repr(traceback.extract_tb(ex.__traceback__))}")
+
+            finally:
+                if ping_task is not None:
+                    ping_task.cancel()
+                if self.connected:
+                    self._disconnected_at = time.monotonic()
+                self.connected = False
+
+            await asyncio.sleep(self._backoff(attempt))
+            attempt += 1
+
+
+class FrameDeduplicator:
+    """Merges frames of several redundant connections into one stream.
+
+    The first frame for a given topic and exchange timestamp (``ts``) wins,
+    later copies and frames older than the last accepted one are dropped.
+    Distinct publicTrade frames can share a millisecond ``ts``, their trades
+    are de-duplicated on the trade id (``data[*].i``) instead.
+    """
+
+    # trade ids remembered per topic, the copies arrive within milliseconds
+    TRADE_ID_WINDOW = 4096
+
+    def __init__(self, callback, connections: int) -> None:
+        self.callback = callback
+        self.last_ts = {}
+        self.trade_ids = {}
+        self.accepted = [0] * connections
+        self.dropped = [0] * connections
+
+    def handler(self, index: int):
+        """Return the callback for connection number ``index``."""
+
+        def handle(msg):
+            topic = msg.get("topic")
+            ts = msg.get("ts")
+            if topic is None or ts is None:
+                self.callback(msg)
+                return
+
+            if topic.startswith("publicTrade."):
+                trades = self.new_trades(topic, msg.get("data") or [])
+                if not trades:
+                    self.dropped[index] += 1
+                    return
+                if len(trades) < len(msg["data"]):
+                    msg = {**msg, "data": trades}
+                self.accepted[index] += 1
+                self.callback(msg)
+                return
+
+            if ts <= self.last_ts.get(topic, 0):
+                self.dropped[index] += 1
+                return
+
+            self.last_ts[topic] = ts
+            self.accepted[index] += 1
+            self.callback(msg)
+
+        return handle
+
+    def new_trades(self, topic: str, trades: list) -> list:
+        """Trades of a publicTrade frame whose id was not seen yet."""
+        seen = self.trade_ids.get(topic)
+        if seen is None:
+            seen = self.trade_ids[topic] = (set(), deque())
+        ids, order = seen
+
+        new = []
+        for trade in trades:
+            trade_id = trade.get("i")
+            if trade_id in ids:
+                continue
+            ids.add(trade_id)
+            order.append(trade_id)
+            if len(order) > self.TRADE_ID_WINDOW:
+                ids.discard(order.popleft())
+            new.append(trade)
+        return new
+
+
+CAPTURE_MAGIC = b"VHCAP1\n"
+# wall clock and monotonic time in ns when the capture was started
+CAPTURE_HEADER = struct.Struct("<qq")
+# kind, channel number, monotonic receive time in ns, payload length
+CAPTURE_RECORD = struct.Struct("<BBqI")
+CAPTURE_CHANNEL = 1
+CAPTURE_FRAME = 2
+
+
+class FrameRecorder:
+    """Raw WebSocket frames written to a gzip compressed capture file.
+
+    Every text frame is one binary record with its monotonic receive time,
+    the stream name is stored once in a channel record. The file is flushed
+    at most every ``flush_interval`` seconds, a crash loses the frames since.
+    ``read_capture`` reads the file back, replay.py feeds it to a trader.
+    """
+
+    def __init__(self, path, flush_interval: float = 1.0, compresslevel: int = 6) -> None:
+        # "{time}" in the path keeps the captures of several runs apart
+        self.path = str(path).replace("{time}", time.strftime("%Y%m%d-%H%M%S"))
+        self.flush_interval = flush_interval
+        self.channels = {}
+        self.frames = 0
+        self.bytes = 0
+        self._file = gzip.open(self.path, "wb", compresslevel=compresslevel)
+        self._file.write(CAPTURE_MAGIC + CAPTURE_HEADER.pack(time.time_ns(), time.monotonic_ns()))
+        self._flushed_ns = time.monotonic_ns()
+
+    def write(self, channel: str, recv_ns: int, text: str) -> None:
+        if self._file is None:
+            return
+
+        number = self.channels.get(channel)
+        if number is None:
+            number = self.channels[channel] = len(self.channels)
+            name = channel.encode()
+            self._file.write(CAPTURE_RECORD.pack(CAPTURE_CHANNEL, number, recv_ns, len(name)))
+            self._file.write(name)
+
+        data = text.encode()
+        self._file.write(CAPTURE_RECORD.pack(CAPTURE_FRAME, number, recv_ns, len(data)))
+        self._file.write(data)
+        self.frames += 1
+        self.bytes += len(data)
+
+        if recv_ns - self._flushed_ns > self.flush_interval * 1e9:
+            self._file.flush()
+            self._flushed_ns = recv_ns
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def read_capture(path):
+    """Frames of a FrameRecorder capture as (channel, recv_ns, text).
+
+    A record cut off by a crash ends the capture.
+    """
+    with gzip.open(str(path), "rb") as f:
+        if f.read(len(CAPTURE_MAGIC)) != CAPTURE_MAGIC:
+            raise ValueError(f"{path} is not a frame capture")
+        f.read(CAPTURE_HEADER.size)
+
+        channels = {}
+        try:
+            while True:
+                head = f.read(CAPTURE_RECORD.size)
+                if len(head) < CAPTURE_RECORD.size:
+                    return
+                kind, number, recv_ns, size = CAPTURE_RECORD.unpack(head)
+                data = f.read(size)
+                if len(data) < size:
+                    return
+
+                if kind == CAPTURE_CHANNEL:
+                    channels[number] = data.decode()
+                elif kind == CAPTURE_FRAME:
+                    yield channels[number], recv_ns, data.decode()
+        except EOFError:
+            return
+
+
+class Resampler:
+    """Fixed-interval bars from an irregular tick stream.
+
+    Ticks are bucketed by exchange timestamp; each bucket is emitted once
+    with its last price when a later bucket starts (or ``advance`` passes
+    it). Empty buckets are forward-filled with the previous close, at most
+    ``max_fill`` in a row, so a long outage does not replay thousands of
+    bars. Ticks older than the open bucket are dropped.
+    """
+
+    def __init__(self, callback, interval_ms: int = 1000, max_fill: int = 60) -> None:
+        """Initialize resampler.
+
+        Args:
+            callback: Called with (close price, bar end timestamp in ms)
+            interval_ms: Bar length in milliseconds
+            max_fill: Empty bars forward-filled after a gap at most
+        """
+        self.callback = callback
+        self.interval_ms = interval_ms
+        self.max_fill = max_fill
+        self.bucket = None
+        self.price = 0.0
+        self.bars = 0
+        self.filled = 0
+        self.skipped = 0
+        self.late = 0
+
+    def add(self, price: float, ts_ms: int) -> None:
+        bucket = ts_ms // self.interval_ms
+        if self.bucket is None:
+            self.bucket = bucket
+        elif bucket < self.bucket:
+            self.late += 1
+            return
+        elif bucket > self.bucket:
+            self._close(bucket)
+        self.price = price
+
+    def advance(self, ts_ms: int) -> None:
+        """Close the open bucket if ``ts_ms`` is past it, for quiet markets."""
+        bucket = ts_ms // self.interval_ms
+        if self.bucket is not None and bucket > self.bucket:
+            self._close(bucket)
+
+    def _close(self, bucket: int) -> None:
+        self._emit(self.bucket)
+        missing = bucket - self.bucket - 1
+        if missing > self.max_fill:
+            self.skipped += missing - self.max_fill
+            missing = self.max_fill
+        for i in range(missing, 0, -1):
+            self.filled += 1
+            self._emit(bucket - i)
+        self.bucket = bucket
+
+    def _emit(self, bucket: int) -> None:
+        self.bars += 1
+        self.callback(self.price, (bucket + 1) * self.interval_ms)
+
+
+class LatencyHistogram:
+    """Latency histogram with fixed power-of-two microsecond buckets.
+
+    Bucket ``i`` counts samples below ``2**i`` us, recording is a bit_length
+    and an increment, cheap enough for every tick.
+    """
+
+    BUCKETS = 32
+
+    def __init__(self) -> None:
+        self.counts = [0] * self.BUCKETS
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def record(self, ns: int) -> None:
+        if ns < 0:
+            return
+        index = min((ns // 1000).bit_length(), self.BUCKETS - 1)
+        self.counts[index] += 1
+        self.count += 1
+        self.total_ns += ns
+        if ns > self.max_ns:
+            self.max_ns = ns
+
+    def percentile(self, q: float) -> float:
+        """Upper bound in ms of the bucket holding the q-th percentile."""
+        if self.count == 0:
+            return 0.0
+        rank = q / 100.0 * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(2**index / 1000.0, self.max_ns / 1e6)
+        return self.max_ns / 1e6
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total_ns / self.count / 1e6, 4) if self.count else 0.0,
+            "p50_ms": round(self.percentile(50), 4),
+            "p90_ms": round(self.percentile(90), 4),
+            "p99_ms": round(self.percentile(99), 4),
+            "max_ms": round(self.max_ns / 1e6, 4),
+        }
+
+
+class LatencyTracker:
+    """Tick-to-order latency per pipeline stage (monotonic clock, ns).
+
+    Stages:
+        frame_to_handler: frame received by WSClient -> ticker_handler (JSON decode)
+        monitor: TradeAnalyse.monitor() duration
+        tick_to_decision: frame received -> trade_signal() evaluated in trade_loop
+        decision_to_send: trade_signal() -> order request sent
+        tick_to_order: frame received -> order request sent
+        order_ack: order request sent -> REST response
+        order_fill: order request sent -> fill on the private order stream
+    """
+
+    STAGES = (
+        "frame_to_handler",
+        "monitor",
+        "tick_to_decision",
+        "decision_to_send",
+        "tick_to_order",
+        "order_ack",
+        "order_fill",
+    )
+
+    def __init__(self) -> None:
+        self.histograms = {stage: LatencyHistogram() for stage in self.STAGES}
+        self.frame_ns = 0
+        self.tick_ns = 0
+        self.decision_ns = 0
+        self.order_sent_ns = 0
+
+    def record(self, stage: str, start_ns: int, end_ns: int = 0) -> None:
+        if start_ns:
+            self.histograms[stage].record((end_ns or time.monotonic_ns()) - start_ns)
+
+    def snapshot(self) -> dict:
+        return {stage: h.snapshot() for stage, h in self.histograms.items()}
+
+
+class _TimedCoroutine:
+    """Awaitable driving a coroutine and timing each of its steps."""
+
+    def __init__(self, monitor, name: str, coro) -> None:
+        self.monitor = monitor
+        self.histogram = monitor.histogram(name)
+        self.name = name
+        self.coro = coro
+
+    def __await__(self):
+        value, error = None, None
+        while True:
+            previous = self.monitor.current
+            self.monitor.current = self.name
+            start_ns = time.monotonic_ns()
+            try:
+                if error is not None:
+                    future = self.coro.throw(error)
+                else:
+                    future = self.coro.send(value)
+            except StopIteration as stop:
+                return stop.value
+            finally:
+                self.histogram.record(time.monotonic_ns() - start_ns)
+                self.monitor.current = previous
+
+            value, error = None, None
+            try:
+                value = yield future
+            except GeneratorExit:
+                self.coro.close()
+                raise
+            except BaseException as ex:
+                error = ex
+
+
+class LoopMonitor:
+    """Event loop lag, time per handler and slow callbacks.
+
+    A probe sleeps ``interval`` seconds in a loop, how late it wakes up is
+    the scheduling lag. A watchdog thread checks that the probe is not
+    overdue by more than ``slow_threshold``; if it is, the loop is blocked
+    and the stack of the loop thread shows the code blocking it. Handlers
+    wrapped with ``timed`` and coroutines wrapped with ``track`` record the
+    time of every call / step, and name the handler a stall happened in.
+    Costs a few microseconds per handler call and per probe wakeup.
+    """
+
+    def __init__(
+        self, interval: Optional[float] = None, slow_threshold: float = 0.1, max_slow: int = 50
+    ) -> None:
+        """Initialize monitor.
+
+        Args:
+            interval: Seconds between lag probes, half the threshold if None;
+                stalls longer than threshold + interval are always caught
+            slow_threshold: Seconds the loop may be blocked before it is recorded
+            max_slow: Slow callbacks kept, the oldest are dropped
+        """
+        self.slow_threshold = slow_threshold
+        self.interval = interval if interval is not None else slow_threshold / 2.0
+        self.lag = LatencyHistogram()
+        self.handlers = {}
+        self.slow = deque(maxlen=max_slow)
+        self.stalls = 0
+        # name of the timed handler or tracked coroutine running on the loop
+        self.current = None
+        self.running = False
+        self._due = 0.0
+        self._captured = None
+        self._thread_id = None
+        self._stop = threading.Event()
+
+    def histogram(self, name: str) -> LatencyHistogram:
+        if name not in self.handlers:
+            self.handlers[name] = LatencyHistogram()
+        return self.handlers[name]
+
+    def timed(self, name: str, callback):
+        """``callback`` recording its duration under ``name``."""
+        histogram = self.histogram(name)
+
+        def handler(*args, **kwargs):
+            previous = self.current
+            self.current = name
+            start_ns = time.monotonic_ns()
+            try:
+                return callback(*args, **kwargs)
+            finally:
+                histogram.record(time.monotonic_ns() - start_ns)
+                self.current = previous
+
+        return handler
+
+    async def track(self, coro, name: Optional[str] = None):
+        """Run ``coro`` recording the time of each of its steps, under its function name."""
+        return await _TimedCoroutine(self, name or coro.__name__, coro)
+
+    async def run(self):
+        """Probe the loop lag until cancelled, with the watchdog thread alongside."""
+        self._thread_id = threading.get_ident()
+        self._stop.clear()
+        self._due = time.monotonic() + self.interval
+        watchdog = threading.Thread(target=self._watchdog, name="loop-watchdog", daemon=True)
+        watchdog.start()
+        self.running = True
+        try:
+            while True:
+                self._due = time.monotonic() + self.interval
+                await asyncio.sleep(self.interval)
+                lag = time.monotonic() - self._due
+                self.lag.record(int(lag * 1e9))
+                if lag > self.slow_threshold:
+                    self._stalled(self._due, lag)
+        finally:
+            self.running = False
+            self._stop.set()
+
+    def _stalled(self, due: float, lag: float) -> None:
+        entry = self._captured
+        if entry is None or entry["due"] != due:
+            # over before the watchdog looked, no stack
+            self.stalls += 1
+            entry = {"due": due, "time": time.time(), "handler": self.current, "stack": []}
+            self.slow.append(entry)
+        entry["lag_ms"] = round(lag * 1000.0, 3)
+
+    def _watchdog(self):
+        while not self._stop.wait(self.slow_threshold / 2.0):
+            due = self._due
+            lag = time.monotonic() - due
+            if lag <= self.slow_threshold or (self._captured and self._captured["due"] == due):
+                continue
+            frame = sys._current_frames().get(self._thread_id)
+            stack = traceback.extract_stack(frame)[-20:] if frame is not None else []
+            entry = {
+                "due": due,
+                "time": time.time(),
+                "handler": self.current,
+                "lag_ms": round(lag * 1000.0, 3),
+                "stack": [f"{fs.filename}:{fs.lineno} {fs.name}" for fs in stack],
+            }
+            self._captured = entry
+            self.stalls += 1
+            self.slow.append(entry)
+
+    def snapshot(self) -> dict:
+        return {
+            "running": self.running,
+            "interval_ms": round(self.interval * 1000.0, 3),
+            "threshold_ms": round(self.slow_threshold * 1000.0, 3),
+            "lag": self.lag.snapshot(),
+            "handlers": {
+                name: dict(h.snapshot(), busy_s=round(h.total_ns / 1e9, 3))
+                for name, h in self.handlers.items()
+            },
+            "stalls": self.stalls,
+            "slow": [
+                {key: value for key, value in entry.items() if key != "due"}
+                for entry in list(self.slow)
+            ],
+        }
+
+
+class MetadataCache:
+    """Instrument filters and account fee rates persisted with a TTL.
+
+    Entries are stored per kind ("instrument", "fee") and symbol in one JSON
+    file inside the trader data directory, so a restart within the TTL makes
+    no metadata requests. Expired entries are still returned by ``get`` with
+    ``allow_stale=True`` as a fallback when the exchange cannot be reached.
+    """
+
+    def __init__(self, path, ttl: float = METADATA_TTL) -> None:
+        self.path = Path(path)
+        self.ttl = ttl
+        self.entries = {}
+        self.load()
+
+    def load(self) -> None:
+        try:
+            with open(self.path, "r") as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            self.entries = {}
+        except Exception as ex:
+            print(f"ERROR: MetadataCache.load, {ex}")
+            self.entries = {}
+
+    def save(self) -> None:
+        # write then rename, a crash never leaves a truncated cache behind
+        tmp = self.path.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump(self.entries, f, indent=4)
+        os.replace(tmp, self.path)
+
+    def age(self, kind: str, symbol: str) -> float:
+        entry = self.entries.get(kind, {}).get(symbol)
+        if entry is None:
+            return math.inf
+        return time.time() - entry["updated"]
+
+    def expired(self, kind: str, symbol: str) -> bool:
+        return self.age(kind, symbol) >= self.ttl
+
+    def get(self, kind: str, symbol: str, allow_stale: bool = False):
+        """Cached data, None if missing or expired."""
+        entry = self.entries.get(kind, {}).get(symbol)
+        if entry is None or (not allow_stale and self.expired(kind, symbol)):
+            return None
+        return entry["data"]
+
+    def set(self, kind: str, symbol: str, data) -> None:
+        self.entries.setdefault(kind, {})[symbol] = {
+            "data": data,
+            "updated": time.time(),
+        }
+        self.save()
+
+
+class BalanceCache:
+    """Account balances fed by the private wallet stream.
+
+    REST is only needed to reconcile after the stream could have missed an
+    update: on (re)connect, or when wallet messages arrive out of order.
+    """
+
+    def __init__(self) -> None:
+        self.coins = {}
+        self.updated = 0.0
+        self.source = None
+        self.last_creation_time = 0
+        self.stream_updates = 0
+        self.reconciles = 0
+        self.needs_reconcile = asyncio.Event()
+
+    @property
+    def is_empty(self) -> bool:
+        return self.updated == 0.0
+
+    @property
+    def age(self):
+        """Seconds since the last update, None if never updated."""
+        if self.is_empty:
+            return None
+        return time.time() - self.updated
+
+    def invalidate(self, reason: str) -> None:
+        """Request a REST reconciliation."""
+        print(f"INFO: balance reconcile requested, {reason}")
+        self.needs_reconcile.set()
+
+    def apply_stream(self, msg: dict) -> list:
+        """Update from a wallet topic message, returns the coin list."""
+        creation_time = msg.get("creationTime", 0)
+        if creation_time and creation_time < self.last_creation_time:
+            # an older snapshot arrived after a newer one, some update may be lost
+            self.invalidate("wallet sequence break")
+            return []
+
+        self.last_creation_time = max(self.last_creation_time, creation_time)
+        self.stream_updates += 1
+        coins = msg["data"][0]["coin"]
+        self._apply(coins, "stream")
+        return coins
+
+    def as_list(self) -> list:
+        """Cached balances in the wallet message coin list format."""
+        return [{"coin": coin, "equity": equity} for coin, equity in self.coins.items()]
+
+    def apply_rest(self, coins: list) -> list:
+        """Replace with /v5/account/wallet-balance, returns the coin list.
+
+        The endpoint omits zero balance coins, the cached coins it no longer
+        lists are returned with a zero equity so their holders see them go.
+        """
+        self.reconciles += 1
+        dropped = sorted(self.coins.keys() - {coin["coin"] for coin in coins})
+        self.coins = {}
+        self._apply(coins, "rest")
+        return coins + [{"coin": coin, "equity": "0"} for coin in dropped]
+
+    def _apply(self, coins: list, source: str) -> None:
+        for coin in coins:
+            self.coins[coin["coin"]] = float(coin["equity"] or 0.0)
+        self.updated = time.time()
+        self.source = source
+
+
+class TokenBucket:
+    """Token bucket for one class of REST endpoints.
+
+    Refills continuously at ``rate`` tokens per second up to ``capacity``.
+    The exchange's rate-limit headers overwrite the local estimate, so the
+    bucket follows the real quota instead of drifting from it.
+    """
+
+    def __init__(self, rate: float, capacity: float, reserve: float = 0.0) -> None:
+        """Initialize bucket.
+
+        Args:
+            rate: Refill rate in tokens per second
+            capacity: Maximum number of tokens
+            reserve: Tokens kept back for high priority requests
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.reserve = reserve
+        self.tokens = capacity
+        self.blocked_until = 0.0
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def take(self, priority: int) -> float:
+        """Take one token.
+
+        Args:
+            priority: Request priority, PRIORITY_ORDER may use the reserve
+
+        Returns:
+            0.0 if the token was taken, otherwise seconds to wait before retrying
+        """
+        now = time.monotonic()
+        if now < self.blocked_until:
+            return self.blocked_until - now
+
+        self._refill(now)
+        need = 1.0 if priority == PRIORITY_ORDER else 1.0 + self.reserve
+        if self.tokens >= need:
+            self.tokens -= 1.0
+            return 0.0
+
+        return (need - self.tokens) / self.rate
+
+    def update(self, limit: int, remaining: int, reset_ms: int) -> None:
+        """Synchronize bucket with exchange rate-limit headers.
+
+        Args:
+            limit: X-Bapi-Limit, requests allowed per second
+            remaining: X-Bapi-Limit-Status, requests left in the current window
+            reset_ms: X-Bapi-Limit-Reset-Timestamp, unix time in ms
+        """
+        now = time.monotonic()
+        self._refill(now)
+        if limit > 0:
+            self.capacity = float(limit)
+            self.rate = float(limit)
+        self.tokens = min(self.tokens, float(remaining))
+        if remaining <= 0 and reset_ms:
+            self.block(reset_ms / 1000.0 - time.time())
+
+    def block(self, seconds: float) -> None:
+        """Refuse all requests for the given number of seconds."""
+        if seconds > 0.0:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.tokens = 0.0
+
+
+PRIORITY_ORDER = 0
+PRIORITY_POLL = 1
+
+# Bybit v5: "Too many visits. Exceeded the API Rate Limit."
+RET_RATE_LIMIT = 10006
+
+
+class RequestScheduler:
+    """Rate-limit aware scheduler for Bybit REST requests.
+
+    Every request takes a token from its endpoint class bucket and from the
+    shared IP bucket. Order requests have their own class bucket and may use
+    the IP reserve, so balance polls and market data never delay them.
+    Identical GET requests in flight are coalesced into one round-trip.
+    """
+
+    # endpoint prefix -> class, first match wins
+    ENDPOINT_CLASSES = (
+        ("v5/order/", "order"),
+        ("v5/account/", "account"),
+        ("v5/market/", "market"),
+    )
+
+    def __init__(self) -> None:
+        # UID limits per second (spot order 20/s, wallet-balance 50/s),
+        # IP limit is 600 requests per 5 seconds for all endpoints
+        self.buckets = {
+            "order": TokenBucket(rate=20.0, capacity=20.0),
+            "account": TokenBucket(rate=10.0, capacity=10.0),
+            "market": TokenBucket(rate=10.0, capacity=20.0),
+            "ip": TokenBucket(rate=120.0, capacity=120.0, reserve=20.0),
+        }
+        self._inflight: dict = {}
+        self.stats = {
+            "requests": 0,
+            "coalesced": 0,
+            "throttled": 0,
+            "rate_limited": 0,
+        }
+
+    def classify(self, endpoint: str) -> str:
+        path = endpoint.lstrip("/")
+        for prefix, endpoint_class in self.ENDPOINT_CLASSES:
+            if path.startswith(prefix):
+                return endpoint_class
+        return "market"
+
+    async def acquire(self, endpoint_class: str, priority: int) -> None:
+        """Wait until both the class bucket and the IP bucket allow a request."""
+        buckets = (self.buckets[endpoint_class], self.buckets["ip"])
+        throttled = False
+        while True:
+            delay = buckets[0].take(priority)
+            if delay == 0.0:
+                delay = buckets[1].take(priority)
+                if delay == 0.0:
+                    break
+                # give the class token back, the IP bucket is the bottleneck
+                buckets[0].tokens += 1.0
+
+            throttled = True
+            await asyncio.sleep(delay)
+
+        self.stats["requests"] += 1
+        if throttled:
+            self.stats["throttled"] += 1
+
+    def update(self, endpoint_class: str, headers, ret_code=None) -> None:
+        """Feed response headers and retCode back into the class bucket."""
+        bucket = self.buckets[endpoint_class]
+        limit = headers.get("X-Bapi-Limit")
+        remaining = headers.get("X-Bapi-Limit-Status")
+        reset_ms = headers.get("X-Bapi-Limit-Reset-Timestamp")
+
+        if remaining is not None:
+            try:
+                bucket.update(int(limit or 0), int(remaining), int(reset_ms or 0))
+            except ValueError:
+                pass
+
+        if ret_code == RET_RATE_LIMIT:
+            self.stats["rate_limited"] += 1
+            if not reset_ms:
+                bucket.block(1.0)
+
+    async def coalesce(self, key, request):
+        """Run ``request()`` once for all concurrent callers with the same key.
+
+        The round-trip runs in its own task that every caller shields, so a
+        cancelled caller does not cancel the request of the others.
+        """
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(task)
+
+        task = asyncio.ensure_future(request())
+        self._inflight[key] = task
+        task.add_done_callback(lambda done: self._request_done(key, done))
+        return await asyncio.shield(task)
+
+    def _request_done(self, key, task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # mark retrieved, callers (if any are left) get it through shield
+        if not task.cancelled():
+            task.exception()
+
+
+class QuantityStep:
+    """Exact decimal step (e.g. basePrecision "0.000001") for float quantities."""
+
+    def __init__(self, step: str) -> None:
+        step_dec = decimal.Decimal(step).normalize()
+        self.decimals = max(-step_dec.as_tuple().exponent, 0)
+        self.scale = 10**self.decimals
+        self.step_units = int(step_dec * self.scale)
+
+    def floor_units(self, qty: float) -> int:
+        # 0.29 * 100 = 28.999999999999996 must stay 29 units
+        units = math.floor(qty * self.scale + 1e-6)
+        return units - units % self.step_units
+
+    def format(self, units: int) -> str:
+        if self.decimals == 0:
+            return str(units)
+        return f"{units // self.scale}.{units % self.scale:0{self.decimals}d}"
+
+    def floor(self, qty: float) -> float:
+        return self.floor_units(qty) / self.scale
+
+
+class InstrumentQuantizer:
+    """Order quantity quantizer and payload template for one spot instrument.
+
+    Built once from the instrument ``lotSizeFilter``. Market Buy quantities
+    are in quote coin (quotePrecision, minOrderAmt), Sell quantities are in
+    base coin (basePrecision, minOrderQty). Quantities are rounded down to
+    the step, so an order never asks for more than the balance it was sized
+    from. The JSON payload is pre-split around the variable fields.
+    """
+
+    def __init__(
+        self,
+        symbol: str,
+        base_precision: str = "0.000001",
+        quote_precision: str = "0.00000001",
+        min_order_qty: str = "0",
+        min_order_amt: str = "0",
+    ) -> None:
+        self.symbol = symbol
+        self.steps = {"Buy": QuantityStep(quote_precision), "Sell": QuantityStep(base_precision)}
+        self.minimum = {"Buy": float(min_order_amt), "Sell": float(min_order_qty)}
+        self._templates = {
+            side: (
+                '{"category":"spot","symbol":"%s","side":"%s","orderType":"Market","qty":"'
+                % (symbol, side),
+                '","timeInForce":"IOC","orderLinkId":"',
+                '","isLeverage":0}',
+            )
+            for side in ("Buy", "Sell")
+        }
+
+    @classmethod
+    def from_lot_size_filter(cls, symbol: str, lot_size_filter: dict):
+        return cls(
+            symbol,
+            base_precision=lot_size_filter["basePrecision"],
+            quote_precision=lot_size_filter["quotePrecision"],
+            min_order_qty=lot_size_filter["minOrderQty"],
+            min_order_amt=lot_size_filter["minOrderAmt"],
+        )
+
+    def quantize(self, side: str, qty: float):
+        """Qty string rounded down to the step, None if below the minimum."""
+        step = self.steps[side]
+        units = step.floor_units(qty)
+        if units <= 0 or units / step.scale < self.minimum[side]:
+            return None
+        return step.format(units)
+
+    def floor(self, side: str, qty: float) -> float:
+        return self.steps[side].floor(qty)
+
+    def payload(self, side: str, qty: float, order_link_id: str = ""):
+        """Order create JSON body, None if qty is below the minimum."""
+        str_quantity = self.quantize(side, qty)
+        if str_quantity is None:
+            return None
+        head, middle, tail = self._templates[side]
+        return head + str_quantity + middle + order_link_id + tail
+
+    def batch_item(self, side: str, qty: float, order_link_id: str = ""):
+        """Order entry of a create-batch request, None if qty is below the minimum."""
+        str_quantity = self.quantize(side, qty)
+        if str_quantity is None:
+            return None
+        return {
+            "symbol": self.symbol,
+            "side": side,
+            "orderType": "Market",
+            "qty": str_quantity,
+            "timeInForce": "IOC",
+            "orderLinkId": order_link_id,
+            "isLeverage": 0,
+        }
+
+
+# Bybit v5 spot retCodes used by the order manager
+RET_INSUFFICIENT_BALANCE = 170131
+RET_DUPLICATE_ORDER_LINK_ID = 170141
+# server timeout, request expired, rate limit, internal error, backend timeout
+RET_RETRYABLE = (10000, 10002, RET_RATE_LIMIT, 10016, 170007)
+# orders per v5/order/create-batch request for spot
+BATCH_ORDER_LIMIT = 10
+
+
+class Order:
+    """Client side state of one order, keyed by its orderLinkId."""
+
+    # new -> sent -> acked -> filled, or rejected / failed / cancelled
+    IN_FLIGHT = ("new", "sent", "acked")
+
+    def __init__(self, link_id: str, symbol: str, side: str, qty: float) -> None:
+        self.link_id = link_id
+        self.symbol = symbol
+        self.side = side
+        self.qty = qty
+        self.state = "new"
+        self.attempts = 0
+        self.adjustments = 0
+        self.base_link_id = link_id
+        self.order_id = ""
+        self.ret_code = None
+        self.ret_msg = ""
+        self.avg_price = 0.0
+        self.filled_qty = 0.0
+        self.created = time.monotonic()
+        self.sent_ns = 0
+
+    @property
+    def in_flight(self) -> bool:
+        return self.state in self.IN_FLIGHT
+
+    def as_dict(self) -> dict:
+        return {
+            "link_id": self.link_id,
+            "symbol": self.symbol,
+            "side": self.side,
+            "qty": self.qty,
+            "state": self.state,
+            "attempts": self.attempts,
+            "order_id": self.order_id,
+            "ret_code": self.ret_code,
+            "avg_price": self.avg_price,
+            "filled_qty": self.filled_qty,
+        }
+
+
+class OrderManager:
+    """Asynchronous market order placement with idempotent retries.
+
+    Every order gets a deterministic orderLinkId (process prefix + sequence).
+    Transient failures are retried within milliseconds with the same id, so
+    a request that reached the exchange before timing out is answered with
+    "duplicate" instead of placing a second order. The strategy submits and
+    continues; order state follows the REST acknowledgement and the private
+    order stream.
+    """
+
+    FILLED_STATUSES = ("Filled", "PartiallyFilledCanceled")
+    CLOSED_STATUSES = ("Cancelled", "Rejected", "Deactivated")
+
+    def __init__(
+        self,
+        client,
+        latency=None,
+        max_attempts: int = 6,
+        retry_delay: float = 0.02,
+        ack_timeout: float = 10.0,
+        prefix: str = "",
+    ) -> None:
+        """Initialize order manager.
+
+        Args:
+            client: REST Client
+            latency: LatencyTracker for order stages
+            max_attempts: Attempts per order including balance adjustments
+            retry_delay: First retry delay in seconds, doubled every retry
+            ack_timeout: Seconds an acknowledged order may wait for its fill event
+            prefix: Added to the orderLinkId prefix, keeps managers sharing an account apart
+        """
+        self.client = client
+        self.latency = latency
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.ack_timeout = ack_timeout
+        self.prefix = f"vh{int(time.time()):x}{prefix[:16]}"
+        self.orders = {}
+        self.tasks = set()
+        self._seq = 0
+        # orderIds of fills already accounted, for orders placed outside the manager
+        self._processed = deque(maxlen=1000)
+
+    def next_link_id(self) -> str:
+        self._seq += 1
+        return f"{self.prefix}-{self._seq}"
+
+    def in_flight(self, symbol: str) -> bool:
+        """True while an order for the symbol awaits acknowledgement or fill."""
+        now = time.monotonic()
+        for order in self.orders.values():
+            if order.symbol != symbol or not order.in_flight:
+                continue
+            if order.state == "acked" and now - order.created > self.ack_timeout:
+                # fill event lost, the balance reconciliation will catch up
+                order.state = "unconfirmed"
+                continue
+            return True
+        return False
+
+    def submit(self, symbol: str, side: str, qty: float) -> Order:
+        """Start placing an order and return without waiting for it."""
+        order = Order(self.next_link_id(), symbol, side, qty)
+        self.orders[order.link_id] = order
+        task = asyncio.get_running_loop().create_task(self._place(order))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        self._prune()
+        return order
+
+    async def wait(self, order: Order) -> Order:
+        """Wait until the order placement is finished (acked or failed)."""
+        while order.state in ("new", "sent"):
+            await asyncio.sleep(0.01)
+        return order
+
+    def _prune(self, keep: int = 100) -> None:
+        while len(self.orders) > keep:
+            oldest = next(iter(self.orders.values()))
+            if oldest.in_flight:
+                break
+            del self.orders[oldest.link_id]
+
+    def _mark_sent(self, order: Order) -> None:
+        order.attempts += 1
+        order.state = "sent"
+        order.sent_ns = time.monotonic_ns()
+        if self.latency is not None and order.attempts == 1:
+            self.latency.order_sent_ns = order.sent_ns
+            self.latency.record(
+                "decision_to_send", self.latency.decision_ns, order.sent_ns
+            )
+            self.latency.record("tick_to_order", self.latency.tick_ns, order.sent_ns)
+
+    def _resolve(self, order: Order, resp_status: int, ret_code, ret_msg, order_id="") -> bool:
+        """Apply one placement answer to the order.
+
+        Returns:
+            True if the order has to be sent again
+        """
+        order.ret_code = ret_code
+        order.ret_msg = ret_msg
+
+        if resp_status == 200 and ret_code == 0:
+            order.order_id = order_id
+            if order.state == "sent":
+                order.state = "acked"
+            return False
+
+        if ret_code == RET_DUPLICATE_ORDER_LINK_ID:
+            # an earlier attempt was placed, wait for its events
+            if order.state == "sent":
+                order.state = "acked"
+            return False
+
+        if resp_status >= 500 or ret_code in RET_RETRYABLE:
+            return True
+
+        if ret_code == RET_INSUFFICIENT_BALANCE and order.adjustments < 3:
+            # rejected, nothing was placed: a new id with a slightly smaller qty is safe
+            order.adjustments += 1
+            order.qty *= 0.99
+            del self.orders[order.link_id]
+            order.link_id = f"{order.base_link_id}-{order.adjustments}"
+            self.orders[order.link_id] = order
+            return True
+
+        print(f"ERROR: order {order.link_id} rejected, {ret_code}: {ret_msg}")
+        order.state = "rejected"
+        return False
+
+    async def _place(self, order: Order) -> None:
+        delay = self.retry_delay
+
+        while order.attempts < self.max_attempts:
+            self._mark_sent(order)
+            try:
+                resp_data, resp_status = await self.client.market_order(
+                    symbol=order.symbol,
+                    side=order.side,
+                    quantity_size=order.qty,
+                    order_link_id=order.link_id,
+                )
+            except Exception as ex:
+                # the request may have reached the exchange, retry with the same id
+                print(f"ERROR: order {order.link_id}, {ex}")
+                await asyncio.sleep(delay)
+                delay *= 2.0
+                continue
+
+            if self.latency is not None:
+                self.latency.record("order_ack", order.sent_ns)
+            print(resp_data)
+
+            if not isinstance(resp_data, dict):
+                resp_data = {}
+            retry = self._resolve(
+                order,
+                resp_status,
+                resp_data.get("retCode"),
+                resp_data.get("retMsg", ""),
+                (resp_data.get("result") or {}).get("orderId", ""),
+            )
+            if not retry:
+                return
+            if order.ret_code != RET_INSUFFICIENT_BALANCE:
+                await asyncio.sleep(delay)
+                delay *= 2.0
+
+        order.state = "failed"
+
+    def submit_batch(self, items) -> list:
+        """Start placing several orders in as few batch requests as possible.
+
+        Args:
+            items: Iterable of (symbol, side, qty)
+
+        Returns:
+            Orders in the same order as items
+        """
+        orders = []
+        for symbol, side, qty in items:
+            order = Order(self.next_link_id(), symbol, side, qty)
+            self.orders[order.link_id] = order
+            orders.append(order)
+
+        task = asyncio.get_running_loop().create_task(self._place_batch(orders))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        self._prune()
+        return orders
+
+    async def _place_batch(self, orders: list) -> None:
+        delay = self.retry_delay
+        pending = list(orders)
+
+        while pending:
+            pending = [order for order in pending if order.attempts < self.max_attempts]
+            if not pending:
+                break
+            for order in pending:
+                self._mark_sent(order)
+
+            try:
+                results = await self.client.batch_orders(
+                    [(o.symbol, o.side, o.qty, o.link_id) for o in pending]
+                )
+            except Exception as ex:
+                # any of the chunks may have been placed, retry all with the same ids
+                print(f"ERROR: batch order, {ex}")
+                await asyncio.sleep(delay)
+                delay *= 2.0
+                continue
+
+            retry = []
+            for order, (resp_status, ret_code, ret_msg, order_id) in zip(pending, results):
+                if self.latency is not None:
+                    self.latency.record("order_ack", order.sent_ns)
+                if self._resolve(order, resp_status, ret_code, ret_msg, order_id):
+                    retry.append(order)
+
+            pending = retry
+            if any(order.ret_code != RET_INSUFFICIENT_BALANCE for order in pending):
+                await asyncio.sleep(delay)
+                delay *= 2.0
+
+        for order in orders:
+            if order.state in ("new", "sent"):
+                order.state = "failed"
+
+    def on_order_event(self, data: dict) -> bool:
+        """Update order state from a private order stream item.
+
+        Returns:
+            True if the item is a fill that was not accounted yet
+        """
+        status = data.get("orderStatus", "")
+        order = self.orders.get(data.get("orderLinkId", ""))
+
+        if status not in self.FILLED_STATUSES:
+            if order is not None and status in self.CLOSED_STATUSES:
+                order.state = "cancelled"
+            return False
 
-    async def start(self, subscribe: list, callback, need_auth=False):
-        while 1:
-            await self.initialize()
-            print(f"INFO: ws start: {self.stream_url}")
-            try:
-                async with self.session.ws_connect(self.stream_url) as ws:
-                    if need_auth:
-                        data = await self._create_auth()
-                        await ws.send_str(
-                            json.dumps(data, ensure_ascii=False), compress=None
-                        )
-                        await asyncio.sleep(1.0)
-
-                    await ws.send_str(json.dumps(subscribe))  # , ensure_ascii=False))
-
-                    await asyncio.sleep(1.0)
-
-                    self.loop.create_task(self.ws_ping_loop(ws))
-
-                    async for msg in ws:
-                        match msg.type:
-                            case aiohttp.WSMsgType.TEXT:
-                                txt = msg.data
-                                if "ping" not in txt:
-                                    callback(json.loads(txt))
-                            case aiohttp.WSMsgType.BINARY:
-                                print("Binary: ", msg.data)
-                            case aiohttp.WSMsgType.PING:
-                                print("Ping received")
-                            case aiohttp.WSMsgType.PONG:
-                                print("Pong received")
-                            case aiohttp.WSMsgType.CLOSE:
-                                await ws.close()
-                                print(f"WARNING: ws start, close received, {subscribe}")
-                                break
-                            case aiohttp.WSMsgType.CLOSED:
-                                print(f"WARNING: ws start, closed, {subscribe}")
-                                break
-                            case aiohttp.WSMsgType.ERROR:
-                                print(
-                                    f"ERROR: ws, Error during receive, {subscribe}, {ws.exception()}"
-                                )
-                                break
-                            case _:
-                                print(f"WARNING: ws, unknown command: {msg}")
+        if order is None:
+            order_id = data.get("orderId", "")
+            if order_id in self._processed:
+                return False
+            self._processed.append(order_id)
+            return True
 
-            except Exception as ex:
-                print(f"ERROR: ws start, {subscribe}, {ex}")
-                print(f"{repr(traceback.extract_tb(ex.__traceback__))}")
+        if order.state == "filled":
+            return False
 
-            await asyncio.sleep(5.0)
+        order.state = "filled"
+        order.avg_price = float(data.get("avgPrice") or 0.0)
+        order.filled_qty = float(data.get("cumExecQty") or 0.0)
+        return True
 
 
 class Client:
@@ -249,6 +1734,8 @@ class Client:
         self.key = key
         self.secret = secret
         self.base_url = base_url
+        self.scheduler = RequestScheduler()
+        self.instruments = {}
         timeout = aiohttp.ClientTimeout(total=5)
         self.session = aiohttp.ClientSession(loop=self.loop, timeout=timeout)
 
@@ -260,7 +1747,23 @@ class Client:
         signature = hash.hexdigest()
         return signature
 
-    async def HTTP_Request(self, endPoint, method, payload, Info):
+    async def HTTP_Request(self, endPoint, method, payload, Info, priority=None):
+        endpoint_class = self.scheduler.classify(endPoint)
+        if priority is None:
+            priority = PRIORITY_ORDER if endpoint_class == "order" else PRIORITY_POLL
+
+        if method == "GET":
+            return await self.scheduler.coalesce(
+                (endPoint, payload),
+                lambda: self._send(endPoint, method, payload, endpoint_class, priority),
+            )
+
+        return await self._send(endPoint, method, payload, endpoint_class, priority)
+
+    async def _send(self, endPoint, method, payload, endpoint_class, priority):
+        await self.scheduler.acquire(endpoint_class, priority)
+
+        # sign after waiting for the token, so recv_window is not eaten by the queue
         recv_window = str(5000)
         time_stamp = str(int(time.time() * 10**3))
         signature = self.genSignature(payload, time_stamp, recv_window)
@@ -285,6 +1788,9 @@ class Client:
             ) as resp:
                 resp_data = await resp.json()
 
+        ret_code = resp_data.get("retCode") if isinstance(resp_data, dict) else None
+        self.scheduler.update(endpoint_class, resp.headers, ret_code)
+
         return resp_data, resp.status
 
     async def account(self):
@@ -301,7 +1807,7 @@ class Client:
 
     async def fee_rate(self, symbol):
         endpoint = "/v5/account/fee-rate"
-        params = f"symbol={symbol}"
+        params = f"category=spot&symbol={symbol}"
         resp_data, resp_status = await self.HTTP_Request(
             endpoint, "GET", params, "Fee-rate"
         )
@@ -311,22 +1817,27 @@ class Client:
 
         return resp_data
 
+    def register_instrument(self, symbol: str, lot_size_filter: dict):
+        """Build the order quantizer for a symbol from its lotSizeFilter."""
+        quantizer = InstrumentQuantizer.from_lot_size_filter(symbol, lot_size_filter)
+        self.instruments[symbol] = quantizer
+        return quantizer
+
+    def quantizer(self, symbol: str):
+        if symbol not in self.instruments:
+            self.instruments[symbol] = InstrumentQuantizer(symbol)
+        return self.instruments[symbol]
+
     async def limit_order(
         self, symbol: str, side: str, price: float, quantity_size: float
     ):
-        quantity = round(quantity_size, 5)
-        q = str(quantity)
-        zeros = "".join(["0"] * (8 - len(q)))
-        str_quantity = q + zeros
+        params = self.quantizer(symbol).payload(side, quantity_size)
+        if params is None:
+            print(f"ERROR: limit_order, qty below minimum: {quantity_size}")
+            return False, -1
 
         endpoint = "v5/order/create"
         method = "POST"
-        # orderLinkId=uuid.uuid4().hex
-
-        params = (
-            '{"category":"spot","symbol":"%s","side":"%s","orderType":"Market","qty":"%s","timeInForce":"IOC","orderLinkId":"","isLeverage":0}'
-            % (symbol, side, str_quantity)
-        )
         print(f"DEBUG: params: {params}")
 
         resp_data, resp_status = await self.HTTP_Request(
@@ -339,23 +1850,71 @@ class Client:
 
         return True, resp_data["retCode"]
 
-    async def market_order(self, symbol: str, side: str, quantity_size: float):
-        str_quantity = str(decimal.Decimal.from_float(quantity_size))
-        if len(str_quantity) > 8:
-            str_quantity = str_quantity[:8]
+    async def market_order(
+        self, symbol: str, side: str, quantity_size: float, order_link_id: str = ""
+    ):
+        params = self.quantizer(symbol).payload(side, quantity_size, order_link_id)
+        if params is None:
+            # nothing is sent, same shape as an HTTP error for the callers
+            return {"retCode": -1, "retMsg": f"qty below minimum: {quantity_size}"}, 400
 
         endpoint = "v5/order/create"
         method = "POST"
-        # orderLinkId=uuid.uuid4().hex
-
-        params = (
-            '{"category":"spot","symbol":"%s","side":"%s","orderType":"Market","qty":"%s","timeInForce":"IOC","orderLinkId":"","isLeverage":0}'
-            % (symbol, side, str_quantity)
-        )
         print(f"DEBUG: params: {params}")
 
         return await self.HTTP_Request(endpoint, method, params, "Create")
 
+    async def batch_orders(self, orders, chunk_size: int = BATCH_ORDER_LIMIT):
+        """Place market orders across symbols through v5/order/create-batch.
+
+        Args:
+            orders: List of (symbol, side, qty, order_link_id)
+            chunk_size: Orders per request, the exchange limit for spot is 10
+
+        Returns:
+            List of (resp_status, retCode, retMsg, orderId) in the order of orders
+        """
+        results = [None] * len(orders)
+        chunks = []
+        for index, (symbol, side, qty, order_link_id) in enumerate(orders):
+            item = self.quantizer(symbol).batch_item(side, qty, order_link_id)
+            if item is None:
+                # nothing is sent, same shape as an HTTP error for the callers
+                results[index] = (400, -1, f"qty below minimum: {qty}", "")
+                continue
+            if not chunks or len(chunks[-1]) == chunk_size:
+                chunks.append([])
+            chunks[-1].append((index, item))
+
+        async def send(chunk):
+            params = json.dumps(
+                {"category": "spot", "request": [item for _, item in chunk]},
+                separators=(",", ":"),
+            )
+            print(f"DEBUG: params: {params}")
+            resp_data, resp_status = await self.HTTP_Request(
+                "v5/order/create-batch", "POST", params, "Create-batch"
+            )
+            if not isinstance(resp_data, dict):
+                resp_data = {}
+
+            ret_code = resp_data.get("retCode")
+            if resp_status != 200 or ret_code != 0:
+                # the whole request failed, every order gets its error
+                for index, _ in chunk:
+                    results[index] = (resp_status, ret_code, resp_data.get("retMsg", ""), "")
+                return
+
+            placed = (resp_data.get("result") or {}).get("list") or []
+            codes = (resp_data.get("retExtInfo") or {}).get("list") or []
+            for i, (index, _) in enumerate(chunk):
+                code = codes[i] if i < len(codes) else {"code": 0, "msg": "OK"}
+                order_id = placed[i].get("orderId", "") if i < len(placed) else ""
+                results[index] = (resp_status, code.get("code"), code.get("msg", ""), order_id)
+
+        await asyncio.gather(*(send(chunk) for chunk in chunks))
+        return results
+
     async def get_klines(self, symbol, interval=1):
         url = "".join([self.base_url, "/v5/market/kline"])
 
@@ -366,8 +1925,10 @@ class Client:
             "limit": 1000,
         }
 
+        await self.scheduler.acquire("market", PRIORITY_POLL)
         async with self.session.get(url, params=params) as resp:
             data = await resp.json()
+            self.scheduler.update("market", resp.headers, data.get("retCode"))
             # print(resp.status, data)
             return data
         # except:
@@ -550,8 +2111,17 @@ class DynamicOrderScale:
         )
 
 
-class TradeAnalyse:
-    def __init__(self, pair, log_file: str = "trading.log") -> None:
+class MarketIndicators:
+    """Indicators computed from the price stream of one symbol.
+
+    Shared by every account trading the symbol: ticks are applied once by
+    the owning TradeAnalyse, the others only read the result.
+    """
+
+    def __init__(self, config: Optional[StrategyConfig] = None, track_impulse: bool = True) -> None:
+        config = config if config is not None else StrategyConfig.from_env()
+        # impulse stats are only displayed, the backtest skips them
+        self.track_impulse = track_impulse
         self.prices = deque(maxlen=60 * 60 * 24)
         self.diffs = deque(maxlen=3)
         self.diffs_pool = deque(maxlen=int(60 * 15))
@@ -562,41 +2132,33 @@ class TradeAnalyse:
         self.impuls_harmonic = 0.0
         self.impuls_percent = 0.0
         self.impuls_harmonic_percent = 0.0
-        self.pair = pair
-        self.pair_balance = dict()
-        self.native_balance = (0.0, 0.0)
-        self.trade_profit = 0.0
-        self.price_diff = 0.1
-        self.traded_price = 0.0
         self.m1_timer = 0.0
-        self.buy_price_mean = 0.0
+        self.changed = False
         self.local_range = 1000.0
-        self.local_range_win = deque(maxlen=AMPLITUDE_TIME_FRAME)
-        self.ma_length = MA_LENGTH
+        self.local_range_win = deque(maxlen=config.amplitude_time_frame)
+        self.ma_length = config.ma_length
         self.gap = self.ma_length / 4.8
         self.ma_fast = 0.0
         self.ma_fast_m = 0.0
         self.ma_trend = 0.0
         self.ma_trend_prev = 10000000.0
         self.ma_trend_win = deque(maxlen=int(self.ma_length))
-        self.trend_crossover = Crossover()
-        self.trend_crossunder = Crossunder()
-        self.rebalance_top = REBALANCE_TOP
-        self.rebalance_bottom = REBALANCE_BOTTOM
-        self.min_profitable_percent = REBALANCE_TOP
-        self.order_scale = DynamicOrderScale(self.rebalance_bottom, self.rebalance_top)
-        self.order_scale.enabled = REBALANCE_ISDYNAMIC
-        self.fee = FEE / 100.0  # 0.1% = 0.001
         self.ATH = 999000.0
-        self.working_range = self.ATH / 100.0 * RANGE
-        self.ratio_per_point = 1.0 / self.working_range
-        self.min_max_ratio = [MIN_RATIO, MAX_RATIO]
-        self.log_file = log_file
-        self.real_ratio = 0.0
-        self.portfolio_ratio = self.min_max_ratio[0]
-        self.percent_diff = 0.0
-        self.bot_token = TGBOT_TOKEN
-        self.bot_chatID = TGBOT_CHATID
+
+    def snapshot(self, history: int = 2):
+        """Independent copy keeping only the last ``history`` prices.
+
+        Small enough to hand over to another process, a backtest continues
+        from it without the warmup.
+        """
+        copy = MarketIndicators.__new__(MarketIndicators)
+        copy.__dict__.update(self.__dict__)
+        copy.prices = deque(list(self.prices)[-history:], maxlen=self.prices.maxlen)
+        copy.diffs = deque(self.diffs, maxlen=self.diffs.maxlen)
+        copy.diffs_pool = deque(self.diffs_pool, maxlen=self.diffs_pool.maxlen)
+        copy.local_range_win = deque(self.local_range_win, maxlen=self.local_range_win.maxlen)
+        copy.ma_trend_win = deque(self.ma_trend_win, maxlen=self.ma_trend_win.maxlen)
+        return copy
 
     def fft(self, x):
         N = len(x)
@@ -620,22 +2182,6 @@ class TradeAnalyse:
 
         return average_amplitude
 
-    def get_profitable_range(self, price: float):
-        # 1000 / 118000 = 0,008474576               fee = 1.0
-        # 0,008474576 * 118010 = 1000,08471376     fee = 1.0
-        # 1000,08471376 − 1000 = 0,08471376
-        # (2,0 ÷ 0,08471376) * 10 = 236,894521293 pips
-
-        # 118237 / 1001.940338
-        # 118000 / 999.932
-        # 1001.940338 − 999.932 = 2,008338
-
-        fee_amount = 1000.0 * self.fee * 2.0
-        val = 1000.0 / price
-        val_up_one = val * (price + 1.0)
-        val_one_pip = val_up_one - 1000.0
-        return fee_amount / val_one_pip
-
     def sma(self, deq: deque, price, temp=False):
         if temp:
             win = list(deq)[1:]
@@ -693,17 +2239,140 @@ class TradeAnalyse:
                     impuls_pos / (impuls_pos + impuls_neg) * 100 - 50.0, 2
                 )
 
+    def update(self, price, m1_time, live=True) -> bool:
+        """Apply one tick, returns True if it opened a new minute."""
+        self.changed = self.m1_timer != m1_time
+        if self.changed:
+            self.m1_timer = m1_time
+
+        if self.track_impulse:
+            self.count_power_s1(price)
+        self.prices.append(price)
+
+        if not live:
+            self.local_range_win.append(price)
+            self.ma_trend = round(self.sma(self.ma_trend_win, price), 2) - self.gap
+            self.ma_fast_m = round(self.ema(int(self.ma_length), self.ma_fast_m, price), 2)
+            return self.changed
+
+        if self.changed:
+            self.local_range_win.append(price)
+            self.local_range = int(max(self.local_range_win) - min(self.local_range_win))
+
+            self.ma_trend_prev = self.ma_trend
+            self.ma_trend = round(self.sma(self.ma_trend_win, price), 2) - self.gap
+            self.ma_fast_m = round(self.ema(int(self.ma_length), self.ma_fast_m, price), 2)
+
+        return self.changed
+
+
+def _market_field(name: str):
+    """TradeAnalyse attribute stored in its MarketIndicators."""
+    return property(
+        lambda self: getattr(self.market, name),
+        lambda self, value: setattr(self.market, name, value),
+    )
+
+
+class TradeAnalyse:
+    # market state, shared between accounts trading the same symbol
+    prices = _market_field("prices")
+    diffs_pool = _market_field("diffs_pool")
+    impuls = _market_field("impuls")
+    impuls_harmonic = _market_field("impuls_harmonic")
+    impuls_percent = _market_field("impuls_percent")
+    impuls_harmonic_percent = _market_field("impuls_harmonic_percent")
+    m1_timer = _market_field("m1_timer")
+    local_range = _market_field("local_range")
+    local_range_win = _market_field("local_range_win")
+    ma_length = _market_field("ma_length")
+    gap = _market_field("gap")
+    ma_fast_m = _market_field("ma_fast_m")
+    ma_trend = _market_field("ma_trend")
+    ma_trend_prev = _market_field("ma_trend_prev")
+    ma_trend_win = _market_field("ma_trend_win")
+    ATH = _market_field("ATH")
+
+    def __init__(
+        self,
+        pair,
+        log_file: str = "trading.log",
+        market=None,
+        config: Optional[StrategyConfig] = None,
+        quiet: bool = False,
+    ) -> None:
+        """Initialize strategy state of one account.
+
+        Args:
+            pair: [base, quote] coins
+            log_file: Trading log of the account
+            market: Shared MarketIndicators, updated by its owner; a private one if None.
+                MA length and amplitude window of a shared one come from the owner config
+            config: Strategy parameters, StrategyConfig.from_env() if None
+            quiet: No console output and trading log, for backtests
+        """
+        self.config = config if config is not None else StrategyConfig.from_env()
+        self.quiet = quiet
+        self.owns_market = market is None
+        self.market = market if market is not None else MarketIndicators(self.config)
+        self.pair = pair
+        self.pair_balance = dict()
+        self.native_balance = (0.0, 0.0)
+        self.trade_profit = 0.0
+        self.price_diff = 0.1
+        self.traded_price = 0.0
+        self.buy_price_mean = 0.0
+        self.trend_crossover = Crossover()
+        self.trend_crossunder = Crossunder()
+        self.rebalance_top = self.config.rebalance_top
+        self.rebalance_bottom = self.config.rebalance_bottom
+        self.min_profitable_percent = self.config.rebalance_top
+        self.order_scale = DynamicOrderScale(self.rebalance_bottom, self.rebalance_top)
+        self.order_scale.enabled = self.config.rebalance_isdynamic
+        self.fee = self.config.fee / 100.0  # 0.1% = 0.001
+        self.working_range = self.ATH / 100.0 * self.config.range
+        self.ratio_per_point = 1.0 / self.working_range
+        self.min_max_ratio = [self.config.min_ratio, self.config.max_ratio]
+        self.log_file = log_file
+        self.real_ratio = 0.0
+        self.portfolio_ratio = self.min_max_ratio[0]
+        self.percent_diff = 0.0
+        self.bot_token = TGBOT_TOKEN
+        self.bot_chatID = TGBOT_CHATID
+        # called without arguments after every live tick has updated the indicators
+        self.listeners = []
+
+    def append_diff(self, price: float):
+        self.market.append_diff(price)
+
+    def get_profitable_range(self, price: float):
+        # 1000 / 118000 = 0,008474576               fee = 1.0
+        # 0,008474576 * 118010 = 1000,08471376     fee = 1.0
+        # 1000,08471376 − 1000 = 0,08471376
+        # (2,0 ÷ 0,08471376) * 10 = 236,894521293 pips
+
+        # 118237 / 1001.940338
+        # 118000 / 999.932
+        # 1001.940338 − 999.932 = 2,008338
+
+        fee_amount = 1000.0 * self.fee * 2.0
+        val = 1000.0 / price
+        val_up_one = val * (price + 1.0)
+        val_one_pip = val_up_one - 1000.0
+        return fee_amount / val_one_pip
+
     def change_portfolio_ratio(self, price, ratio):
-        if self.ATH == 999000.0:
+        market = self.market
+        if market.ATH == 999000.0:
             return 1.0
 
-        if price > self.ATH:
-            self.ATH = price
+        if price > market.ATH:
+            market.ATH = price
 
-        self.working_range = self.ATH / 100.0 * RANGE
+        self.working_range = market.ATH / 100.0 * self.config.range
         self.ratio_per_point = 1.0 / self.working_range
 
-        ratio += (self.prices[-2] - price) * self.ratio_per_point
+        ratio += (market.prices[-2] - price) * self.ratio_per_point
 
         if ratio < self.min_max_ratio[0]:
             ratio = self.min_max_ratio[0]
@@ -723,6 +2392,97 @@ class TradeAnalyse:
         self.percent_diff = self.trade_profit / total * 100.0
         self.price_diff = price - self.traded_price
 
+    def trade_signal(self):
+        """Check MA crossovers and rebalance conditions for the last tick.
+
+        Returns:
+            Tuple (crossed, action): crossed is True when the fast EMA crossed
+            the trend MA, action is "buy", "sell" or None
+        """
+        market = self.market
+        ma_trend = market.ma_trend
+        ma_fast_m = market.ma_fast_m
+        if ma_trend == 0.0 or ma_fast_m == 0.0:
+            return False, None
+
+        trend = ma_trend - market.ma_trend_prev
+        crossed_over = self.trend_crossover.cross_over(ma_fast_m, ma_trend)
+        crossed_under = self.trend_crossunder.cross_under(ma_fast_m, ma_trend)
+
+        if crossed_over:
+            # don't BUY while trend going down
+            if trend < 1.0:
+                return True, None
+
+            if abs(self.percent_diff) < self.rebalance_bottom:
+                return True, None
+
+            if self.trade_profit < 0.0 and abs(self.price_diff) > self.local_range:
+                return True, "buy"
+
+        if crossed_under:
+            # don't SELL while trend going up
+            if trend > -1.0:
+                return True, None
+
+            ### To do: add option to sell all at min ratio
+            # if self.portfolio_ratio - 0.05 < self.min_max_ratio[0]:
+            #     return True, "sell_all"
+
+            if abs(self.percent_diff) < self.rebalance_top:
+                return True, None
+
+            if self.trade_profit > 0.0 and abs(self.price_diff) > self.local_range:
+                return True, "sell"
+
+        return crossed_over or crossed_under, None
+
+    def order_size(self, action: str, price: float, min_order_qty: float, min_order_amt: float):
+        """Size of the order for a trade_signal action, 0.0 if below the minimum.
+
+        Buy sizes are in quote coin, sell sizes in base coin.
+        """
+        if action == "buy":
+            qty = math.fabs(self.trade_profit)
+            if qty < min_order_amt or self.native_balance[1] < min_order_amt:
+                return 0.0
+            return min(qty, self.native_balance[1])
+
+        if action == "sell":
+            qty = self.trade_profit / price
+            if qty < min_order_qty:
+                return 0.0
+            return qty
+
+        return 0.0
+
+    def record_buy(self, price: float, quote_qty: float, base_qty: float):
+        """Account a filled buy, before native_balance includes it."""
+        self.traded_price = price
+        self.order_scale.increment_buy()
+
+        if self.buy_price_mean == 0.0:
+            self.buy_price_mean = price
+        else:
+            self.buy_price_mean = round(
+                (self.native_balance[0] * self.buy_price_mean + quote_qty)
+                / (self.native_balance[0] + base_qty),
+                2,
+            )
+
+    def record_sell(self, price: float, base_qty: float):
+        """Account a filled sell, before native_balance includes it."""
+        left = self.native_balance[0] - base_qty
+        if left > 0.0:
+            self.buy_price_mean = round(
+                (self.native_balance[0] * self.buy_price_mean - base_qty * price) / left,
+                2,
+            )
+        else:
+            self.buy_price_mean = 0.0
+        self.traded_price = price
+        self.order_scale.increment_sell()
+
     def print_setup(self, price: float):
         if self.ATH == 999000.0:
             return
@@ -742,6 +2502,9 @@ class TradeAnalyse:
         self.rebalance_top = self.order_scale.get_sell_percent()
         self.rebalance_bottom = self.order_scale.get_buy_percent()
 
+        if self.quiet:
+            return
+
         sell_pips = round(one_percent_pips * self.rebalance_top, 2)
         buy_pips = round(one_percent_pips * self.rebalance_bottom, 2)
 
@@ -773,12 +2536,12 @@ class TradeAnalyse:
             f"tg bot_chatID: {self.bot_chatID}\n"
             f"stable_pair: {STABLE_PAIR}\n"
             f"ATH: {self.ATH}\n"
-            f"ma_length: {MA_LENGTH}\n"
-            f"range: {RANGE}% ({int(self.working_range)}) pips, lower price limit: {int(price - self.native_balance[1] / price_for_pips)} {self.pair[1]}\n"
+            f"ma_length: {self.config.ma_length}\n"
+            f"range: {self.config.range}% ({int(self.working_range)}) pips, lower price limit: {int(price - self.native_balance[1] / price_for_pips)} {self.pair[1]}\n"
             f"ratio per pip: {self.ratio_per_point:.8f}\n"
             f"pip cost: {round(price_for_pips, 2)} {self.pair[1]}\n"
-            f"min_ratio: {MIN_RATIO} ({float(MIN_RATIO) * 100.0}%)\n"
-            f"max_ratio: {MAX_RATIO} ({float(MAX_RATIO) * 100.0}%)\n"
+            f"min_ratio: {self.config.min_ratio} ({self.config.min_ratio * 100.0}%)\n"
+            f"max_ratio: {self.config.max_ratio} ({self.config.max_ratio * 100.0}%)\n"
             f"amplitude {self.local_range_win.maxlen / 60} h: {self.local_range} pips\n"
             f"rebalance params:\n"
             f"  1%: {round(one_percent_pips, 2)} pips ({one_percent_amnt} {self.pair[1]})\n"
@@ -801,73 +2564,471 @@ class TradeAnalyse:
         print(data)
 
     def monitor(self, price, m1_time, show=False):
-        change = False
-        if self.m1_timer != m1_time:
-            change = True
-            self.m1_timer = m1_time
+        if self.owns_market:
+            change = self.market.update(price, m1_time, live=show)
+        else:
+            # the owner has applied this tick already
+            change = self.market.changed
+
+        if show:
+            self.portfolio_ratio = self.change_portfolio_ratio(
+                price, self.portfolio_ratio
+            )
+
+            if change and not self.quiet:
+                rotate_log_file(self.log_file, max_files=5, max_size_mb=10.0)
+
+            if self.pair_balance and self.traded_price != 0.0 and self.market.ATH != 999000.0:
+                self.calculate_profit(price)
+                if change:
+                    self.print_setup(price)
+
+            for listener in self.listeners:
+                listener()
+
+            if self.quiet:
+                return
+
+            data = (
+                f"{int(price)}, "
+                f"impuls {self.diffs_pool.maxlen / 60}m: {self.impuls}|{self.impuls_harmonic} ({self.impuls_percent}%|{self.impuls_harmonic_percent}%), "
+                f"spot cost: {round(self.buy_price_mean, 1)}, "
+                f"pnl: {round(self.native_balance[0] * price - self.native_balance[0] * self.buy_price_mean, 1)} {self.pair[1]}, "
+                f"trend: {round(self.ma_trend - self.ma_trend_prev, 1)}, EMA:{round(self.ma_fast_m - self.ma_trend, 1)}, "
+                f"spread: {round(abs(self.price_diff), 2)} > local range: {self.local_range}, "
+                f"target ratio: {round(self.portfolio_ratio * 100.0, 2)}%, "
+                f"rebalance: {round(self.percent_diff, 2)}% ({round(self.trade_profit, 2)} {self.pair[1]})"
+            )
+
+            print(data)
+            log(data, self.log_file)
+
+
+def paper_fill(ta: TradeAnalyse, action: str, qty: float, price: float, fee: float) -> dict:
+    """Account a simulated market order fill in ``ta`` like a live fill.
+
+    Buy sizes are in quote coin, sell sizes in base coin, the taker fee is
+    paid in the received coin.
+
+    Returns:
+        Ledger entry of the fill
+    """
+    base, quote = ta.native_balance
+
+    if action == "buy":
+        qty = min(qty, quote)
+        received = qty / price
+        fee_base = received * fee
+        ta.record_buy(price, qty, received - fee_base)
+        base, quote = base + received - fee_base, quote - qty
+        fee_quote = fee_base * price
+    else:
+        qty = min(qty, base)
+        received = qty * price
+        fee_quote = received * fee
+        ta.record_sell(price, qty)
+        base, quote = base - qty, quote + received - fee_quote
+
+    ta.native_balance = (base, quote)
+    ta.pair_balance[ta.pair[0]] = base * price
+    ta.pair_balance[ta.pair[1]] = quote
+    return {
+        "side": action,
+        "price": price,
+        "base_qty": qty / price if action == "buy" else qty,
+        "quote_qty": qty if action == "buy" else received,
+        "fee": fee_quote,
+        "base_balance": base,
+        "quote_balance": quote,
+        "equity": base * price + quote,
+    }
+
+
+class ShadowStrategy:
+    """Paper-trading strategy instance following the live indicators.
+
+    Own StrategyConfig, virtual balances and strategy state; it starts on
+    the first tick it sees. Orders fill at the price of the next tick minus
+    the taker fee, like backtest.py.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        pair,
+        market,
+        config: StrategyConfig,
+        quote_balance: float = 1000.0,
+        base_balance: float = 0.0,
+    ) -> None:
+        self.name = name
+        self.ta = TradeAnalyse(pair, log_file=os.devnull, market=market, config=config, quiet=True)
+        self.start_balance = (base_balance, quote_balance)
+        self.start_price = 0.0
+        self.start_ts = 0
+        self.last_price = 0.0
+        self.pending = None
+        self.trades = {"buy": 0, "sell": 0}
+        self.fees = 0.0
+        self.fills = deque(maxlen=20)
+
+    def on_tick(
+        self, price: float, ts: int, fee: float, min_order_qty: float, min_order_amt: float
+    ):
+        ta = self.ta
+        if self.start_price == 0.0:
+            base, quote = self.start_balance
+            ta.native_balance = (base, quote)
+            ta.pair_balance[ta.pair[0]] = base * price
+            ta.pair_balance[ta.pair[1]] = quote
+            if base * price + quote > 0.0:
+                ta.portfolio_ratio = base * price / (base * price + quote)
+            ta.traded_price = price
+            self.start_price = price
+            self.start_ts = ts
+
+        ta.fee = fee
+        if self.pending is not None:
+            # market order decided on the previous tick fills at this price
+            fill = paper_fill(ta, self.pending[0], self.pending[1], price, fee)
+            fill["ts"] = ts
+            self.fills.append(fill)
+            self.trades[fill["side"]] += 1
+            self.fees += fill["fee"]
+            self.pending = None
+
+        self.last_price = price
+        ta.pair_balance[ta.pair[0]] = ta.native_balance[0] * price
+        ta.monitor(price, ts, show=True)
+
+        _crossed, action = ta.trade_signal()
+        if action is not None:
+            qty = ta.order_size(action, price, min_order_qty, min_order_amt)
+            if qty > 0.0:
+                self.pending = (action, qty)
+
+    def stats(self) -> dict:
+        ta = self.ta
+        price = self.last_price
+        base, quote = self.start_balance
+        start_equity = base * self.start_price + quote
+        equity = ta.native_balance[0] * price + ta.native_balance[1]
+        hold_equity = base * price + quote
+        return {
+            "name": self.name,
+            # the fee in use is the account taker fee of the live trader, in percent
+            "config": dict(asdict(ta.config), fee=round(ta.fee * 100.0, 6)),
+            "start_ts": self.start_ts,
+            "start_price": self.start_price,
+            "start_equity": round(start_equity, 4),
+            "equity": round(equity, 4),
+            "return_percent": round((equity / start_equity - 1.0) * 100.0, 4)
+            if start_equity > 0.0
+            else 0.0,
+            "buy_and_hold_percent": round((hold_equity / start_equity - 1.0) * 100.0, 4)
+            if start_equity > 0.0
+            else 0.0,
+            "base_balance": ta.native_balance[0],
+            "quote_balance": ta.native_balance[1],
+            "portfolio_ratio": round(ta.portfolio_ratio * 100.0, 2),
+            "traded_price": ta.traded_price,
+            "buy_price_mean": ta.buy_price_mean,
+            "buys": self.trades["buy"],
+            "sells": self.trades["sell"],
+            "fees": round(self.fees, 4),
+            "last_fills": list(self.fills)[-5:],
+        }
+
+
+class ShadowBook:
+    """Paper-trading shadows of a Trader, fed by its live ticks.
+
+    Shadows follow the trader's MarketIndicators, so a tick costs one signal
+    evaluation per shadow and no indicator work. MA length and amplitude
+    window are those of the live config, the other parameters are per shadow.
+    The trader's fee rate and order minimums apply to every shadow.
+    """
+
+    # set by the live indicators and the account fee rate, not per shadow
+    LIVE_PARAMS = ("ma_length", "amplitude_time_frame", "fee")
+
+    def __init__(self, trader) -> None:
+        self.trader = trader
+        self.shadows = {}
+        self.ticks = 0
+        self.elapsed_ns = 0
+        trader.ta.listeners.append(self.on_tick)
+
+    def add(
+        self, name: str, quote_balance: float = 1000.0, base_balance: float = 0.0, **params
+    ) -> ShadowStrategy:
+        """Start a shadow with the live config changed by ``params`` (StrategyConfig fields)."""
+        if name in self.shadows:
+            raise ValueError(f"shadow {name} exists")
+        live = self.trader.ta.config
+        unknown = sorted(set(params) - set(asdict(live)))
+        if unknown:
+            raise ValueError(f"unknown strategy parameters: {unknown}")
+        fixed = sorted(set(params) & set(self.LIVE_PARAMS))
+        if fixed:
+            raise ValueError(f"{fixed} follow the live trader, a shadow cannot change them")
+        config = replace(live, **{k: type(getattr(live, k))(v) for k, v in params.items()})
+        shadow = ShadowStrategy(
+            name, self.trader.pair, self.trader.ta.market, config, quote_balance, base_balance
+        )
+        self.shadows[name] = shadow
+        return shadow
+
+    def remove(self, name: str) -> None:
+        del self.shadows[name]
+
+    def load(self, path: str) -> None:
+        """Add the shadows of a JSON file.
+
+        Format: ``[{"name": "wide", "quote_balance": 1000, "params": {"range": 70}}]``
+        """
+        with open(path, "r") as f:
+            for item in json.load(f):
+                self.add(
+                    item["name"],
+                    quote_balance=item.get("quote_balance", 1000.0),
+                    base_balance=item.get("base_balance", 0.0),
+                    **item.get("params", {}),
+                )
+
+    def on_tick(self):
+        if not self.shadows:
+            return
+
+        start_ns = time.monotonic_ns()
+        tr = self.trader
+        for shadow in self.shadows.values():
+            try:
+                shadow.on_tick(
+                    tr.last_price, tr.tick_ts, tr.ta.fee, tr.minOrderQty, tr.minOrderAmt
+                )
+            except Exception as ex:
+                print(f"ERROR: shadow {shadow.name}, {ex}")
+        self.ticks += 1
+        self.elapsed_ns += time.monotonic_ns() - start_ns
+
+    def stats(self) -> dict:
+        return {
+            "ticks": self.ticks,
+            "mean_tick_us": round(self.elapsed_ns / self.ticks / 1000.0, 3) if self.ticks else 0.0,
+            "shadows": [shadow.stats() for shadow in self.shadows.values()],
+        }
+
+
+class StreamSession(ABC):
+    """Bybit streams shared by Trader and MultiSymbolTrader.
+
+    One public connection (or WS_TICKER_CONNECTIONS redundant ones) carries
+    every ticker topic, one private connection carries wallet and order
+    updates. Balances come from the wallet stream and are reconciled over
+    REST after reconnects. Subclasses provide ``ticker_topics`` and
+    ``ticker_handler``, sessions running ``ws_user_data`` also
+    ``message_handler`` and ``on_balances``.
+    """
+
+    # per instance overrides point a session at a stand-in exchange
+    rest_url = BYBIT_REST_URL
+    public_stream_url = BYBIT_PUBLIC_STREAM
+    private_stream_url = BYBIT_PRIVATE_STREAM
+    # FrameRecorder of both streams, see WS_CAPTURE
+    recorder = None
+    # "<account>/" or "<SYMBOL>/" keeps the channels of several traders in one capture apart
+    capture_prefix = ""
+    # LoopMonitor timing the handlers and background loops, see LOOP_MONITOR
+    loop_monitor = None
+
+    @abstractmethod
+    def ticker_topics(self) -> list:
+        """Public topics of the ticker connection."""
+
+    @abstractmethod
+    def ticker_handler(self, msg):
+        """Handle a frame of the ticker connection."""
+
+    def timed(self, name: str, callback):
+        """``callback`` timed by the LoopMonitor, unchanged without one."""
+        if self.loop_monitor is None:
+            return callback
+        return self.loop_monitor.timed(name, callback)
+
+    def tracked(self, coro):
+        """``coro`` with its steps timed by the LoopMonitor, unchanged without one."""
+        if self.loop_monitor is None:
+            return coro
+        return self.loop_monitor.track(coro)
+
+    def on_balances(self, coins: list) -> None:
+        """Called with the coin list after every balance update."""
+
+    async def account_balance_loop(self):
+        """Reconcile balances over REST when the wallet stream asks for it."""
+        while True:
+            await self.balances.needs_reconcile.wait()
+            self.balances.needs_reconcile.clear()
+            if not await self.get_account_balance():
+                await asyncio.sleep(2.0)
+                self.balances.needs_reconcile.set()
+
+    async def get_account_balance(self):
+        try:
+            msg = await self.client.account()
+        except Exception as ex:
+            print(f"ERROR: get_account_balance, {ex}")
+            print(f"{repr(traceback.extract_tb(ex.__traceback__))}")
+            return False
+
+        if not msg or "result" not in msg:
+            return False
+        if "list" not in msg["result"]:
+            return False
+        if "coin" not in msg["result"]["list"][0]:
+            return False
 
-        self.count_power_s1(price)
-        self.prices.append(price)
+        data = msg["result"]["list"][0]["coin"]
+        self.on_balances(self.balances.apply_rest(data))
+        return True
 
-        if not show:
-            self.local_range_win.append(price)
-            self.ma_trend = round(self.sma(self.ma_trend_win, price), 2) - self.gap
-            self.ma_fast_m = round(
-                self.ema(int(self.ma_length), self.ma_fast_m, price), 2
-            )
+    def wallet_handler(self, msg):
+        if "data" not in msg:
             return
 
-        if show:
-            self.portfolio_ratio = self.change_portfolio_ratio(
-                price, self.portfolio_ratio
-            )
+        data = self.balances.apply_stream(msg)
+        if data:
+            self.on_balances(data)
 
-            if change:
-                rotate_log_file(self.log_file, max_files=5, max_size_mb=10.0)
-                self.local_range_win.append(price)
-                self.local_range = int(
-                    max(self.local_range_win) - min(self.local_range_win)
-                )
-
-                self.ma_trend_prev = self.ma_trend
-                self.ma_trend = round(self.sma(self.ma_trend_win, price), 2) - self.gap
-                self.ma_fast_m = round(
-                    self.ema(int(self.ma_length), self.ma_fast_m, price), 2
-                )
+    async def ws_ticker(self):
+        topics = self.ticker_topics()
+        subscribtion = [
+            {"op": "subscribe", "args": topics[i : i + WS_TOPICS_PER_REQUEST]}
+            for i in range(0, len(topics), WS_TOPICS_PER_REQUEST)
+        ]
+        # kline.1 may be quiet for up to a minute, the pong keeps the heartbeat
+        tickers = [
+            WSClient(
+                self.loop,
+                stream_url=self.public_stream_url,
+                key=self.key,
+                secret=self.secret,
+                ping_interval=5.0,
+                stale_timeout=10.0,
+                latency=self.latency,
+                recorder=self.recorder,
+                # redundant connections are recorded apart, replay merges them again
+                channel="ticker" if WS_TICKER_CONNECTIONS <= 1 else f"ticker.{i}",
+            )
+            for i in range(max(WS_TICKER_CONNECTIONS, 1))
+        ]
+        self.ws_sessions["ticker"] = tickers
+        handler = self.timed("ticker_handler", self.ticker_handler)
 
-            if self.pair_balance and self.traded_price != 0.0 and self.ATH != 999000.0:
-                self.calculate_profit(price)
-                if change:
-                    self.print_setup(price)
+        try:
+            if len(tickers) == 1:
+                await tickers[0].start(subscribtion, handler, need_auth=False)
+                return
 
-            data = (
-                f"{int(price)}, "
-                f"impuls {self.diffs_pool.maxlen / 60}m: {self.impuls}|{self.impuls_harmonic} ({self.impuls_percent}%|{self.impuls_harmonic_percent}%), "
-                f"spot cost: {round(self.buy_price_mean, 1)}, "
-                f"pnl: {round(self.native_balance[0] * price - self.native_balance[0] * self.buy_price_mean, 1)} {self.pair[1]}, "
-                f"trend: {round(self.ma_trend - self.ma_trend_prev, 1)}, EMA:{round(self.ma_fast_m - self.ma_trend, 1)}, "
-                f"spread: {round(abs(self.price_diff), 2)} > local range: {self.local_range}, "
-                f"target ratio: {round(self.portfolio_ratio * 100.0, 2)}%, "
-                f"rebalance: {round(self.percent_diff, 2)}% ({round(self.trade_profit, 2)} {self.pair[1]})"
+            # redundant mode, whichever connection delivers a frame first wins
+            self.ticker_feed = FrameDeduplicator(handler, len(tickers))
+            await asyncio.gather(
+                *[
+                    ticker.start(
+                        subscribtion, self.ticker_feed.handler(i), need_auth=False
+                    )
+                    for i, ticker in enumerate(tickers)
+                ]
             )
+        finally:
+            for ticker in tickers:
+                await ticker.close()
 
-            print(data)
-            log(data, self.log_file)
+    async def ws_user_data(self):
+        ticker = WSClient(
+            self.loop,
+            stream_url=self.private_stream_url,
+            key=self.key,
+            secret=self.secret,
+            latency=self.latency,
+            recorder=self.recorder,
+            channel=self.capture_prefix + "user_data",
+        )
+        self.ws_sessions["user_data"] = [ticker]
+        channels = {"op": "subscribe", "args": ["wallet", "order"]}
+        try:
+            # the stream does not replay updates missed while disconnected
+            await ticker.start(
+                channels,
+                self.timed("message_handler", self.message_handler),
+                need_auth=True,
+                on_connect=lambda: self.balances.invalidate("private stream connected"),
+            )
+        finally:
+            await ticker.close()
+
+    def connection_stats(self) -> list:
+        """Health of all WebSocket sessions."""
+        return [
+            dict(stream=name, **ws.stats())
+            for name, sessions in self.ws_sessions.items()
+            for ws in sessions
+        ]
 
 
-class Trader:
+class Trader(StreamSession):
     def __init__(
-        self, loop: asyncio.AbstractEventLoop, key, secret, data_dir: str = "data"
+        self,
+        loop: asyncio.AbstractEventLoop,
+        key,
+        secret,
+        data_dir: str = "data",
+        base: str = "BTC",
+        client=None,
+        balances=None,
+        alerts=None,
+        allocation: float = 1.0,
+        quote_ledger: bool = False,
+        market=None,
+        config: Optional[StrategyConfig] = None,
     ) -> None:
+        """Initialize trader for one spot pair.
+
+        Args:
+            loop: Event loop
+            key: API key
+            secret: API secret
+            data_dir: Directory for state, history and log files
+            base: Base coin, traded against STABLE_PAIR
+            client: Shared REST Client, created by init_data if None
+            balances: Shared BalanceCache of the account
+            alerts: Shared AlertDispatcher
+            allocation: Share of the quote coin balance this pair may use
+            quote_ledger: Keep an own quote coin balance, seeded from the allocation
+                and moved by the fills of this pair, for pairs sharing the quote coin
+            market: Shared MarketIndicators, fed by another trader of the symbol
+            config: Strategy parameters, StrategyConfig.from_env() if None
+        """
         self.loop = loop  # asyncio.get_running_loop()
         self.key = key
         self.secret = secret
-        self.client = None
-        self.pair = ["BTC", STABLE_PAIR]
+        self.client = client
+        self.pair = [base, STABLE_PAIR]
         self.symbol = "".join(self.pair)
+        self.allocation = allocation
+        self.quote_ledger = quote_ledger
+        self.quote_balance = None
         self.last_price = 0.0
         self.minOrderQty = 0.000198
         self.minOrderAmt = 10.0
+        self.quantizer = InstrumentQuantizer(self.symbol)
+        self.ticker_feed = None
+        self.ws_sessions = {}
+        self.balances = balances if balances is not None else BalanceCache()
+        self.alerts = alerts if alerts is not None else AlertDispatcher(TGBOT_TOKEN, TGBOT_CHATID)
+        self.indicators_updated = asyncio.Event()
+        self.latency = LatencyTracker()
         self.data_dir = Path(data_dir)
         self.data_dir.mkdir(parents=True, exist_ok=True)
 
@@ -875,24 +3036,59 @@ class Trader:
         self.log_file = str(self.data_dir / "trading.log")
         self.data_file = str(self.data_dir / "data_s1.dat")
         self.state_file = str(self.data_dir / f"{self.symbol}.json")
+        self.metadata = MetadataCache(self.data_dir / "metadata.json")
+
+        self.orders = OrderManager(self.client, latency=self.latency, prefix=self.symbol)
+        # set by MultiSymbolTrader, collects the orders of all pairs into batch requests
+        self.order_queue = None
+
+        if TICKER_STREAM == "publicTrade":
+            self.ticker_topic = f"publicTrade.{self.symbol}"
+        else:
+            self.ticker_topic = f"kline.1.{self.symbol}"
+        self.resampler = None
+        if RESAMPLE_INTERVAL > 0.0 or TICKER_STREAM == "publicTrade":
+            interval_ms = int((RESAMPLE_INTERVAL or 1.0) * 1000)
+            self.resampler = Resampler(self.bar_handler, interval_ms=interval_ms)
+        # exchange minus local clock in ms, from the last frame
+        self.clock_offset_ms = 0
+        # exchange timestamp of the last ticker frame, keys the decisions
+        self.tick_ts = 0
+        self.decisions = deque(maxlen=1000)
+        self.decisions_file = str(self.data_dir / "decisions.jsonl")
 
         # Initialize TradeAnalyse with log file
-        self.ta = TradeAnalyse(self.pair, log_file=self.log_file)
+        self.ta = TradeAnalyse(self.pair, log_file=self.log_file, market=market, config=config)
+        self.ta.listeners.append(self.indicators_updated.set)
+        # paper-trading strategies on the same ticks
+        self.shadows = ShadowBook(self)
 
     async def init_data(self):
-        self.client = Client(
-            loop=self.loop,
-            base_url="https://api.bybit.com/",
-            key=self.key,
-            secret=self.secret,
-        )
-        self.client.session = aiohttp.ClientSession()
-        self.client.session.headers.update(
-            {
-                "Content-Type": "application/json",
-                "User-Agent": "volharvest/1.0",
-            },
-        )
+        """Create the REST client, load price history and instrument metadata.
+
+        Followers of a shared MarketIndicators only load their account data,
+        the price history belongs to the owner.
+        """
+        if self.client is None:
+            self.client = Client(
+                loop=self.loop,
+                base_url=self.rest_url,
+                key=self.key,
+                secret=self.secret,
+            )
+            self.client.session.headers.update(
+                {
+                    "Content-Type": "application/json",
+                    "User-Agent": "volharvest/1.0",
+                },
+            )
+        self.orders.client = self.client
+
+        if not self.ta.owns_market:
+            self.last_price = self.ta.prices[-1] if self.ta.prices else 0.0
+            await self.Get_instrument_info(self.last_price)
+            await self.Get_fee_rate()
+            return
 
         prices = []
         m1 = dict()
@@ -934,21 +3130,60 @@ class Trader:
             self.ta.monitor(p, 1.0, show=False)
 
         await self.Get_instrument_info(prices[-1])
+        await self.Get_fee_rate()
         self.load_history()
 
-    async def Get_instrument_info(self, price: float):
-        data = await self.client.instrument_info(symbol=self.symbol)
-        self.minOrderQty = float(
-            data["result"]["list"][0]["lotSizeFilter"]["minOrderQty"]
-        )
-        self.minOrderAmt = float(
-            data["result"]["list"][0]["lotSizeFilter"]["minOrderAmt"]
-        )
+    async def Get_instrument_info(self, price: float, refresh: bool = False):
+        lot_size_filter = None if refresh else self.metadata.get("instrument", self.symbol)
+        if lot_size_filter is None:
+            try:
+                data = await self.client.instrument_info(symbol=self.symbol)
+                lot_size_filter = data["result"]["list"][0]["lotSizeFilter"]
+                self.metadata.set("instrument", self.symbol, lot_size_filter)
+            except Exception as ex:
+                lot_size_filter = self.metadata.get("instrument", self.symbol, allow_stale=True)
+                if lot_size_filter is None:
+                    raise
+                print(f"WARNING: Get_instrument_info, using cached filter, {ex}")
+
+        self.quantizer = self.client.register_instrument(self.symbol, lot_size_filter)
+        self.minOrderQty = float(lot_size_filter["minOrderQty"])
+        self.minOrderAmt = float(lot_size_filter["minOrderAmt"])
 
         print(
             f"INFO: minOrderQty: {decimal.Decimal.from_float(self.minOrderQty)}({round(self.minOrderQty * price, 2)} {self.pair[1]}), minOrderAmt: {self.minOrderAmt}"
         )
 
+    async def Get_fee_rate(self, refresh: bool = False):
+        """Set TradeAnalyse.fee from the account taker fee, FEE env is the fallback."""
+        fee = None if refresh else self.metadata.get("fee", self.symbol)
+        if fee is None:
+            try:
+                data = await self.client.fee_rate(symbol=self.symbol)
+                fee = data["result"]["list"][0]
+                self.metadata.set("fee", self.symbol, fee)
+            except Exception as ex:
+                fee = self.metadata.get("fee", self.symbol, allow_stale=True)
+                print(f"WARNING: Get_fee_rate, {ex}")
+                if fee is None:
+                    return
+
+        # market orders always pay the taker fee
+        self.ta.fee = float(fee["takerFeeRate"])
+        print(f"INFO: takerFeeRate: {fee['takerFeeRate']}, makerFeeRate: {fee['makerFeeRate']}")
+
+    async def metadata_refresh_loop(self, interval: float = 600.0):
+        """Refresh expired instrument filters and fee rates in the background."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if self.metadata.expired("instrument", self.symbol):
+                    await self.Get_instrument_info(self.last_price, refresh=True)
+                if self.metadata.expired("fee", self.symbol):
+                    await self.Get_fee_rate(refresh=True)
+            except Exception as ex:
+                print(f"ERROR: metadata_refresh_loop, {ex}")
+
     def load_history(self):
         header = arr.array("L", [])
         data_s1 = arr.array("d", [])
@@ -971,48 +3206,11 @@ class Trader:
             print(f"ERROR: tr.initialize, {ex}")
             print(f"{repr(traceback.extract_tb(ex.__traceback__))}")
 
-    async def account_balance_loop(self):
-        while True:
-            await self.get_account_balance()
-            await asyncio.sleep(22.0)
-
-    async def get_account_balance(self):
-        try:
-            msg = await self.client.account()
-        except Exception as ex:
-            print(f"ERROR: get_account_balance, {ex}")
-            print(f"{repr(traceback.extract_tb(ex.__traceback__))}")
-            return
-
-        if "result" not in msg:
-            return
-        if "list" not in msg["result"]:
-            return
-        if "coin" not in msg["result"]["list"][0]:
-            return
-
-        data = msg["result"]["list"][0]["coin"]
-        self.get_pair_balance(data)
-
-    async def ws_ticker(self):
-        ticker = WSClient(
-            self.loop,
-            stream_url="wss://stream.bybit.com/v5/public/spot",
-            key=self.key,
-            secret=self.secret,
-        )
-        subscribtion = {"op": "subscribe", "args": [f"kline.1.{self.symbol}"]}
-        await ticker.start(subscribtion, self.ticker_handler, need_auth=False)
+    def ticker_topics(self) -> list:
+        return [self.ticker_topic]
 
-    async def ws_user_data(self):
-        ticker = WSClient(
-            self.loop,
-            stream_url="wss://stream.bybit.com/v5/private",
-            key=self.key,
-            secret=self.secret,
-        )
-        channels = {"op": "subscribe", "args": ["wallet", "order"]}
-        await ticker.start(channels, self.message_handler, need_auth=True)
+    def on_balances(self, coins: list) -> None:
+        self.get_pair_balance(coins)
 
     def get_pair_balance(self, data):
         p0 = next(filter(lambda x: x["coin"] == self.pair[0], data), None)
@@ -1022,8 +3220,14 @@ class Trader:
 
         if p0:
             native[0] = float(p0["equity"])
-        if p1:
-            native[1] = float(p1["equity"])
+        if p1 and not self.quote_ledger:
+            native[1] = float(p1["equity"]) * self.allocation
+        elif p1 and self.quote_balance is None:
+            # the quote coin is shared by all pairs of the account, seeded once
+            # so the fills of one pair do not move the balance of the others
+            self.quote_balance = float(p1["equity"]) * self.allocation
+        if self.quote_balance is not None:
+            native[1] = self.quote_balance
 
         self.ta.native_balance = (native[0], native[1])
         self.ta.pair_balance[self.pair[0]] = native[0] * self.last_price
@@ -1044,39 +3248,41 @@ class Trader:
         if "topic" in msg:
             match msg["topic"]:
                 case "wallet":
-                    if "data" not in msg:
-                        return
-
-                    data = msg["data"][0]["coin"]
-                    self.get_pair_balance(data)
+                    self.wallet_handler(msg)
 
                 case "order":
-                    data = msg["data"][0]
+                    for data in msg.get("data", []):
+                        self.order_handler(data)
+                case _:
+                    pass
 
-                    if "avgPrice" not in data:
-                        return
+    def order_handler(self, data):
+        if "avgPrice" not in data:
+            return
 
-                    if data["avgPrice"] == "":
-                        return
+        if data["avgPrice"] == "":
+            return
 
-                    self.manage_trades(data)
+        if self.orders.on_order_event(data):
+            order = self.orders.orders.get(data.get("orderLinkId", ""))
+            if order is not None:
+                self.latency.record("order_fill", order.sent_ns, self.latency.frame_ns)
+            self.manage_trades(data)
 
-                    price = float(data["avgPrice"])
-                    qtty = float(data["qty"])
-                    if data["side"] == "Sell":
-                        qtty *= price
+        price = float(data["avgPrice"])
+        qtty = float(data["qty"])
+        if data["side"] == "Sell":
+            qtty *= price
 
-                    out = (
-                        f"MESSAGE: ------------- {data['side']}, "
-                        f"type:{data['orderType']}, "
-                        f"Current status:{data['orderStatus']}, "
-                        f"price:{price}, q:{qtty} {self.pair[1]}"
-                    )
+        out = (
+            f"MESSAGE: ------------- {data['side']}, "
+            f"type:{data['orderType']}, "
+            f"Current status:{data['orderStatus']}, "
+            f"price:{price}, q:{qtty} {self.pair[1]}"
+        )
 
-                    print(out)
-                    log(out, self.log_file)
-                case _:
-                    pass
+        print(out)
+        log(out, self.log_file)
 
     def manage_trades(self, data):
         if "Filled" not in data["orderStatus"]:
@@ -1086,34 +3292,15 @@ class Trader:
             if data["symbol"].startswith(self.pair[0]):
                 price = float(data["avgPrice"])
                 qtty = float(data["qty"])
-                btc = qtty / price
-                str_quantity = str(decimal.Decimal.from_float(btc))
-                if len(str_quantity) > 8:
-                    str_quantity = str_quantity[:8]
-                    btc = float(str_quantity)
-
-                self.ta.traded_price = price
-                self.ta.order_scale.increment_buy()
+                btc = self.quantizer.floor("Sell", qtty / price)
 
-                if self.ta.buy_price_mean == 0.0:
-                    self.ta.buy_price_mean = price
-                else:
-                    # print(
-                    #     f"({self.ta.native_balance[0]} * {self.ta.buy_price_mean} + {qtty}) / ({self.ta.native_balance[0]} + {qtty} / {price})"
-                    # )
-
-                    self.ta.buy_price_mean = round(
-                        (self.ta.native_balance[0] * self.ta.buy_price_mean + qtty)
-                        / (self.ta.native_balance[0] + btc),
-                        2,
-                    )
-                    self.loop.create_task(
-                        Fire_alert(
-                            bot_message=f"B: {self.ta.traded_price}, -{round(qtty, 2)}, mean: {self.ta.buy_price_mean}",
-                            bot_token=self.ta.bot_token,
-                            bot_chatID=self.ta.bot_chatID,
-                        ),
+                first_buy = self.ta.buy_price_mean == 0.0
+                self.ta.record_buy(price, qtty, btc)
+                if not first_buy:
+                    self.alerts.send(
+                        f"B: {self.ta.traded_price}, -{round(qtty, 2)}, mean: {self.ta.buy_price_mean}"
                     )
+                self.quote_fill(data)
                 self.save_states()
 
         if data["side"] == "Sell":
@@ -1121,25 +3308,34 @@ class Trader:
                 price = float(data["avgPrice"])
                 qtty = float(data["qty"])
 
-                self.ta.buy_price_mean = round(
-                    (self.ta.native_balance[0] * self.ta.buy_price_mean - qtty * price)
-                    / (self.ta.native_balance[0] - qtty),
-                    2,
-                )
-                self.ta.traded_price = price
-                self.ta.order_scale.increment_sell()
+                self.ta.record_sell(price, qtty)
+                self.quote_fill(data)
 
                 self.save_states()
-                self.loop.create_task(
-                    Fire_alert(
-                        bot_message=f"S: {self.ta.traded_price}, {round(qtty * price, 2)}, mean: {self.ta.buy_price_mean}",
-                        bot_token=self.ta.bot_token,
-                        bot_chatID=self.ta.bot_chatID,
-                    ),
+                self.alerts.send(
+                    f"S: {self.ta.traded_price}, {round(qtty * price, 2)}, mean: {self.ta.buy_price_mean}"
                 )
 
                 self.loop.create_task(self.wait_for_change_balance(price))
 
+    def quote_fill(self, data):
+        """Move the quote ledger by a fill of this pair."""
+        if self.quote_balance is None:
+            return
+
+        # market buys are sized in quote coin, sells in base coin
+        qtty = float(data["qty"])
+        value = float(data.get("cumExecValue") or 0.0)
+        if data["side"] == "Buy":
+            self.quote_balance -= value or qtty
+        else:
+            value = value or qtty * float(data["avgPrice"])
+            # spot sells pay the fee in quote coin
+            fee = data.get("cumExecFee")
+            self.quote_balance += value - (float(fee) if fee else value * self.ta.fee)
+        self.quote_balance = max(self.quote_balance, 0.0)
+        self.get_pair_balance(self.balances.as_list())
+
     async def wait_for_change_balance(self, price: float):
         await asyncio.sleep(3.0)
         if self.ta.native_balance[0] * price < 11.0:
@@ -1149,31 +3345,87 @@ class Trader:
 
     def ticker_handler(self, msg):
         if "topic" in msg:
-            if msg["topic"] == f"kline.1.{self.symbol}":
+            if msg["topic"] == self.ticker_topic:
                 if "data" in msg:
+                    start_ns = time.monotonic_ns()
+                    frame_ns = self.latency.frame_ns or start_ns
+                    self.latency.record("frame_to_handler", frame_ns, start_ns)
+                    self.latency.tick_ns = frame_ns
+                    self.tick_ts = msg.get("ts", 0)
+
+                    if self.resampler is not None:
+                        self.resample(msg)
+                        return
+
                     d = msg["data"][0]
                     self.last_price = float(d["close"])
                     self.ta.monitor(self.last_price, d["end"], show=True)
+                    self.latency.record("monitor", start_ns)
         else:
             print(f"WARNING: ticker_handler, msg: {msg}")
 
-    def save_states(self):
-        data = dict()
-        data["traded_price"] = self.ta.traded_price
-        data["buy_price_mean"] = self.ta.buy_price_mean
-        data["portfolio_ratio"] = self.ta.portfolio_ratio
-        data["trend_crossover"] = self.ta.trend_crossover.cross
-        data["trend_crossunder"] = self.ta.trend_crossunder.cross
-        data["buy_counter"] = self.ta.order_scale.buy_counter
-        data["sell_counter"] = self.ta.order_scale.sell_counter
+    def resample(self, msg):
+        if "ts" in msg:
+            self.clock_offset_ms = msg["ts"] - int(time.time() * 1000)
+
+        if msg["topic"].startswith("publicTrade"):
+            for trade in msg["data"]:
+                self.resampler.add(float(trade["p"]), int(trade["T"]))
+            return
+
+        # kline "end" is the minute end, the last trade time is in "timestamp"
+        d = msg["data"][0]
+        self.resampler.add(float(d["close"]), int(d.get("timestamp") or msg["ts"]))
+
+    def bar_handler(self, price: float, end_ms: int):
+        start_ns = time.monotonic_ns()
+        self.last_price = price
+        # minute boundary of the bar, like kline.1 "end"
+        m1_end = (end_ms - 1) // 60000 * 60000 + 59999
+        self.ta.monitor(price, m1_end, show=True)
+        self.latency.record("monitor", start_ns)
+
+    async def resample_clock_loop(self, grace: float = 0.25):
+        """Close resampler bars on time when no ticks arrive."""
+        if self.resampler is None:
+            return
+        interval = self.resampler.interval_ms / 1000.0
+        while True:
+            await asyncio.sleep(interval / 2.0)
+            # late frames within the grace period still land in their bar
+            now_ms = int((time.time() - grace) * 1000) + self.clock_offset_ms
+            self.resampler.advance(now_ms)
 
+    def states(self) -> dict:
+        """Strategy state kept between runs."""
+        return {
+            "traded_price": self.ta.traded_price,
+            "buy_price_mean": self.ta.buy_price_mean,
+            "portfolio_ratio": self.ta.portfolio_ratio,
+            "trend_crossover": self.ta.trend_crossover.cross,
+            "trend_crossunder": self.ta.trend_crossunder.cross,
+            "buy_counter": self.ta.order_scale.buy_counter,
+            "sell_counter": self.ta.order_scale.sell_counter,
+        }
+
+    def save_states(self):
         with open(self.state_file, "w") as f:
-            json.dump(data, f, indent=4)
+            json.dump(self.states(), f, indent=4)
+
+    def apply_states(self, data: dict):
+        self.ta.traded_price = data["traded_price"]
+        self.ta.buy_price_mean = data["buy_price_mean"]
+        self.ta.portfolio_ratio = data["portfolio_ratio"]
+        self.ta.trend_crossover.cross = data["trend_crossover"]
+        self.ta.trend_crossunder.cross = data["trend_crossunder"]
+        self.ta.order_scale._buy_counter = data["buy_counter"]
+        self.ta.order_scale._sell_counter = data["sell_counter"]
 
     def init_new_states(self):
         current_btc_amount = self.ta.native_balance[0] * self.last_price
         total = current_btc_amount + self.ta.native_balance[1]
-        self.ta.portfolio_ratio = current_btc_amount / total
+        if total > 0.0:
+            self.ta.portfolio_ratio = current_btc_amount / total
 
         self.ta.traded_price = self.last_price
         self.ta.buy_price_mean = 0.0
@@ -1192,93 +3444,39 @@ class Trader:
         try:
             with open(self.state_file, "r") as f:
                 data = json.load(f)
-                self.ta.traded_price = data["traded_price"]
-                self.ta.buy_price_mean = data["buy_price_mean"]
-                self.ta.portfolio_ratio = data["portfolio_ratio"]
-                self.ta.trend_crossover.cross = data["trend_crossover"]
-                self.ta.trend_crossunder.cross = data["trend_crossunder"]
-                self.ta.order_scale._buy_counter = data["buy_counter"]
-                self.ta.order_scale._sell_counter = data["sell_counter"]
+                self.apply_states(data)
                 print(f"INFO: Load {self.state_file}: {data}")
 
         except Exception as ex:
             self.init_new_states()
             print(f"ERROR: {ex.with_traceback(None)}")
 
-    async def do_buy(self, qtty):
-        counter = 0
-        while counter < 20:
-            counter += 1
-            try:
-                resp_data, resp_status = await self.client.market_order(
-                    symbol=self.symbol, side="Buy", quantity_size=qtty
-                )
-                print(resp_data)
-                if resp_status != 200:
-                    print(f"ERROR: {resp_data} \n\n resp_status: {resp_status}")
-                    break
-                if resp_data["retCode"] != 0:
-                    await asyncio.sleep(2.0)
-                    if self.ta.pair_balance[self.pair[0]] < 7.0:
-                        break
-
-                    if resp_data["retCode"] == 170131:
-                        qtty *= 0.99
-                    else:
-                        break
-                else:
-                    break
-            except Exception as e:
-                print(f"ERROR: do_buy, {e.with_traceback(__tb=sys.exc_info()[2])}")
-                await asyncio.sleep(1.1)
-
-    async def do_sell(self, qtty):
-        counter = 0
-        while counter < 20:
-            counter += 1
-            try:
-                resp_data, resp_status = await self.client.market_order(
-                    symbol=self.symbol, side="Sell", quantity_size=qtty
-                )
-                print(resp_data)
-                if resp_status != 200:
-                    print(f"ERROR: {resp_data} \n\n resp_status: {resp_status}")
-                    break
-                if resp_data["retCode"] != 0:
-                    await asyncio.sleep(2.0)
-                    if self.ta.pair_balance[self.pair[0]] < 7.0:
-                        break
-                    if resp_data["retCode"] == 170131:
-                        qtty *= 0.99
-                    else:
-                        break
-                else:
-                    break
-            except Exception as e:
-                print(f"ERROR: do_sell(), {e.with_traceback(__tb=sys.exc_info()[2])}")
-                await asyncio.sleep(1.1)
+    def submit_order(self, side: str, qty: float):
+        if self.order_queue is not None:
+            self.order_queue(self, side, qty)
+            return
+        self.orders.submit(self.symbol, side, qty)
 
     async def buy_signal(self):
-        qty = math.fabs(self.ta.trade_profit)
-        if qty < self.minOrderAmt or self.ta.native_balance[1] < self.minOrderAmt:
-            print(f"Ma cross: BUY, low qtty:{qty}, minOrderAmt: {self.minOrderAmt}")
+        qty = self.ta.order_size("buy", self.last_price, self.minOrderQty, self.minOrderAmt)
+        if qty == 0.0:
+            print(
+                f"Ma cross: BUY, low qtty:{math.fabs(self.ta.trade_profit)}, minOrderAmt: {self.minOrderAmt}"
+            )
             return False
 
-        if qty > self.ta.native_balance[1]:
-            qty = self.ta.native_balance[1]
-
-        await self.do_buy(qty)
+        self.submit_order("Buy", qty)
         return True
 
     async def sell_signal(self):
-        qty = self.ta.trade_profit / self.last_price
-        if qty < self.minOrderQty:
+        qty = self.ta.order_size("sell", self.last_price, self.minOrderQty, self.minOrderAmt)
+        if qty == 0.0:
             print(
-                f"Ma cross: SELL, low qtty:{qty * self.last_price}, minOrderQty: {self.minOrderQty}"
+                f"Ma cross: SELL, low qtty:{self.ta.trade_profit}, minOrderQty: {self.minOrderQty}"
             )
             return False
 
-        await self.do_sell(qty)
+        self.submit_order("Sell", qty)
         return True
 
     async def sell_all(self):
@@ -1289,102 +3487,459 @@ class Trader:
             )
             return False
 
-        await self.do_sell(qty)
+        self.submit_order("Sell", qty)
         return True
 
+    def save_history(self):
+        data_s1 = arr.array("d", self.ta.prices)
+        header: arr.array = arr.array("L", [len(data_s1)])
+        with open(self.data_file, "wb") as f:
+            header.tofile(f)
+            data_s1.tofile(f)
+
     async def save_history_loop(self):
         while True:
-            data_s1 = arr.array("d", self.ta.prices)
-            header: arr.array = arr.array("L", [len(data_s1)])
-            with open(self.data_file, "wb") as f:
-                header.tofile(f)
-                data_s1.tofile(f)
-
+            self.save_history()
             await asyncio.sleep(30.0)
 
     async def trade_loop(self):
-        while self.last_price == 0.0:
-            await asyncio.sleep(0.3)
-
-        self.load_states()
+        await self.indicators_updated.wait()
 
         await asyncio.sleep(1.0)
-        await self.get_account_balance()
+        if self.balances.is_empty:
+            await self.get_account_balance()
+        else:
+            # filled by the wallet stream or another pair of the account
+            self.get_pair_balance(self.balances.as_list())
         await asyncio.sleep(1.0)
 
+        # new states start from the balance ratio, load them after the balance
+        self.load_states()
+
         print("###################   Waiting for MA signal   ###################")
 
         await asyncio.sleep(7.0)
 
+        self.capture_state()
         price_change = self.last_price
 
         while True:
-            await asyncio.sleep(0.3)
-
-            if self.ta.ma_trend == 0.0 or self.ta.ma_fast_m == 0.0:
-                continue
-
-            trend = self.ta.ma_trend - self.ta.ma_trend_prev
+            # woken by TradeAnalyse.monitor() right after each tick
+            await self.indicators_updated.wait()
+            self.indicators_updated.clear()
 
             if abs(price_change - self.last_price) > 30.0:
                 price_change = self.last_price
                 self.save_states()
 
             try:
-                if self.ta.trend_crossover.cross_over(
-                    self.ta.ma_fast_m, self.ta.ma_trend
-                ):
-                    self.save_states()
+                await self.decide()
+            except Exception as ex:
+                print(f"ERROR: trade_loop, {ex}")
+                print(f"{repr(traceback.extract_tb(ex.__traceback__))}")
 
-                    # don't BUY while trend going down
-                    if trend < 1.0:
-                        continue
+    def capture_state(self):
+        """Write the state the trading starts from into the capture, replay.py restores it."""
+        if self.recorder is None:
+            return
 
-                    if abs(self.ta.percent_diff) < self.ta.rebalance_bottom:
-                        continue
+        market = self.ta.market.snapshot(history=16)
+        state = {
+            "market": {
+                name: list(value) if isinstance(value, deque) else value
+                for name, value in vars(market).items()
+            },
+            "states": self.states(),
+            "balances": self.balances.as_list(),
+            "quote_balance": self.quote_balance,
+            "last_price": self.last_price,
+            "instrument": self.metadata.get("instrument", self.symbol, allow_stale=True),
+            "fee": self.metadata.get("fee", self.symbol, allow_stale=True),
+        }
+        self.recorder.write(self.capture_prefix + "state", time.monotonic_ns(), json.dumps(state))
+
+    async def decide(self):
+        """Evaluate the strategy after a tick and start the order of its action.
 
-                    if self.ta.trade_profit < 0.0:
-                        if abs(self.ta.price_diff) > self.ta.local_range:
-                            if await self.buy_signal():
-                                await asyncio.sleep(5.0)
+        Returns:
+            The trade_signal action, "buy", "sell" or None
+        """
+        crossed, action = self.ta.trade_signal()
+        self.latency.decision_ns = time.monotonic_ns()
+        self.latency.record("tick_to_decision", self.latency.tick_ns, self.latency.decision_ns)
+        if crossed:
+            self.save_states()
 
-                if self.ta.trend_crossunder.cross_under(
-                    self.ta.ma_fast_m, self.ta.ma_trend
-                ):
-                    self.save_states()
+        if action is None:
+            return None
 
-                    # don't SELL while trend going up
-                    if trend > -1.0:
-                        continue
+        # orders are placed in the background, one at a time per symbol
+        if self.orders.in_flight(self.symbol):
+            print(f"Ma cross: {action}, previous order still in flight")
+            result = "in_flight"
+        elif action == "buy":
+            result = "placed" if await self.buy_signal() else "low_qty"
+        elif action == "sell":
+            result = "placed" if await self.sell_signal() else "low_qty"
+        else:
+            result = "ignored"
+
+        self.record_decision(action, result)
+        return action
+
+    def record_decision(self, action: str, result: str):
+        """Keep a decision and append it to decisions.jsonl, replay.py diffs against it."""
+        decision = {
+            "ts": self.tick_ts,
+            "action": action,
+            "price": self.last_price,
+            "result": result,
+        }
+        self.decisions.append(decision)
+        try:
+            with open(self.decisions_file, "a") as f:
+                f.write(json.dumps(decision) + "\n")
+        except OSError as ex:
+            print(f"ERROR: record_decision, {ex}")
+
+
+class MultiSymbolTrader(StreamSession):
+    """Independent strategy instances for several pairs of one account.
+
+    Every pair gets its own Trader (TradeAnalyse, states, history and log
+    files under ``data_dir/<symbol>/``), while the REST client, the order
+    manager, the public ticker connection, the private stream, the balance
+    cache and the alert dispatcher are shared. Each pair seeds its quote coin
+    ledger once from its allocation and moves it only by its own fills.
+    Orders the pairs decide in the same pass of the event loop go out in one
+    create-batch request.
+    """
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        key,
+        secret,
+        coins: list,
+        data_dir: str = "data",
+        allocations: Optional[dict] = None,
+        configs: Optional[dict] = None,
+    ) -> None:
+        """Initialize multi-symbol trader.
+
+        Args:
+            loop: Event loop
+            key: API key
+            secret: API secret
+            coins: Base coins, traded against STABLE_PAIR
+            data_dir: Directory, each pair uses a sub-directory named after its symbol
+            allocations: Share of the quote coin per base coin, split equally if None
+            configs: StrategyConfig per base coin, from the environment if missing
+        """
+        self.loop = loop
+        self.key = key
+        self.secret = secret
+        self.client = None
+        self.ticker_feed = None
+        self.ws_sessions = {}
+        self.balances = BalanceCache()
+        self.alerts = AlertDispatcher(TGBOT_TOKEN, TGBOT_CHATID)
+        self.latency = LatencyTracker()
+        self.orders = OrderManager(None, latency=self.latency)
+        self.pending_orders = []
+        self.data_dir = Path(data_dir)
+
+        if allocations is None:
+            allocations = {coin: 1.0 / len(coins) for coin in coins}
+        configs = configs or {}
+
+        self.traders = {}
+        for coin in coins:
+            symbol = coin + STABLE_PAIR
+            self.traders[symbol] = Trader(
+                loop,
+                key,
+                secret,
+                data_dir=str(self.data_dir / symbol),
+                base=coin,
+                balances=self.balances,
+                alerts=self.alerts,
+                allocation=allocations.get(coin, 0.0),
+                quote_ledger=True,
+                config=configs.get(coin),
+            )
+        for tr in self.traders.values():
+            tr.orders = self.orders
+            tr.order_queue = self.queue_order
+            tr.capture_prefix = f"{tr.symbol}/"
+        self._by_topic = {tr.ticker_topic: tr for tr in self.traders.values()}
+
+    async def init_data(self):
+        self.client = Client(
+            loop=self.loop,
+            base_url=self.rest_url,
+            key=self.key,
+            secret=self.secret,
+        )
+        self.client.session.headers.update({"User-Agent": "volharvest/1.0"})
+        self.orders.client = self.client
+        for tr in self.traders.values():
+            tr.client = self.client
 
-                    ### To do: add option to sell all at min ratio
-                    # if self.ta.portfolio_ratio - 0.05 < self.ta.min_max_ratio[0]:
-                    #     if await self.sell_all():
-                    #         await asyncio.sleep(5.0)
+        # history and metadata requests go through the shared rate limiter
+        await asyncio.gather(*(tr.init_data() for tr in self.traders.values()))
 
-                    if abs(self.ta.percent_diff) < self.ta.rebalance_top:
+    def ticker_topics(self) -> list:
+        return list(self._by_topic)
+
+    def ticker_handler(self, msg):
+        tr = self._by_topic.get(msg.get("topic"))
+        if tr is None:
+            print(f"WARNING: ticker_handler, msg: {msg}")
+            return
+        tr.latency.frame_ns = self.latency.frame_ns
+        tr.ticker_handler(msg)
+
+    def on_balances(self, coins: list) -> None:
+        for tr in self.traders.values():
+            tr.get_pair_balance(coins)
+
+    def queue_order(self, tr: Trader, side: str, qty: float) -> None:
+        """Collect an order of a pair, flush_orders places the collected ones."""
+        if not self.pending_orders:
+            # the trade loops woken by the same frames decide before the flush
+            asyncio.get_running_loop().call_soon(self.flush_orders)
+        self.pending_orders.append((tr, side, qty))
+
+    def flush_orders(self) -> None:
+        pending, self.pending_orders = self.pending_orders, []
+        if not pending:
+            return
+
+        # the batch is timed from the first decision in it
+        first = pending[0][0]
+        self.latency.tick_ns = first.latency.tick_ns
+        self.latency.decision_ns = first.latency.decision_ns
+
+        items = [(tr.symbol, side, qty) for tr, side, qty in pending]
+        if len(items) == 1:
+            self.orders.submit(*items[0])
+        else:
+            self.orders.submit_batch(items)
+
+    def message_handler(self, msg):
+        match msg.get("topic"):
+            case "wallet":
+                self.wallet_handler(msg)
+
+            case "order":
+                for data in msg.get("data", []):
+                    tr = self.traders.get(data.get("symbol"))
+                    if tr is None:
                         continue
+                    tr.latency.frame_ns = self.latency.frame_ns
+                    tr.order_handler(data)
+            case _:
+                pass
+
+    async def run(self):
+        """Run all background tasks and the trading loops of every pair."""
+        coros = [
+            self.ws_user_data(),
+            self.account_balance_loop(),
+            self.alerts.run(),
+        ]
+        for tr in self.traders.values():
+            # the start state of every pair goes into the capture
+            tr.recorder = self.recorder
+            coros += [
+                tr.save_history_loop(),
+                tr.metadata_refresh_loop(),
+                tr.resample_clock_loop(),
+                tr.trade_loop(),
+            ]
+        await asyncio.gather(*[self.tracked(coro) for coro in coros])
+
+
+class MultiAccountTrader(StreamSession):
+    """Several accounts trading one symbol from a single market-data feed.
+
+    One public connection and one MarketIndicators serve all accounts. The
+    first account owns the indicators and the price history, the others
+    follow it. Every account keeps its own keys, REST client, private
+    stream, balances and strategy state under ``data_dir/<account>/``.
+    """
 
-                    if self.ta.trade_profit > 0.0:
-                        if abs(self.ta.price_diff) > self.ta.local_range:
-                            if await self.sell_signal():
-                                await asyncio.sleep(5.0)
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        accounts: dict,
+        base: str = "BTC",
+        data_dir: str = "data",
+        configs: Optional[dict] = None,
+    ) -> None:
+        """Initialize multi-account trader.
 
-            except Exception as ex:
-                print(f"ERROR: trade_loop, {ex}")
-                print(f"{repr(traceback.extract_tb(ex.__traceback__))}")
+        Args:
+            loop: Event loop
+            accounts: Account name -> (API key, API secret)
+            base: Base coin, traded against STABLE_PAIR
+            data_dir: Directory, each account uses a sub-directory named after it
+            configs: StrategyConfig per account name, from the environment if missing.
+                MA length and amplitude window of the first account apply to all
+        """
+        self.loop = loop
+        # the public stream is not signed, no account keys are needed here
+        self.key = ""
+        self.secret = ""
+        self.ticker_feed = None
+        self.ws_sessions = {}
+        self.latency = LatencyTracker()
+        self.alerts = AlertDispatcher(TGBOT_TOKEN, TGBOT_CHATID)
+        self.market = None
+        self.data_dir = Path(data_dir)
+
+        configs = configs or {}
+        self.accounts = {}
+        for name, (key, secret) in accounts.items():
+            tr = Trader(
+                loop,
+                key,
+                secret,
+                data_dir=str(self.data_dir / name),
+                base=base,
+                alerts=self.alerts,
+                market=self.market,
+                config=configs.get(name),
+            )
+            if self.market is None:
+                # the first account owns the indicators, the others follow it
+                self.market = tr.ta.market
+            tr.capture_prefix = f"{name}/"
+            self.accounts[name] = tr
+        self.leader = next(iter(self.accounts.values()))
+        self.symbol = self.leader.symbol
+
+        if self.leader.resampler is not None:
+            # one resampler, its bars go to every account in order
+            self.leader.resampler.callback = self.bar_handler
+            for tr in self.accounts.values():
+                if tr is not self.leader:
+                    tr.resampler = None
+
+    @classmethod
+    def from_env(cls, loop: asyncio.AbstractEventLoop, names: list, **kwargs):
+        """Accounts with keys from API_KEY_<NAME> and SECRET_KEY_<NAME>."""
+        accounts = {
+            name: (
+                os.getenv(f"API_KEY_{name.upper()}", ""),
+                os.getenv(f"SECRET_KEY_{name.upper()}", ""),
+            )
+            for name in names
+        }
+        return cls(loop, accounts, **kwargs)
+
+    async def init_data(self):
+        for tr in self.accounts.values():
+            tr.rest_url = self.rest_url
+            tr.public_stream_url = self.public_stream_url
+            tr.private_stream_url = self.private_stream_url
+        # the owner loads the history the followers start from
+        await self.leader.init_data()
+        followers = [tr for tr in self.accounts.values() if tr is not self.leader]
+        await asyncio.gather(*(tr.init_data() for tr in followers))
+
+    def ticker_topics(self) -> list:
+        return self.leader.ticker_topics()
+
+    def ticker_handler(self, msg):
+        # owner first, it applies the tick to the shared indicators
+        for tr in self.accounts.values():
+            tr.latency.frame_ns = self.latency.frame_ns
+            if tr is self.leader or self.leader.resampler is None:
+                tr.ticker_handler(msg)
+
+    def bar_handler(self, price: float, end_ms: int):
+        for tr in self.accounts.values():
+            tr.bar_handler(price, end_ms)
+
+    async def run(self):
+        """Run the account streams, background tasks and trading loops."""
+        coros = [self.alerts.run(), self.leader.save_history_loop()]
+        for tr in self.accounts.values():
+            # times and records the private stream of every account
+            tr.loop_monitor = self.loop_monitor
+            tr.recorder = self.recorder
+            coros += [
+                tr.ws_user_data(),
+                tr.account_balance_loop(),
+                tr.metadata_refresh_loop(),
+                tr.resample_clock_loop(),
+                tr.trade_loop(),
+            ]
+        await asyncio.gather(*[self.tracked(coro) for coro in coros])
+
+    def connection_stats(self) -> list:
+        stats = super().connection_stats()
+        for name, tr in self.accounts.items():
+            stats += [dict(s, stream=f"{name}/{s['stream']}") for s in tr.connection_stats()]
+        return stats
 
 
 if __name__ == "__main__":
     main_loop = asyncio.new_event_loop()
 
-    tr = Trader(loop=main_loop, key=API_KEY, secret=SECRET_KEY)
-
+    if ACCOUNTS:
+        ma = MultiAccountTrader.from_env(main_loop, ACCOUNTS, base=TRADE_COINS[0])
+        if WS_CAPTURE:
+            ma.recorder = FrameRecorder(WS_CAPTURE)
+        if LOOP_MONITOR:
+            ma.loop_monitor = LoopMonitor(slow_threshold=LOOP_SLOW_THRESHOLD / 1000.0)
+        main_loop.run_until_complete(ma.init_data())
+        main_loop.create_task(ma.ws_ticker())
+
+        time.sleep(1.0)
+        if ma.loop_monitor is not None:
+            # started last, the loop does not run between the run_until_complete calls
+            main_loop.create_task(ma.loop_monitor.run())
+        main_loop.run_until_complete(ma.run())
+        sys.exit()
+
+    if len(TRADE_COINS) > 1:
+        mt = MultiSymbolTrader(
+            loop=main_loop, key=API_KEY, secret=SECRET_KEY, coins=TRADE_COINS
+        )
+        if WS_CAPTURE:
+            mt.recorder = FrameRecorder(WS_CAPTURE)
+        if LOOP_MONITOR:
+            mt.loop_monitor = LoopMonitor(slow_threshold=LOOP_SLOW_THRESHOLD / 1000.0)
+        main_loop.run_until_complete(mt.init_data())
+        main_loop.create_task(mt.ws_ticker())
+
+        time.sleep(1.0)
+        if mt.loop_monitor is not None:
+            main_loop.create_task(mt.loop_monitor.run())
+        main_loop.run_until_complete(mt.run())
+        sys.exit()
+
+    tr = Trader(loop=main_loop, key=API_KEY, secret=SECRET_KEY, base=TRADE_COINS[0])
+    if SHADOWS:
+        tr.shadows.load(SHADOWS)
+
+    if WS_CAPTURE:
+        tr.recorder = FrameRecorder(WS_CAPTURE)
+    if LOOP_MONITOR:
+        tr.loop_monitor = LoopMonitor(slow_threshold=LOOP_SLOW_THRESHOLD / 1000.0)
     main_loop.run_until_complete(tr.init_data())
-    main_loop.create_task(tr.ws_ticker())
+    main_loop.create_task(tr.tracked(tr.ws_ticker()))
 
     time.sleep(1.0)
-    main_loop.create_task(tr.ws_user_data())
-    main_loop.create_task(tr.account_balance_loop())
-    main_loop.create_task(tr.save_history_loop())
-    main_loop.run_until_complete(tr.trade_loop())
+    if tr.loop_monitor is not None:
+        main_loop.create_task(tr.loop_monitor.run())
+    main_loop.create_task(tr.tracked(tr.ws_user_data()))
+    main_loop.create_task(tr.tracked(tr.account_balance_loop()))
+    main_loop.create_task(tr.tracked(tr.save_history_loop()))
+    main_loop.create_task(tr.tracked(tr.metadata_refresh_loop()))
+    main_loop.create_task(tr.tracked(tr.resample_clock_loop()))
+    main_loop.create_task(tr.tracked(tr.alerts.run()))
+    main_loop.run_until_complete(tr.tracked(tr.trade_loop()))
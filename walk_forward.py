@@ -0,0 +1,292 @@
+"""
+Walk-forward optimization of the strategy parameters.
+
+The series is split into rolling windows: parameters are optimized on each
+train slice and evaluated on the test slice that follows it. Test slices
+are contiguous and the balances and strategy state carry over between
+them, so the test runs chain into one out-of-sample equity curve.
+
+Indicators are computed once per distinct MA length and amplitude window:
+a single pass over the series snapshots the MarketIndicators at every
+window boundary and the backtests continue from those snapshots, instead
+of warming up again for every window. The train sweeps of all windows run
+together on all cores, with the series in shared memory as in sweep.py.
+
+Usage:
+    python walk_forward.py data/bybit/data_s1.dat --train-days 14 --test-days 7 \\
+        --grid rebalance_top=1,2,3 --grid range=25,50 --out wf.json --equity wf_equity.csv
+"""
+
+import argparse
+import bisect
+import copy
+import dataclasses
+import json
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Optional
+
+import sweep
+from backtest import Backtest, load_prices, write_csv
+from sweep import expand, market_key, parse_grid, rank, share_series
+from vh_float import MarketIndicators, StrategyConfig
+
+DAY_MS = 86400 * 1000
+
+
+def warmup_ticks(configs: list, warmup_minutes: Optional[int] = None) -> int:
+    """Common warmup of all configs, one tick per second."""
+    if warmup_minutes is None:
+        warmup_minutes = max(int(max(market_key(config))) for config in configs)
+    return warmup_minutes * 60
+
+
+def split_windows(timestamps, start: int, train_ms: int, test_ms: int) -> list:
+    """Rolling (train_start, test_start, test_end) tick indices from ``start``.
+
+    Windows move forward by one test slice, the last incomplete one is dropped.
+    """
+    windows = []
+    if start >= len(timestamps):
+        return windows
+    origin = timestamps[start]
+    last = timestamps[-1]
+    k = 0
+    while origin + k * test_ms + train_ms + test_ms <= last:
+        train_from = origin + k * test_ms
+        train_start = bisect.bisect_left(timestamps, train_from)
+        test_start = bisect.bisect_left(timestamps, train_from + train_ms)
+        test_end = bisect.bisect_left(timestamps, train_from + train_ms + test_ms)
+        if train_start < test_start < test_end:
+            windows.append((train_start, test_start, test_end))
+        k += 1
+    return windows
+
+
+def market_snapshots(
+    timestamps, prices, config: StrategyConfig, warmup: int, boundaries, ath: Optional[float] = None
+) -> dict:
+    """MarketIndicators of one config at every boundary tick, before it is applied.
+
+    Replays the market updates of a Backtest run from the start of the
+    series, so a run continuing from a snapshot sees the same indicators.
+    """
+    market = MarketIndicators(config, track_impulse=False)
+    for i in range(59, warmup, 60):
+        market.update(prices[i], timestamps[i] // 60000, live=False)
+    market.ATH = ath if ath is not None else max(prices[: warmup + 1])
+    if not market.prices:
+        market.prices.append(prices[warmup])
+
+    wanted = set(boundaries)
+    snapshots = {}
+    for i in range(warmup, max(wanted) + 1):
+        if i in wanted:
+            snapshots[i] = market.snapshot()
+        price = prices[i]
+        market.update(price, timestamps[i] // 60000, live=True)
+        # TradeAnalyse.change_portfolio_ratio raises the ATH
+        if price > market.ATH:
+            market.ATH = price
+    return snapshots
+
+
+def _train_point(
+    window: int, start: int, end: int, point: dict, base_config, options: dict, market
+) -> dict:
+    _, timestamps, prices = sweep._series
+    config = dataclasses.replace(base_config, **point)
+    result = Backtest(config=config, **options).run(timestamps, prices, start, end, market)
+    return {"window": window, "params": point, "result": result}
+
+
+def walk_forward(
+    timestamps,
+    prices,
+    points: list,
+    train_days: float,
+    test_days: float,
+    workers: Optional[int] = None,
+    base_config: Optional[StrategyConfig] = None,
+    options: Optional[dict] = None,
+    metric: str = "return_percent",
+) -> dict:
+    """Optimize on every train slice, chain the test slices out of sample.
+
+    Args:
+        timestamps: Tick timestamps in ms
+        prices: Tick prices
+        points: Parameter dicts, StrategyConfig field overrides
+        train_days: Train slice length
+        test_days: Test slice length, also the step between windows
+        workers: Worker processes, all cores if None
+        base_config: Config the points override, StrategyConfig.from_env() if None
+        options: Backtest keyword arguments (balances, ath, warmup_minutes, ...)
+        metric: Summary value maximized on the train slices
+
+    Returns:
+        {"windows": [...], "summary": {...}, "equity": [(ts, equity), ...]}
+    """
+    base_config = base_config if base_config is not None else StrategyConfig.from_env()
+    options = dict(options or {})
+    warmup_minutes = options.pop("warmup_minutes", None)
+
+    configs = {}
+    for point in points:
+        config = dataclasses.replace(base_config, **point)
+        if config.min_ratio < config.max_ratio:
+            configs[sweep.point_key(point)] = (point, config)
+    if not configs:
+        raise ValueError("no valid parameter points")
+
+    warmup = warmup_ticks([config for _, config in configs.values()], warmup_minutes)
+    windows = split_windows(
+        timestamps, warmup, int(train_days * DAY_MS), int(test_days * DAY_MS)
+    )
+    if not windows:
+        raise ValueError("series too short for one train and test window")
+
+    boundaries = sorted({i for window in windows for i in window[:2]})
+    snapshots = {}
+    for point, config in configs.values():
+        key = market_key(config)
+        if key not in snapshots:
+            snapshots[key] = market_snapshots(
+                timestamps, prices, config, warmup, boundaries, options.get("ath")
+            )
+    print(
+        f"INFO: walk forward, {len(windows)} windows, {len(configs)} points, "
+        f"{len(snapshots)} indicator passes"
+    )
+
+    # train sweeps of all windows at once
+    train = [[] for _ in windows]
+    shm = share_series(timestamps, prices)
+    try:
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=sweep._attach, initargs=(shm.name, len(prices))
+        ) as pool:
+            futures = []
+            for w, (train_start, test_start, _) in enumerate(windows):
+                for point, config in configs.values():
+                    market = snapshots[market_key(config)][train_start]
+                    futures.append(
+                        pool.submit(
+                            _train_point, w, train_start, test_start, point,
+                            base_config, options, market,
+                        )
+                    )
+            for count, future in enumerate(as_completed(futures), 1):
+                row = future.result()
+                train[row["window"]].append(row)
+                if count % 100 == 0:
+                    print(f"INFO: walk forward, {count}/{len(futures)}")
+    finally:
+        shm.close()
+        shm.unlink()
+
+    # out of sample, each test slice continues from the previous one
+    results = []
+    equity = []
+    state = None
+    for w, (train_start, test_start, test_end) in enumerate(windows):
+        best = rank(sorted(train[w], key=lambda row: sweep.point_key(row["params"])), metric)[0]
+        config = dataclasses.replace(base_config, **best["params"])
+        market = copy.deepcopy(snapshots[market_key(config)][test_start])
+        bt = Backtest(config=config, **options)
+        result = bt.run(timestamps, prices, test_start, test_end, market, state)
+        state = bt.state()
+        equity.extend(bt.equity)
+        results.append(
+            {
+                "train": [timestamps[train_start], timestamps[test_start - 1]],
+                "test": [timestamps[test_start], timestamps[test_end - 1]],
+                "params": best["params"],
+                "train_result": best["result"],
+                "test_result": result,
+            }
+        )
+
+    return {"windows": results, "summary": oos_summary(results, equity), "equity": equity}
+
+
+def oos_summary(windows: list, equity: list) -> dict:
+    """Statistics of the chained out-of-sample runs."""
+    start_equity = windows[0]["test_result"]["start_equity"]
+    end_equity = windows[-1]["test_result"]["end_equity"]
+
+    peak = 0.0
+    max_drawdown = 0.0
+    for _, value in equity:
+        peak = max(peak, value)
+        max_drawdown = max(max_drawdown, (peak - value) / peak if peak > 0.0 else 0.0)
+
+    return {
+        "windows": len(windows),
+        "start_equity": start_equity,
+        "end_equity": end_equity,
+        "return_percent": round((end_equity / start_equity - 1.0) * 100.0, 4),
+        "max_drawdown_percent": round(max_drawdown * 100.0, 4),
+        "trades": sum(w["test_result"]["trades"] for w in windows),
+        "fees": round(sum(w["test_result"]["fees"] for w in windows), 4),
+    }
+
+
+def format_windows(windows: list) -> str:
+    lines = []
+    for w, window in enumerate(windows, 1):
+        test = window["test_result"]
+        lines.append(
+            f"{w:>4}. {sweep.point_key(window['params'])} | "
+            f"train: {window['train_result'].get('return_percent')}%, "
+            f"test: {test['return_percent']}%, trades: {test['trades']}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Walk-forward optimization over backtest.py")
+    parser.add_argument("prices", help="data_s1.dat history or timestamp_ms,price CSV")
+    parser.add_argument(
+        "--grid", action="append", default=[], help="parameter=v1,v2,... (repeatable)"
+    )
+    parser.add_argument("--random", type=int, default=0, help="sample this many grid points")
+    parser.add_argument("--seed", type=int, default=0, help="random sample seed")
+    parser.add_argument("--train-days", type=float, default=14.0, help="train slice length")
+    parser.add_argument("--test-days", type=float, default=7.0, help="test slice length")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes")
+    parser.add_argument("--metric", default="return_percent", help="optimized metric")
+    parser.add_argument("--quote", type=float, default=1000.0, help="starting quote balance")
+    parser.add_argument("--base-balance", type=float, default=0.0, help="starting base balance")
+    parser.add_argument("--ath", type=float, default=None, help="all time high")
+    parser.add_argument("--out", default="walk_forward.json", help="windows and summary JSON")
+    parser.add_argument("--equity", help="write the out-of-sample equity curve to this CSV")
+    args = parser.parse_args(argv)
+
+    if not args.grid:
+        parser.error("at least one --grid is required")
+
+    timestamps, prices = load_prices(args.prices)
+    points = expand(parse_grid(args.grid), args.random, args.seed)
+    options = {"quote_balance": args.quote, "base_balance": args.base_balance, "ath": args.ath}
+    try:
+        report = walk_forward(
+            timestamps, prices, points, args.train_days, args.test_days,
+            args.workers, options=options, metric=args.metric,
+        )
+    except ValueError as ex:
+        print(f"ERROR: {ex}")
+        return 1
+
+    with open(args.out, "w") as f:
+        json.dump({"windows": report["windows"], "summary": report["summary"]}, f, indent=4)
+    if args.equity:
+        write_csv(args.equity, report["equity"], ["ts", "equity"])
+
+    print(format_windows(report["windows"]))
+    print(json.dumps(report["summary"], indent=4))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())